@@ -0,0 +1,20 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    name = 'core'
+
+    def ready(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        from .cache import get_tiered_cache
+        from .metrics import get_metrics_registry, install_execute_wrapper
+
+        # Instrument every database connection: query counts for request
+        # metrics and the slow query log
+        connection_created.connect(install_execute_wrapper, dispatch_uid='core.metrics.install_execute_wrapper')
+        for connection in connections.all(initialized_only=True):
+            install_execute_wrapper(connection)
+
+        get_metrics_registry().register_stats('tiered_cache', lambda: get_tiered_cache().stats())
@@ -12,5 +12,14 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Serve the hot auth/profile endpoints from async views (see ASYNC_API_VIEWS)
+os.environ.setdefault('ASYNC_API_VIEWS', '1')
 
 application = get_asgi_application()
+
+# Start the password hashing workers before serving, so the first login burst
+# doesn't pay for process start-up. Async views use its ahash_password /
+# averify_password coroutines.
+from usermanagement.hashing import get_hashing_pool  # noqa: E402
+
+get_hashing_pool().start()
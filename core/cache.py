@@ -0,0 +1,243 @@
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+_MISSING = object()
+
+TIERED_CACHE_DEFAULTS = {
+    'L2_ALIAS': 'default',
+    'L1_MAX_ENTRIES': 10000,
+    'L1_TTL': 30,
+    'DEFAULT_TTL': 300,
+    'EARLY_REFRESH_BETA': 1.0,
+}
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe in-process LRU cache with optional per-entry TTL
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """
+        Set `key` only if it is missing (or expired); True when it was set
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                return False
+        self.set(key, value, ttl)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, _MISSING) is not _MISSING
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    """
+    One in-progress load that concurrent callers for the same key wait on
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TieredCache:
+    """
+    In-process LRUCache (L1) in front of a Django cache shared between
+    processes (L2).
+
+    - Keys may carry a `version`; bumping the version a caller passes makes
+      every old entry unreachable without deleting it.
+    - `get_or_set` coalesces concurrent misses for a key into one load
+      (single flight) and serves the stale value to others while it runs.
+    - Entries remember how long they took to load and are refreshed early
+      with a probability that rises as expiry nears (XFetch), so hot keys
+      do not all expire at once. `early_refresh_beta` scales it; 0 disables.
+
+    L1 entries live at most `l1_ttl` seconds, which bounds how long a delete
+    made in another process can go unnoticed here.
+    """
+
+    COUNTERS = ('l1_hits', 'l2_hits', 'misses', 'loads', 'coalesced', 'early_refreshes', 'load_errors')
+
+    def __init__(self, l2=None, l1_max_entries=10000, l1_ttl=30, default_ttl=300, early_refresh_beta=1.0):
+        self.l1 = LRUCache(max_entries=l1_max_entries, ttl=l1_ttl)
+        self.l2 = l2
+        self.l1_ttl = l1_ttl
+        self.default_ttl = default_ttl
+        self.early_refresh_beta = early_refresh_beta
+
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'l1_entries': len(self.l1)}
+
+    def _l1_ttl(self, expires_at):
+        remaining = expires_at - time.time()
+        return min(self.l1_ttl, remaining) if self.l1_ttl else remaining
+
+    def _read(self, key, version):
+        """
+        Return the stored (value, expires_at, load seconds) entry or None
+        """
+        entry = self.l1.get((key, version))
+        if entry is not None:
+            self._count('l1_hits')
+            return entry
+
+        if self.l2 is not None:
+            entry = self.l2.get(key, version=version)
+            if entry is not None and entry[1] > time.time():
+                self._count('l2_hits')
+                self.l1.set((key, version), entry, ttl=self._l1_ttl(entry[1]))
+                return entry
+
+        self._count('misses')
+        return None
+
+    def get(self, key, default=None, version=None):
+        entry = self._read(key, version)
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None, version=None, load_seconds=0.0):
+        ttl = ttl or self.default_ttl
+        entry = (value, time.time() + ttl, load_seconds)
+        self.l1.set((key, version), entry, ttl=self._l1_ttl(entry[1]))
+        if self.l2 is not None:
+            self.l2.set(key, entry, timeout=ttl, version=version)
+
+    def delete(self, key, version=None):
+        self.l1.delete((key, version))
+        if self.l2 is not None:
+            self.l2.delete(key, version=version)
+
+    def _refresh_early(self, entry):
+        _, expires_at, load_seconds = entry
+        if not load_seconds or not self.early_refresh_beta:
+            return False
+        # 1 - random() is in (0, 1], so the log is defined
+        jitter = -load_seconds * self.early_refresh_beta * math.log(1.0 - random.random())
+        return time.time() + jitter >= expires_at
+
+    def get_or_set(self, key, loader, ttl=None, version=None):
+        """
+        Return the cached value for `key`, calling `loader()` to fill it on a
+        miss (or early refresh)
+        """
+        entry = self._read(key, version)
+        if entry is not None:
+            if not self._refresh_early(entry):
+                return entry[0]
+            self._count('early_refreshes')
+        return self._load(key, loader, ttl, version, stale=entry)
+
+    def _load(self, key, loader, ttl, version, stale):
+        with self._lock:
+            flight = self._flights.get((key, version))
+            leader = flight is None
+            if leader:
+                flight = self._flights[(key, version)] = _Flight()
+
+        if not leader:
+            if stale is not None:
+                return stale[0]
+            self._count('coalesced')
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        self._count('loads')
+        try:
+            started = time.monotonic()
+            flight.value = loader()
+            self.set(key, flight.value, ttl=ttl, version=version, load_seconds=time.monotonic() - started)
+            return flight.value
+        except Exception as exc:
+            self._count('load_errors')
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[(key, version)]
+            flight.event.set()
+
+
+_tiered_cache = None
+_tiered_cache_lock = threading.Lock()
+
+
+def get_tiered_cache():
+    """
+    Return the project-wide TieredCache configured by settings.TIERED_CACHE
+    """
+    global _tiered_cache
+    if _tiered_cache is None:
+        from django.conf import settings
+        from django.core.cache import caches
+
+        config = {**TIERED_CACHE_DEFAULTS, **getattr(settings, 'TIERED_CACHE', {})}
+        with _tiered_cache_lock:
+            if _tiered_cache is None:
+                _tiered_cache = TieredCache(
+                    l2=caches[config['L2_ALIAS']] if config['L2_ALIAS'] else None,
+                    l1_max_entries=config['L1_MAX_ENTRIES'],
+                    l1_ttl=config['L1_TTL'],
+                    default_ttl=config['DEFAULT_TTL'],
+                    early_refresh_beta=config['EARLY_REFRESH_BETA'],
+                )
+    return _tiered_cache
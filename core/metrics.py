@@ -0,0 +1,249 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from core.slow_queries import record_slow_query, threshold_seconds
+
+
+METRICS_DEFAULTS = {
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'QUERY_BUCKETS': (0, 1, 2, 5, 10, 20, 50, 100),
+    'SCRAPE_TOKEN': None,
+}
+
+
+def get_metrics_setting(name):
+    return getattr(settings, 'METRICS', {}).get(name, METRICS_DEFAULTS[name])
+
+
+def view_name(request):
+    """
+    URL name a request resolved to, used as the `view` label
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.url_name or match.route or match.view_name
+
+
+class RequestStats:
+    """
+    Per-request counters, reachable from database wrappers through
+    `current_request_stats()` (also from sync_to_async threads)
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def view(self):
+        return view_name(self.request)
+
+
+_current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def current_request_stats():
+    return _current_stats.get()
+
+
+def start_request(request):
+    stats = RequestStats(request)
+    return stats, _current_stats.set(stats)
+
+
+def end_request(context_token):
+    _current_stats.reset(context_token)
+
+
+def _instrument_query(execute, sql, params, many, context):
+    # Runs for every query: keep the fast path to two clock reads
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+        if seconds >= threshold_seconds():
+            record_slow_query(sql, params, many, seconds, stats.view if stats is not None else None)
+
+
+def install_execute_wrapper(connection, **kwargs):
+    """
+    connection_created receiver: count queries and log slow ones on every
+    new connection
+    """
+    if _instrument_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_instrument_query)
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size):
+        self.counts = [0] * (size + 1)
+        self.sum = 0
+        self.count = 0
+
+
+class _Shard:
+    """
+    One thread's share of the metrics; only that thread writes to it
+    """
+
+    def __init__(self):
+        self.requests = {}
+        self.latency = {}
+        self.queries = {}
+        self.db_seconds = {}
+
+
+class MetricsRegistry:
+    """
+    Request metrics per URL name, in Prometheus text format.
+
+    Each thread records into its own shard without locking; shards are only
+    summed when the endpoint is scraped.
+    """
+
+    def __init__(self, latency_buckets=None, query_buckets=None):
+        self.latency_buckets = tuple(latency_buckets or get_metrics_setting('LATENCY_BUCKETS'))
+        self.query_buckets = tuple(query_buckets or get_metrics_setting('QUERY_BUCKETS'))
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._stats_sources = {}
+
+    def register_stats(self, prefix, stats):
+        """
+        Report the numbers in the dict `stats()` returns as `<prefix>_<key>`
+        gauges on every scrape (e.g. a pool's queue depth)
+        """
+        self._stats_sources[prefix] = stats
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    @staticmethod
+    def _observe(histograms, key, buckets, value):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram(len(buckets))
+        histogram.counts[bisect_left(buckets, value)] += 1
+        histogram.sum += value
+        histogram.count += 1
+
+    def record(self, view, method, status_code, seconds, queries, db_seconds):
+        shard = self._shard()
+        key = (view, method, str(status_code))
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        self._observe(shard.latency, view, self.latency_buckets, seconds)
+        self._observe(shard.queries, view, self.query_buckets, queries)
+        shard.db_seconds[view] = shard.db_seconds.get(view, 0.0) + db_seconds
+
+    def _merged(self):
+        with self._lock:
+            shards = list(self._shards)
+
+        requests, db_seconds = {}, {}
+        latency, queries = {}, {}
+        for shard in shards:
+            for key, count in list(shard.requests.items()):
+                requests[key] = requests.get(key, 0) + count
+            for key, seconds in list(shard.db_seconds.items()):
+                db_seconds[key] = db_seconds.get(key, 0.0) + seconds
+            for source, target in ((shard.latency, latency), (shard.queries, queries)):
+                for key, histogram in list(source.items()):
+                    merged = target.get(key)
+                    if merged is None:
+                        merged = target[key] = _Histogram(len(histogram.counts) - 1)
+                    merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                    merged.sum += histogram.sum
+                    merged.count += histogram.count
+        return requests, latency, queries, db_seconds
+
+    @staticmethod
+    def _labels(**labels):
+        escaped = (
+            (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in labels.items()
+        )
+        return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+    def _histogram_lines(self, name, histograms, buckets):
+        lines = []
+        for view, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{self._labels(view=view, le=bound)} {cumulative}')
+            lines.append(f'{name}_bucket{self._labels(view=view, le="+Inf")} {histogram.count}')
+            lines.append(f'{name}_sum{self._labels(view=view)} {histogram.sum}')
+            lines.append(f'{name}_count{self._labels(view=view)} {histogram.count}')
+        return lines
+
+    def render(self):
+        requests, latency, queries, db_seconds = self._merged()
+
+        lines = [
+            '# HELP http_requests_total Requests by URL name, method and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (view, method, status_code), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{self._labels(view=view, method=method, status=status_code)} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Request latency by URL name.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        lines += self._histogram_lines('http_request_duration_seconds', latency, self.latency_buckets)
+
+        lines += [
+            '# HELP http_request_db_queries Database queries per request by URL name.',
+            '# TYPE http_request_db_queries histogram',
+        ]
+        lines += self._histogram_lines('http_request_db_queries', queries, self.query_buckets)
+
+        lines += [
+            '# HELP http_request_db_seconds_total Time spent in database queries by URL name.',
+            '# TYPE http_request_db_seconds_total counter',
+        ]
+        for view, seconds in sorted(db_seconds.items()):
+            lines.append(f'http_request_db_seconds_total{self._labels(view=view)} {seconds}')
+
+        for prefix, stats in sorted(self._stats_sources.items()):
+            for key, value in sorted(stats().items()):
+                if isinstance(value, (int, float)):
+                    lines.append(f'# TYPE {prefix}_{key} gauge')
+                    lines.append(f'{prefix}_{key} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics_registry():
+    """
+    Return the process-wide request metrics registry
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
@@ -0,0 +1,92 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings as django_settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from core.metrics import end_request, get_metrics_registry, start_request
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that can also run in async mode.
+
+    The stock middleware is sync-only, which makes Django run the whole
+    request below it through a thread under ASGI, async views included.
+    Here only static file responses are built in a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=django_settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _static_file(self, request):
+        if self.autorefresh:
+            return self.find_file(request.path_info)
+        return self.files.get(request.path_info)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        static_file = self._static_file(request)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, status and database query count/time per URL name into
+    the metrics registry scraped at /metrics. Goes first in MIDDLEWARE so
+    the timings cover the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.registry = get_metrics_registry()
+
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _record(self, request, response, stats, started):
+        self.registry.record(
+            stats.view,
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            stats.queries,
+            stats.db_seconds,
+        )
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        stats, context_token = start_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(context_token)
+        self._record(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        stats, context_token = start_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(context_token)
+        self._record(request, response, stats, started)
+        return response
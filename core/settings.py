@@ -46,13 +46,16 @@ INSTALLED_APPS = [
     'django_filters',
 
     # Custom apps
+    'core',
     'usermanagement',
+    'permissions',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.middleware.AsyncWhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -63,13 +66,88 @@ MIDDLEWARE = [
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Request metrics (core.metrics), scraped at /metrics in Prometheus text format.
+# The endpoint is open to staff sessions, and to `Authorization: Bearer <token>`
+# when SCRAPE_TOKEN is set.
+METRICS = {
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'QUERY_BUCKETS': (0, 1, 2, 5, 10, 20, 50, 100),
+    'SCRAPE_TOKEN': os.environ.get('METRICS_SCRAPE_TOKEN'),
+}
+
+# Queries slower than THRESHOLD_MS are kept in a ring buffer of BUFFER_SIZE
+# (staff can read it at /slow-queries) and logged to LOG_DIR/slow_queries.log.
+SLOW_QUERY_LOG = {
+    'THRESHOLD_MS': int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100)),
+    'BUFFER_SIZE': 200,
+    'STACK_DEPTH': 8,
+    'MAX_SQL_LENGTH': 2000,
+}
+
+# Created on the first slow query, not here
+LOG_DIR = Path(os.environ.get('DJANGO_LOG_DIR', BASE_DIR / 'logs'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_queries': {
+            'class': 'core.slow_queries.LazyRotatingFileHandler',
+            'filename': LOG_DIR / 'slow_queries.log',
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'core.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Route health, login, Google sign-in and profile to the async views in
+# usermanagement.api.async_views. core/asgi.py turns this on for ASGI servers.
+ASYNC_API_VIEWS = os.environ.get('ASYNC_API_VIEWS') == '1'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'usermanagement.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
 }
 
+# Token -> user cache used by CachedTokenAuthentication.
+# SHARED_CACHE names an alias in CACHES that shares entries and per-user
+# version stamps between processes; None keeps both in this process only.
+# Local hits re-read a user's stamp from SHARED_CACHE at most every
+# VERSION_TTL seconds, which bounds how long a logout or deactivation in
+# another process goes unseen (0 re-reads it on every request).
+TOKEN_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 300,
+    'SHARED_CACHE': 'default',
+    'VERSION_TTL': 1,
+}
+
+# Per-user permission codename cache used by HasGroupPermission.
+# Versions live in CACHE_ALIAS so invalidations reach every process sharing it.
+PERMISSION_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 300,
+    'CACHE_ALIAS': 'default',
+}
+
+# Seconds admin changelist counts and date facet counts are cached for
+ADMIN_COUNT_CACHE_TTL = 60
+
+# Seconds the change feed holds back new entries on databases with
+# concurrent writers, so transactions committing out of id order are not
+# skipped (SQLite serializes writers and needs no hold-back)
+CHANGE_FEED_COMMIT_LAG = 5
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -102,6 +180,61 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The default cache holds the shared tier: token and permission version
+# stamps, Google sign-in entries, admin counts and the tiered cache's L2.
+# It must be shared by every process serving requests, so invalidations
+# reach all workers. Without REDIS_URL it is a SQLite file shared by the
+# processes on this host (core.sqlite_cache); set REDIS_URL when running
+# on several hosts.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'TIMEOUT': 300,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.sqlite_cache.SQLiteCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_PATH', str(BASE_DIR / '.cache' / 'cache.sqlite3')),
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'MAX_ENTRIES': 100000,
+            },
+        },
+    }
+
+# core.cache.get_tiered_cache(): in-process LRU (L1) in front of CACHES[L2_ALIAS].
+# L1_TTL bounds how long a delete made by another process goes unseen;
+# EARLY_REFRESH_BETA tunes probabilistic early refresh (0 disables it).
+TIERED_CACHE = {
+    'L2_ALIAS': 'default',
+    'L1_MAX_ENTRIES': 10000,
+    'L1_TTL': 30,
+    'DEFAULT_TTL': 300,
+    'EARLY_REFRESH_BETA': 1.0,
+}
+
+
+AUTHENTICATION_BACKENDS = [
+    'usermanagement.backends.ProfileModelBackend',
+]
+
+# Bounded process pool for password hashing (usermanagement.hashing).
+# WORKERS=None uses one process per CPU, 0 hashes inline on the request thread.
+# Requests beyond MAX_PENDING queued hashes get a 503 with Retry-After.
+PASSWORD_HASHING = {
+    'WORKERS': None,
+    'MAX_PENDING': 64,
+    'TIMEOUT': 10,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -156,4 +289,21 @@ CORS_ALLOWED_ORIGINS = [
 CSRF_TRUSTED_ORIGINS = [
     'http://localhost:8000',
     'http://127.0.0.1:8000',
-]
\ No newline at end of file
+]
+
+# Google token validation (usermanagement.google).
+# USERINFO_URL can point at a local stand-in server for testing.
+GOOGLE_AUTH = {
+    'USERINFO_URL': 'https://www.googleapis.com/oauth2/v2/userinfo',
+    'CONNECT_TIMEOUT': 2.0,
+    'READ_TIMEOUT': 5.0,
+    'POOL_SIZE': 20,
+    'CACHE_TTL': 60,
+    'BREAKER_FAILURE_THRESHOLD': 5,
+    'BREAKER_RESET_TIMEOUT': 30,
+    # ID-token sign-in: tokens are verified locally against Google's cached
+    # signing keys. JWKS_FILE may point at a local key set instead of JWKS_URL.
+    'CLIENT_ID': os.environ.get('GOOGLE_CLIENT_ID'),
+    'JWKS_URL': 'https://www.googleapis.com/oauth2/v3/certs',
+    'JWKS_FILE': None,
+}
@@ -0,0 +1,130 @@
+import collections
+import datetime
+import json
+import logging
+import os
+import traceback
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+SLOW_QUERY_LOG_DEFAULTS = {
+    'THRESHOLD_MS': 100,
+    'BUFFER_SIZE': 200,
+    'STACK_DEPTH': 8,
+    'MAX_SQL_LENGTH': 2000,
+}
+
+logger = logging.getLogger('core.slow_queries')
+
+
+class LazyRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that creates the log directory when the file is
+    first opened rather than when settings are loaded (use with delay=True)
+    """
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+def get_slow_query_setting(name):
+    return getattr(settings, 'SLOW_QUERY_LOG', {}).get(name, SLOW_QUERY_LOG_DEFAULTS[name])
+
+
+# Only project code is worth showing: skip the standard library, installed
+# packages and the instrumentation itself
+_PROJECT_ROOT = os.path.join(str(settings.BASE_DIR), '')
+_SKIPPED_FILES = (
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.py'),
+    os.path.abspath(__file__),
+)
+
+
+def _is_project_frame(filename):
+    return (
+        filename.startswith(_PROJECT_ROOT)
+        and 'site-packages' not in filename
+        and filename not in _SKIPPED_FILES
+    )
+
+
+_buffer = None
+_threshold = None
+
+
+def _slow_query_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = collections.deque(maxlen=get_slow_query_setting('BUFFER_SIZE'))
+    return _buffer
+
+
+def threshold_seconds():
+    # Checked on every query, so cached until the setting changes
+    global _threshold
+    if _threshold is None:
+        _threshold = get_slow_query_setting('THRESHOLD_MS') / 1000
+    return _threshold
+
+
+@receiver(setting_changed)
+def _reset_slow_query_log(setting, **kwargs):
+    global _buffer, _threshold
+    if setting == 'SLOW_QUERY_LOG':
+        _buffer = _threshold = None
+
+
+def _param_shape(value):
+    if isinstance(value, (str, bytes)):
+        return f'{type(value).__name__}({len(value)})'
+    return type(value).__name__
+
+
+def params_shape(params, many):
+    """
+    Types (and lengths) of the query parameters, never their values
+    """
+    if many:
+        rows = list(params) if params is not None else []
+        return {'rows': len(rows), 'row': params_shape(rows[0], False) if rows else None}
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _param_shape(value) for key, value in params.items()}
+    return [_param_shape(value) for value in params]
+
+
+def _caller_stack():
+    frames = [frame for frame in traceback.extract_stack() if _is_project_frame(frame.filename)]
+    return [f'{frame.filename}:{frame.lineno} in {frame.name}' for frame in frames[-get_slow_query_setting('STACK_DEPTH'):]]
+
+
+def record_slow_query(sql, params, many, seconds, view):
+    """
+    Keep a query that took at least the threshold: in the ring buffer for
+    the staff endpoint and as one JSON line in the slow query log
+    """
+    max_length = get_slow_query_setting('MAX_SQL_LENGTH')
+    record = {
+        'at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'duration_ms': round(seconds * 1000, 3),
+        'view': view,
+        'sql': sql if len(sql) <= max_length else sql[:max_length] + '...',
+        'params': params_shape(params, many),
+        'stack': _caller_stack(),
+    }
+    _slow_query_buffer().append(record)
+    logger.warning(json.dumps(record))
+    return record
+
+
+def recent_slow_queries():
+    """
+    Buffered slow queries, newest first
+    """
+    return list(reversed(_slow_query_buffer()))
@@ -0,0 +1,408 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core import slow_queries
+from core.cache import TieredCache
+from core.metrics import MetricsRegistry, get_metrics_registry
+from core.slow_queries import params_shape, recent_slow_queries
+from core.sqlite_cache import SQLiteCache
+from usermanagement.models import User
+
+
+class TieredCacheTests(SimpleTestCase):
+    """
+    Single flight, stale serving, early refresh and versioned keys
+    """
+
+    def setUp(self):
+        self.l2 = LocMemCache(f'tiered-{self.id()}', {})
+        self.cache = TieredCache(l2=self.l2, l1_ttl=30, default_ttl=60)
+
+    def blocking_loader(self, value):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(value)
+            started.set()
+            release.wait(5)
+            return value
+
+        return loader, started, release, calls
+
+    def run_in_thread(self, function):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(function()), daemon=True)
+        thread.start()
+        return thread, results
+
+    def test_single_flight(self):
+        loader, started, release, calls = self.blocking_loader('fresh')
+        leader, leader_result = self.run_in_thread(lambda: self.cache.get_or_set('key', loader))
+        self.assertTrue(started.wait(5))
+
+        followers = [self.run_in_thread(lambda: self.cache.get_or_set('key', loader)) for _ in range(4)]
+        while self.cache.stats()['coalesced'] < 4:
+            time.sleep(0.001)
+        release.set()
+
+        for thread, _ in [(leader, leader_result), *followers]:
+            thread.join(5)
+        self.assertEqual(calls, ['fresh'])
+        self.assertEqual(leader_result + [result for _, results in followers for result in results], ['fresh'] * 5)
+        self.assertEqual(self.cache.stats()['loads'], 1)
+
+    def test_load_errors_reach_followers(self):
+        started, release = threading.Event(), threading.Event()
+
+        def loader():
+            started.set()
+            release.wait(5)
+            raise RuntimeError('backend down')
+
+        errors = []
+
+        def call():
+            try:
+                self.cache.get_or_set('key', loader)
+            except RuntimeError as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=call, daemon=True)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        threads.append(threading.Thread(target=call, daemon=True))
+        threads[1].start()
+        while self.cache.stats()['coalesced'] < 1:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(errors), 2)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_stale_value_served_to_followers_during_refresh(self):
+        self.cache.set('key', 'stale', ttl=10, load_seconds=1.0)
+        loader, started, release, calls = self.blocking_loader('fresh')
+
+        # random() close to 1 makes every read refresh early
+        with mock.patch('core.cache.random.random', return_value=1 - 1e-12):
+            leader, leader_result = self.run_in_thread(lambda: self.cache.get_or_set('key', loader))
+            self.assertTrue(started.wait(5))
+            self.assertEqual(self.cache.get_or_set('key', loader), 'stale')
+        release.set()
+        leader.join(5)
+
+        self.assertEqual(leader_result, ['fresh'])
+        self.assertEqual(calls, ['fresh'])
+        self.assertEqual(self.cache.get('key'), 'fresh')
+
+    def test_early_refresh(self):
+        self.cache.set('key', 'old', ttl=10, load_seconds=1.0)
+
+        # random() of 0 adds no jitter: nothing is refreshed before expiry
+        with mock.patch('core.cache.random.random', return_value=0.0):
+            self.assertEqual(self.cache.get_or_set('key', lambda: 'new'), 'old')
+
+        with mock.patch('core.cache.random.random', return_value=1 - 1e-12):
+            self.assertEqual(self.cache.get_or_set('key', lambda: 'new'), 'new')
+        self.assertEqual(self.cache.stats()['early_refreshes'], 1)
+
+        # Entries that loaded instantly, or a beta of 0, never refresh early
+        for cache, load_seconds in ((self.cache, 0.0), (TieredCache(l2=None, early_refresh_beta=0), 1.0)):
+            cache.set('other', 'old', ttl=10, load_seconds=load_seconds)
+            with mock.patch('core.cache.random.random', return_value=1 - 1e-12):
+                self.assertEqual(cache.get_or_set('other', lambda: 'new'), 'old')
+
+    def test_versioned_keys(self):
+        self.cache.set('key', 'v1', version=1)
+        self.assertIsNone(self.cache.get('key', version=2))
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'v2', version=2), 'v2')
+
+        # Old versions stay readable until they expire, but nothing asks for them
+        self.cache.l1.clear()
+        self.assertEqual(self.cache.get('key', version=1), 'v1')
+        self.assertEqual(self.cache.get('key', version=2), 'v2')
+
+        self.cache.delete('key', version=2)
+        self.assertIsNone(self.cache.get('key', version=2))
+
+    def test_l2_is_shared(self):
+        other_process = TieredCache(l2=self.l2)
+        self.cache.set('key', 'value')
+        self.assertEqual(other_process.get('key'), 'value')
+        self.assertEqual(other_process.stats()['l2_hits'], 1)
+        self.assertEqual(other_process.get('key'), 'value')
+        self.assertEqual(other_process.stats()['l1_hits'], 1)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    """
+    Separate SQLiteCache instances on one file behave as processes sharing it
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'nested', 'cache.sqlite3')
+        self.cache = self.instance()
+
+    def instance(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_entries_are_shared(self):
+        other = self.instance()
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(other.get('key'), {'a': 1})
+        self.assertEqual(other.get_many(['key', 'missing']), {'key': {'a': 1}})
+
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertFalse(self.cache.has_key('key'))
+
+    def test_expiry(self):
+        self.cache.set('gone', 1, timeout=0)
+        self.cache.set('forever', 1, timeout=None)
+        self.assertIsNone(self.cache.get('gone'))
+        self.assertEqual(self.cache.get('forever'), 1)
+
+        self.cache.set('key', 1, timeout=60)
+        with mock.patch('core.sqlite_cache.time.time', return_value=time.time() + 61):
+            self.assertIsNone(self.cache.get('key'))
+            self.assertEqual(self.cache.get('forever'), 1)
+        self.assertTrue(self.cache.touch('key', timeout=None))
+
+    def test_add_has_one_winner(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def add(value):
+            cache = self.instance()
+            barrier.wait(5)
+            results.append(cache.add('key', value))
+
+        threads = [threading.Thread(target=add, args=(value,)) for value in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+        self.assertFalse(self.cache.add('key', 'late'))
+
+        # An expired entry can be added over
+        self.cache.set('key', 'old', timeout=0)
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr_and_many(self):
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.cache.incr('a', 5), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+    def test_cull(self):
+        cache = self.instance(MAX_ENTRIES=10, CULL_FREQUENCY=2, CULL_INTERVAL=5)
+        cache.set('expired', 1, timeout=0)
+        for number in range(19):
+            cache.set(f'key{number}', number, timeout=100 + number)
+
+        keys = {key for key, in cache._connection().execute('SELECT key FROM cache')}
+        # Expired entries go first, then those closest to expiry
+        self.assertLessEqual(len(keys), 10)
+        self.assertNotIn(cache.make_key('expired'), keys)
+        self.assertIn(cache.make_key('key18'), keys)
+        self.assertNotIn(cache.make_key('key0'), keys)
+
+
+class SlowQueryLogTests(TestCase):
+    """
+    Queries over the threshold are buffered and logged without their
+    parameter values; only staff can read them
+    """
+
+    def query(self, username='secret-username'):
+        User.objects.filter(username=username).exists()
+
+    @override_settings(SLOW_QUERY_LOG={'THRESHOLD_MS': 0, 'BUFFER_SIZE': 2})
+    def test_threshold_and_buffer_size(self):
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            for username in ('first', 'second', 'third'):
+                self.query(username)
+        self.assertEqual(len(logs.records), 3)
+
+        queries = recent_slow_queries()
+        self.assertEqual(len(queries), 2)
+        # Newest first: 'third', then 'second'
+        self.assertEqual([query['params'][-1] for query in queries], ['str(5)', 'str(6)'])
+        self.assertIn('usermanagement_user', queries[0]['sql'])
+        self.assertTrue(any('core/tests.py' in frame for frame in queries[0]['stack']))
+
+        # Settings are read when they change, not at import
+        with override_settings(SLOW_QUERY_LOG={'THRESHOLD_MS': 60000}):
+            self.assertEqual(slow_queries.threshold_seconds(), 60)
+            with self.assertNoLogs('core.slow_queries', 'WARNING'):
+                self.query()
+            self.assertEqual(recent_slow_queries(), [])
+        self.assertEqual(slow_queries.threshold_seconds(), 0)
+
+    @override_settings(SLOW_QUERY_LOG={'THRESHOLD_MS': 0})
+    def test_parameter_values_are_not_kept(self):
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.query()
+        self.assertNotIn('secret-username', logs.output[0])
+        self.assertNotIn('secret-username', json.dumps(recent_slow_queries()))
+        self.assertIn('str(15)', recent_slow_queries()[0]['params'])
+
+    def test_params_shape(self):
+        self.assertEqual(params_shape(('abc', b'\x00', 5, None), False), ['str(3)', 'bytes(1)', 'int', 'NoneType'])
+        self.assertEqual(params_shape({'name': 'abc'}, False), {'name': 'str(3)'})
+        self.assertEqual(params_shape([(1, 'a'), (2, 'b')], True), {'rows': 2, 'row': ['int', 'str(1)']})
+        self.assertEqual(params_shape([], True), {'rows': 0, 'row': None})
+        self.assertIsNone(params_shape(None, False))
+
+    def test_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get('/slow-queries').status_code, 403)
+        self.client.force_login(User.objects.create_user(username='member'))
+        self.assertEqual(self.client.get('/slow-queries').status_code, 403)
+
+        self.client.force_login(User.objects.create_user(username='staff', is_staff=True))
+        response = self.client.get('/slow-queries')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['threshold_ms'], slow_queries.get_slow_query_setting('THRESHOLD_MS'))
+        self.assertIsInstance(response.json()['queries'], list)
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    """
+    Prometheus text output: counters, cumulative histogram buckets and
+    gauges, summed over per-thread shards
+    """
+
+    def setUp(self):
+        self.registry = MetricsRegistry(latency_buckets=(0.1, 1.0), query_buckets=(0, 5))
+
+    def lines(self):
+        return self.registry.render().splitlines()
+
+    def test_prometheus_output(self):
+        self.registry.record('users', 'GET', 200, 0.05, 3, 0.01)
+        self.registry.record('users', 'GET', 200, 0.5, 7, 0.02)
+        self.registry.record('login', 'POST', 400, 2.0, 0, 0.0)
+        lines = self.lines()
+
+        self.assertIn('# TYPE http_requests_total counter', lines)
+        self.assertIn('http_requests_total{view="users",method="GET",status="200"} 2', lines)
+        self.assertIn('http_requests_total{view="login",method="POST",status="400"} 1', lines)
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        self.assertEqual([line for line in lines if line.startswith('http_request_duration_seconds_bucket{view="users"')], [
+            'http_request_duration_seconds_bucket{view="users",le="0.1"} 1',
+            'http_request_duration_seconds_bucket{view="users",le="1.0"} 2',
+            'http_request_duration_seconds_bucket{view="users",le="+Inf"} 2',
+        ])
+        self.assertIn('http_request_duration_seconds_sum{view="users"} 0.55', lines)
+        self.assertIn('http_request_duration_seconds_count{view="users"} 2', lines)
+        # Slower than every bucket: only +Inf counts it
+        self.assertIn('http_request_duration_seconds_bucket{view="login",le="1.0"} 0', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="login",le="+Inf"} 1', lines)
+
+        self.assertEqual([line for line in lines if line.startswith('http_request_db_queries_bucket{view="users"')], [
+            'http_request_db_queries_bucket{view="users",le="0"} 0',
+            'http_request_db_queries_bucket{view="users",le="5"} 1',
+            'http_request_db_queries_bucket{view="users",le="+Inf"} 2',
+        ])
+        self.assertIn('http_request_db_seconds_total{view="users"} 0.03', lines)
+
+    def test_bucket_bounds_are_inclusive(self):
+        self.registry.record('users', 'GET', 200, 0.1, 0, 0.0)
+        lines = self.lines()
+        self.assertIn('http_request_duration_seconds_bucket{view="users",le="0.1"} 1', lines)
+        self.assertIn('http_request_db_queries_bucket{view="users",le="0"} 1', lines)
+
+    def test_labels_are_escaped(self):
+        self.registry.record('a"b\\c\nd', 'GET', 200, 0.0, 0, 0.0)
+        self.assertIn('http_requests_total{view="a\\"b\\\\c\\nd",method="GET",status="200"} 1', self.lines())
+
+    def test_shards_are_merged(self):
+        barrier = threading.Barrier(4)
+
+        def work():
+            # Every thread writes before any finishes, so none reuses a shard
+            barrier.wait(5)
+            for _ in range(100):
+                self.registry.record('users', 'GET', 200, 0.05, 1, 0.001)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(self.registry._shards), 4)
+        lines = self.lines()
+        self.assertIn('http_requests_total{view="users",method="GET",status="200"} 400', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="users",le="0.1"} 400', lines)
+        self.assertIn('http_request_db_queries_count{view="users"} 400', lines)
+
+    def test_registered_stats_are_gauges(self):
+        self.registry.register_stats('pool', lambda: {'pending': 3, 'busy_seconds': 1.5, 'name': 'ignored'})
+        lines = self.lines()
+        self.assertIn('# TYPE pool_pending gauge', lines)
+        self.assertIn('pool_pending 3', lines)
+        self.assertIn('pool_busy_seconds 1.5', lines)
+        self.assertFalse(any('pool_name' in line for line in lines))
+
+
+class MetricsEndpointTests(TestCase):
+    """
+    /metrics is for staff and the scrape token; the public health check
+    no longer carries pool or cache numbers
+    """
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create_user(username='member'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        self.client.force_login(User.objects.create_user(username='staff', is_staff=True))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+    def test_scrape_token(self):
+        with override_settings(METRICS={'SCRAPE_TOKEN': 'scrape-secret'}):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret').status_code, 200)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='scrape-secret').status_code, 403)
+
+        # Without a configured token no header gets in
+        with override_settings(METRICS={'SCRAPE_TOKEN': None}):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer None').status_code, 403)
+
+    def test_requests_are_recorded(self):
+        self.client.get('/api/usermanagement/health/')
+        self.client.force_login(User.objects.create_user(username='staff', is_staff=True))
+        body = self.client.get('/metrics').content.decode()
+        self.assertRegex(body, r'http_requests_total\{view="health_check",method="GET",status="200"\} [1-9]')
+        self.assertIn('http_request_db_queries_bucket{view="health_check",le="0"}', body)
+
+    def test_pool_and_cache_stats_moved_from_health_check(self):
+        response = self.client.get('/api/usermanagement/health/')
+        self.assertEqual(set(response.json()), {'status', 'message', 'timestamp', 'version', 'app'})
+
+        self.client.force_login(User.objects.create_user(username='staff', is_staff=True))
+        lines = self.client.get('/metrics').content.decode().splitlines()
+        self.assertIn('# TYPE password_hashing_pending gauge', lines)
+        self.assertIn('# TYPE tiered_cache_l1_hits gauge', lines)
+        self.assertIs(get_metrics_registry(), get_metrics_registry())
@@ -22,6 +22,8 @@ from . import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics, name='metrics'),
+    path('slow-queries', views.slow_queries, name='slow_queries'),
 
     path('api/usermanagement/', include('usermanagement.api.urls')),
 
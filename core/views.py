@@ -1,4 +1,41 @@
+import hmac
+
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render
 
+from core.metrics import get_metrics_registry, get_metrics_setting
+from core.slow_queries import get_slow_query_setting, recent_slow_queries
+
 def landing_page(request):
     return render(request, 'landing_page.html')
+
+
+def metrics(request):
+    """
+    Request metrics in Prometheus text format (staff or scrape token only)
+    """
+    token = get_metrics_setting('SCRAPE_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    allowed = request.user.is_staff or (
+        token and hmac.compare_digest(authorization, f'Bearer {token}')
+    )
+    if not allowed:
+        return HttpResponseForbidden()
+    
+    return HttpResponse(
+        get_metrics_registry().render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+def slow_queries(request):
+    """
+    Most recent slow queries, newest first (staff only)
+    """
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    
+    return JsonResponse({
+        'threshold_ms': get_slow_query_setting('THRESHOLD_MS'),
+        'queries': recent_slow_queries()
+    })
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class PermissionsConfig(AppConfig):
+    name = 'permissions'
+    label = 'iqra_permissions'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
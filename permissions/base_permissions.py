@@ -1,7 +1,143 @@
 
+import uuid
+
 from rest_framework.permissions import BasePermission, SAFE_METHODS
+from django.conf import settings
 from django.contrib.auth.models import Permission
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from core.cache import LRUCache
+
+
+PERMISSION_CACHE_DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 300,
+    'CACHE_ALIAS': 'default',
+}
+
+
+def get_permission_cache_setting(name):
+    return getattr(settings, 'PERMISSION_CACHE', {}).get(name, PERMISSION_CACHE_DEFAULTS[name])
+
+
+_user_permission_cache = None
+
+
+def _permission_cache():
+    global _user_permission_cache
+    if _user_permission_cache is None:
+        _user_permission_cache = LRUCache(
+            max_entries=get_permission_cache_setting('MAX_ENTRIES'),
+            ttl=get_permission_cache_setting('TTL'),
+        )
+    return _user_permission_cache
+
+
+@receiver(setting_changed)
+def _reset_permission_cache(setting, **kwargs):
+    global _user_permission_cache
+    if setting == 'PERMISSION_CACHE':
+        _user_permission_cache = None
+
+
+GLOBAL_PERMISSION_VERSION_KEY = 'permissions:version'
+
+
+def _user_permission_version_key(user_id):
+    return f'permissions:version:user:{user_id}'
+
+
+def _version_cache():
+    return caches[get_permission_cache_setting('CACHE_ALIAS')]
+
+
+def get_permission_version(user_id):
+    """
+    Current (global, per-user) permission version stamp for a user.
+    Missing versions are initialised so every process agrees on them.
+    """
+    cache = _version_cache()
+    user_key = _user_permission_version_key(user_id)
+    versions = cache.get_many([GLOBAL_PERMISSION_VERSION_KEY, user_key])
+
+    for key in (GLOBAL_PERMISSION_VERSION_KEY, user_key):
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+
+    return (versions[GLOBAL_PERMISSION_VERSION_KEY], versions[user_key])
+
+
+def bump_permission_version(user_ids=None):
+    """
+    Invalidate cached permission sets for the given users, or for everyone
+    when `user_ids` is None
+    """
+    cache = _version_cache()
+    if user_ids is None:
+        cache.set(GLOBAL_PERMISSION_VERSION_KEY, uuid.uuid4().hex, None)
+        return
+
+    cache.set_many(
+        {_user_permission_version_key(user_id): uuid.uuid4().hex for user_id in user_ids},
+        None,
+    )
+    for user_id in user_ids:
+        _permission_cache().delete(user_id)
+
+
+# Resolved model per view class, and full codename per
+# (permission class, view class, action, method).
+_view_model_registry = {}
+_permission_codename_registry = {}
+
+
+def resolve_view_model(view):
+    """
+    Model class protected by a view (class or instance), resolved once per
+    view class. Raises ImproperlyConfigured when no model can be found.
+
+    Resolution order: an explicit `model` attribute, `queryset`,
+    `get_queryset()`, then `serializer_class.Meta.model`.
+    """
+    view_cls = view if isinstance(view, type) else type(view)
+    try:
+        return _view_model_registry[view_cls]
+    except KeyError:
+        pass
+
+    model_cls = getattr(view, 'model', None)
+    error = None
+
+    if model_cls is None:
+        queryset = getattr(view, 'queryset', None)
+        if queryset is not None and hasattr(queryset, 'model'):
+            model_cls = queryset.model
+
+    if model_cls is None and callable(getattr(view, 'get_queryset', None)):
+        try:
+            instance = view_cls() if view is view_cls else view
+            qs = instance.get_queryset()
+            model_cls = getattr(qs, 'model', None)
+        except Exception as exc:
+            error = exc
+
+    if model_cls is None:
+        serializer_class = getattr(view, 'serializer_class', None)
+        meta = getattr(serializer_class, 'Meta', None)
+        model_cls = getattr(meta, 'model', None)
+
+    if model_cls is None:
+        raise ImproperlyConfigured(
+            f"Cannot resolve the model for {view_cls.__module__}.{view_cls.__qualname__}; "
+            f"set `model` on the view."
+        ) from error
+
+    _view_model_registry[view_cls] = model_cls
+    return model_cls
 
 
 class HasGroupPermission(BasePermission):
@@ -31,49 +167,40 @@ class HasGroupPermission(BasePermission):
         if request.user.is_superuser:
             return True
 
-        
-        model_cls = self._get_model_class(view)
-        if not model_cls:
-            return False
-
-        codename = self._get_required_codename(view, request)
-
-        if not codename:
+        permission_codename = self._get_permission_codename(view, request)
+        if not permission_codename:
             return False
 
-        permission_codename = f"{codename}_{model_cls._meta.model_name}"
-
         user_permissions = self._get_user_permissions(request.user)
         return permission_codename in user_permissions
 
-    def _get_model_class(self, view):
-        
-        queryset = getattr(view, 'queryset', None)
-        if queryset is not None:
-            if hasattr(queryset, 'model'):
-                return queryset.model
-
-        if hasattr(view, 'get_queryset') and callable(view.get_queryset):
-            try:
-                qs = view.get_queryset()  
-                if hasattr(qs, 'model'):
-                    return qs.model
-            except Exception:
-                pass  
+    def _get_permission_codename(self, view, request):
+        """
+        Full codename (e.g. "view_user") required for this view and request,
+        memoized per (permission class, view class, action, method)
+        """
+        key = (type(self), type(view), getattr(view, 'action', None), request.method)
+        try:
+            return _permission_codename_registry[key]
+        except KeyError:
+            pass
 
-        serializer_class = getattr(view, 'serializer_class', None)
-        if serializer_class and hasattr(serializer_class, 'Meta'):
-            meta = getattr(serializer_class, 'Meta', None)
-            if meta and hasattr(meta, 'model'):
-                return meta.model
+        model_cls = self._get_model_class(view)
+        codename = self._get_required_codename(view, request)
+        if model_cls and codename:
+            permission_codename = f"{codename}_{model_cls._meta.model_name}"
+        else:
+            permission_codename = None
 
-        # Could also store an attribute on the view, e.g. `model = SomeModel`
-        # if you want a fallback.
-        # model_cls = getattr(view, 'model', None)
-        # if model_cls:
-        #     return model_cls
+        _permission_codename_registry[key] = permission_codename
+        return permission_codename
 
-        return None
+    def _get_model_class(self, view):
+        try:
+            return resolve_view_model(view)
+        except ImproperlyConfigured:
+            # Reported at startup by the permissions system check
+            return None
 
     def _get_required_codename(self, view, request):
 
@@ -86,6 +213,73 @@ class HasGroupPermission(BasePermission):
         return self.method_to_codename.get(request.method)
 
     def _get_user_permissions(self, user):
-        user_groups = user.groups.all()
-        group_permissions = Permission.objects.filter(group__in=user_groups)
-        return set(group_permissions.values_list('codename', flat=True))
+        version = get_permission_version(user.pk)
+        cached = _permission_cache().get(user.pk)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        permissions = frozenset(
+            Permission.objects.filter(group__user=user).values_list('codename', flat=True)
+        )
+        _permission_cache().set(user.pk, (version, permissions))
+        return permissions
+
+
+def get_owner_id(obj, owner_field):
+    """
+    Primary key of the user that owns `obj`, following a Django-style
+    lookup path such as "user" or "course__teacher"; "pk" means the object
+    is itself the user
+    """
+    *path, last = owner_field.split('__')
+    for attr in path:
+        obj = getattr(obj, attr, None)
+        if obj is None:
+            return None
+
+    if last in ('pk', 'id'):
+        return obj.pk
+    if hasattr(obj, f'{last}_id'):
+        return getattr(obj, f'{last}_id')
+    owner = getattr(obj, last, None)
+    return getattr(owner, 'pk', None)
+
+
+class HasGroupObjectPermission(HasGroupPermission):
+    """
+    HasGroupPermission with object-level checks matching
+    GroupPermissionFilterBackend: an object is accessible if the user holds
+    the model-wide codename, or owns it (via the view's `owner_field`) and
+    the action is one of `owner_codenames`.
+
+    `has_permission` lets owners through so detail and list requests reach
+    the object check and the queryset filter.
+    """
+
+    owner_codenames = ('view',)
+
+    def has_permission(self, request, view):
+        if super().has_permission(request, view):
+            return True
+
+        codename = self._get_required_codename(view, request)
+        return (
+            getattr(view, 'owner_field', None) is not None
+            and request.user.is_authenticated
+            and codename in self.owner_codenames
+        )
+
+    def has_object_permission(self, request, view, obj):
+        if request.user.is_superuser:
+            return True
+
+        permission_codename = self._get_permission_codename(view, request)
+        if permission_codename and permission_codename in self._get_user_permissions(request.user):
+            return True
+
+        owner_field = getattr(view, 'owner_field', None)
+        if owner_field is None or not request.user.is_authenticated:
+            return False
+
+        codename = self._get_required_codename(view, request)
+        return codename in self.owner_codenames and get_owner_id(obj, owner_field) == request.user.pk
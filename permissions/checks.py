@@ -0,0 +1,48 @@
+from django.core.checks import Error, register
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from permissions.base_permissions import HasGroupPermission, resolve_view_model
+
+
+def _iter_view_classes(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _iter_view_classes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            view_cls = getattr(pattern.callback, 'cls', None)
+            if view_cls is not None:
+                yield view_cls
+
+
+def _uses_group_permission(view_cls):
+    return any(
+        isinstance(permission_class, type) and issubclass(permission_class, HasGroupPermission)
+        for permission_class in getattr(view_cls, 'permission_classes', ())
+    )
+
+
+@register('permissions')
+def check_group_permission_views(app_configs, **kwargs):
+    """
+    Every routed view guarded by HasGroupPermission must resolve to a model
+    """
+    errors = []
+    seen = set()
+
+    for view_cls in _iter_view_classes(get_resolver().url_patterns):
+        if view_cls in seen or not _uses_group_permission(view_cls):
+            continue
+        seen.add(view_cls)
+
+        try:
+            resolve_view_model(view_cls)
+        except ImproperlyConfigured as exc:
+            errors.append(Error(
+                str(exc),
+                hint='Add `model = <Model>` or a `queryset` to the view.',
+                obj=view_cls,
+                id='permissions.E001',
+            ))
+
+    return errors
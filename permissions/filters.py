@@ -0,0 +1,33 @@
+from rest_framework.filters import BaseFilterBackend
+
+from permissions.base_permissions import HasGroupObjectPermission
+
+
+class GroupPermissionFilterBackend(BaseFilterBackend):
+    """
+    Restrict list querysets with a single SQL filter instead of per-object
+    checks.
+
+    Users holding `view_<model>` through their groups (and superusers) see
+    every row; everyone else sees only rows they own through the view's
+    `owner_field`, or nothing if the view has none. The permission set comes
+    from the HasGroupPermission cache, so no extra query is issued.
+    """
+
+    permission_class = HasGroupObjectPermission
+
+    def filter_queryset(self, request, queryset, view):
+        user = request.user
+        if user.is_superuser:
+            return queryset
+
+        permission = self.permission_class()
+        codename = f"view_{queryset.model._meta.model_name}"
+        if user.is_authenticated and codename in permission._get_user_permissions(user):
+            return queryset
+
+        owner_field = getattr(view, 'owner_field', None)
+        if owner_field is None or not user.is_authenticated:
+            return queryset.none()
+
+        return queryset.filter(**{owner_field: user.pk})
@@ -0,0 +1,21 @@
+from permissions.base_permissions import HasGroupObjectPermission
+from permissions.filters import GroupPermissionFilterBackend
+
+
+class GroupPermissionMixin:
+    """
+    View mixin wiring group permissions into both list filtering and
+    object checks. Set `owner_field` (e.g. "user", or "pk" for the user
+    model itself) to let users reach the rows they own.
+    """
+
+    owner_field = None
+    permission_classes = [HasGroupObjectPermission]
+
+    def get_filter_backends(self):
+        return [GroupPermissionFilterBackend, *getattr(self, 'filter_backends', [])]
+
+    def filter_queryset(self, queryset):
+        for backend in self.get_filter_backends():
+            queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from permissions.base_permissions import bump_permission_version
+
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Membership changed: bump the affected users, or everyone when the
+    affected set is unknown (a group's `user_set.clear()`)
+    """
+    if not action.startswith('post_'):
+        return
+
+    if not reverse:
+        bump_permission_version([instance.pk])
+    elif pk_set:
+        bump_permission_version(pk_set)
+    else:
+        bump_permission_version()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_permission_version()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def permission_model_changed(sender, **kwargs):
+    bump_permission_version()
@@ -0,0 +1,210 @@
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import path
+from rest_framework import generics, serializers
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from permissions import base_permissions
+from permissions.base_permissions import (
+    HasGroupObjectPermission,
+    HasGroupPermission,
+    bump_permission_version,
+    get_permission_version,
+)
+from permissions.checks import check_group_permission_views
+from permissions.filters import GroupPermissionFilterBackend
+from permissions.mixins import GroupPermissionMixin
+from usermanagement.models import User, StudentProfile
+
+
+class UserListView(generics.ListAPIView):
+    queryset = User.objects.all()
+    permission_classes = [HasGroupPermission]
+
+
+class StudentProfileView(GroupPermissionMixin, generics.RetrieveAPIView):
+    queryset = StudentProfile.objects.all()
+    owner_field = 'user'
+
+
+class ProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StudentProfile
+        fields = ['student_id']
+
+
+class SerializerOnlyView(generics.ListAPIView):
+    serializer_class = ProfileSerializer
+    permission_classes = [HasGroupPermission]
+
+    def get_queryset(self):
+        raise RuntimeError('needs a request')
+
+
+class ModelLessView(APIView):
+    permission_classes = [HasGroupPermission]
+
+
+# URLconf for the system check tests
+urlpatterns = [
+    path('users/', UserListView.as_view()),
+    path('serializer-only/', SerializerOnlyView.as_view()),
+    path('model-less/', ModelLessView.as_view()),
+]
+
+
+class GroupPermissionTests(TestCase):
+    """
+    Group permissions are cached per user and dropped when memberships,
+    groups or permissions change
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        base_permissions._permission_cache().clear()
+        self.user = User.objects.create_user(username='member')
+        self.group = Group.objects.create(name='staff')
+        self.view_user = Permission.objects.get(codename='view_user')
+        self.request = APIRequestFactory().get('/users/')
+        self.request.user = self.user
+
+    def allowed(self, request=None):
+        return HasGroupPermission().has_permission(request or self.request, UserListView())
+
+    def test_codename_from_group(self):
+        self.assertFalse(self.allowed())
+        self.group.permissions.add(self.view_user)
+        self.user.groups.add(self.group)
+        self.assertTrue(self.allowed())
+
+        request = APIRequestFactory().delete('/users/')
+        request.user = self.user
+        self.assertFalse(self.allowed(request))
+
+    def test_superuser(self):
+        self.request.user = User.objects.create_superuser(username='root', email='root@example.com')
+        with self.assertNumQueries(0):
+            self.assertTrue(self.allowed())
+
+    def test_cached_until_version_changes(self):
+        self.group.permissions.add(self.view_user)
+        self.user.groups.add(self.group)
+        self.allowed()
+        with self.assertNumQueries(0):
+            self.assertTrue(self.allowed())
+
+        version = get_permission_version(self.user.pk)
+        bump_permission_version([self.user.pk])
+        self.assertNotEqual(get_permission_version(self.user.pk), version)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.allowed())
+
+    def test_membership_changes_bump(self):
+        self.group.permissions.add(self.view_user)
+        self.user.groups.add(self.group)
+        self.assertTrue(self.allowed())
+
+        self.group.user_set.remove(self.user)
+        self.assertFalse(self.allowed())
+
+        self.group.user_set.add(self.user)
+        self.assertTrue(self.allowed())
+
+        self.group.user_set.clear()
+        self.assertFalse(self.allowed())
+
+    def test_group_and_permission_changes_bump(self):
+        self.user.groups.add(self.group)
+        self.assertFalse(self.allowed())
+
+        self.group.permissions.add(self.view_user)
+        self.assertTrue(self.allowed())
+
+        self.group.permissions.remove(self.view_user)
+        self.assertFalse(self.allowed())
+
+        self.group.permissions.add(self.view_user)
+        self.assertTrue(self.allowed())
+        version = get_permission_version(self.user.pk)
+        self.group.delete()
+        self.assertNotEqual(get_permission_version(self.user.pk), version)
+        self.assertFalse(self.allowed())
+
+        version = get_permission_version(self.user.pk)
+        self.view_user.save()
+        self.assertNotEqual(get_permission_version(self.user.pk), version)
+
+    def test_settings_are_read_lazily(self):
+        with override_settings(PERMISSION_CACHE={'MAX_ENTRIES': 1, 'TTL': 300}):
+            self.allowed()
+            other = APIRequestFactory().get('/users/')
+            other.user = User.objects.create_user(username='other')
+            self.allowed(other)
+            self.assertEqual(len(base_permissions._permission_cache()), 1)
+        self.assertEqual(base_permissions._permission_cache().max_entries, 10000)
+
+    def test_model_resolution(self):
+        self.assertIs(base_permissions.resolve_view_model(UserListView), User)
+        self.assertIs(base_permissions.resolve_view_model(SerializerOnlyView), StudentProfile)
+
+
+class GroupObjectPermissionTests(TestCase):
+    """
+    Owners reach their own rows; `view_<model>` holders reach every row
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        base_permissions._permission_cache().clear()
+        self.owner = User.objects.create_user(username='owner')
+        self.other = User.objects.create_user(username='other')
+        self.profile = StudentProfile.objects.create(user=self.owner, student_id='STU500')
+        StudentProfile.objects.create(user=self.other, student_id='STU501')
+
+    def request(self, user, method='get'):
+        request = getattr(APIRequestFactory(), method)('/profiles/1/')
+        request.user = user
+        return request
+
+    def visible(self, user):
+        view = StudentProfileView()
+        queryset = GroupPermissionFilterBackend().filter_queryset(self.request(user), StudentProfile.objects.all(), view)
+        return sorted(queryset.values_list('student_id', flat=True))
+
+    def test_owner_can_view_own_object(self):
+        permission, view = HasGroupObjectPermission(), StudentProfileView()
+        self.assertTrue(permission.has_permission(self.request(self.owner), view))
+        self.assertTrue(permission.has_object_permission(self.request(self.owner), view, self.profile))
+        self.assertFalse(permission.has_object_permission(self.request(self.other), view, self.profile))
+        # Ownership grants viewing only
+        self.assertFalse(permission.has_object_permission(self.request(self.owner, 'delete'), view, self.profile))
+
+    def test_filter_backend(self):
+        self.assertEqual(self.visible(self.owner), ['STU500'])
+
+        group = Group.objects.create(name='registrars')
+        group.permissions.add(Permission.objects.get(codename='view_studentprofile'))
+        self.other.groups.add(group)
+        self.assertEqual(self.visible(self.other), ['STU500', 'STU501'])
+
+        view = StudentProfileView()
+        self.assertTrue(HasGroupObjectPermission().has_object_permission(self.request(self.other), view, self.profile))
+
+    def test_mixin_applies_filter_backend(self):
+        view = StudentProfileView()
+        view.request = self.request(self.owner)
+        self.assertEqual([profile.pk for profile in view.filter_queryset(view.get_queryset())], [self.profile.pk])
+
+
+@override_settings(ROOT_URLCONF='permissions.tests')
+class GroupPermissionCheckTests(TestCase):
+    """
+    permissions.E001 reports routed views whose model cannot be resolved
+    """
+
+    def test_unresolvable_view_is_reported(self):
+        errors = check_group_permission_views(None)
+        self.assertEqual([error.id for error in errors], ['permissions.E001'])
+        self.assertIs(errors[0].obj, ModelLessView)
@@ -1,15 +1,127 @@
-from django.contrib import admin
+import hashlib
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.forms import AdminAuthenticationForm
 from django.contrib.auth.admin import UserAdmin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import connections
+from django.utils.functional import cached_property
+from .hashing import HashingOverloaded
 from .models import User, StudentProfile, TeacherProfile
+from .search import search_user_ids
+
+
+def _count_cache_ttl():
+    return getattr(settings, 'ADMIN_COUNT_CACHE_TTL', 60)
+
+
+def _query_cache_key(prefix, queryset):
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return None
+    return f"{prefix}:{hashlib.md5(sql.encode()).hexdigest()}"
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator whose total is cached for ADMIN_COUNT_CACHE_TTL seconds.
+    Unfiltered PostgreSQL tables use the planner's row estimate instead of COUNT(*).
+    """
+    estimate_threshold = 100000
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        key = _query_cache_key('admin:count', queryset)
+        if key is None:
+            return 0
+        
+        count = cache.get(key)
+        if count is None:
+            count = self._estimate(queryset)
+            if count is None:
+                count = super().count
+            cache.set(key, count, _count_cache_ttl())
+        return count
+    
+    def _estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < self.estimate_threshold:
+            return None
+        return row[0]
+
+
+class CachedFacetsDateFieldListFilter(admin.DateFieldListFilter):
+    """
+    Date filter whose facet counts are cached for ADMIN_COUNT_CACHE_TTL seconds
+    """
+    def get_facet_queryset(self, changelist):
+        filtered_qs = changelist.get_queryset(
+            self.request, exclude_parameters=self.expected_parameters()
+        )
+        key = _query_cache_key(f'admin:facets:{self.field_path}', filtered_qs)
+        if key is None:
+            return super().get_facet_queryset(changelist)
+        
+        counts = cache.get(key)
+        if counts is None:
+            counts = filtered_qs.aggregate(**self.get_facet_counts(changelist.pk_attname, filtered_qs))
+            cache.set(key, counts, _count_cache_ttl())
+        return counts
+
+
+class LargeTableAdminMixin:
+    """
+    Changelist settings for tables with millions of rows: cached counts and
+    no second COUNT(*) over the unfiltered table
+    """
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+
+class FullTextSearchMixin:
+    """
+    Admin search through the user search index instead of icontains scans.
+    Terms match word prefixes rather than arbitrary substrings, and only the
+    best `search_limit` matches are listed (with a warning when cut).
+    """
+    search_user_field = 'pk'
+    search_limit = 1000
+    search_help_text = f'Matches words starting with each term; shows the best {search_limit} matches.'
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        user_ids = search_user_ids(search_term, limit=self.search_limit + 1)
+        if len(user_ids) > self.search_limit:
+            user_ids = user_ids[:self.search_limit]
+            self.message_user(
+                request,
+                f'Only the best {self.search_limit} matches are shown; refine the search to narrow them down.',
+                messages.WARNING,
+            )
+        return queryset.filter(**{f'{self.search_user_field}__in': user_ids}), False
 
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(LargeTableAdminMixin, FullTextSearchMixin, UserAdmin):
     """
     Custom user admin interface
     """
     list_display = ['username', 'email', 'user_type', 'is_verified', 'is_active', 'date_joined']
-    list_filter = ['user_type', 'is_verified', 'is_active', 'date_joined']
+    list_filter = ['user_type', 'is_verified', 'is_active', ('date_joined', CachedFacetsDateFieldListFilter)]
     search_fields = ['username', 'email', 'first_name', 'last_name']
     
     fieldsets = UserAdmin.fieldsets + (
@@ -20,20 +132,44 @@ class CustomUserAdmin(UserAdmin):
 
 
 @admin.register(StudentProfile)
-class StudentProfileAdmin(admin.ModelAdmin):
+class StudentProfileAdmin(LargeTableAdminMixin, FullTextSearchMixin, admin.ModelAdmin):
     """
     Student profile admin interface
     """
+    search_user_field = 'user'
     list_display = ['user', 'student_id', 'grade', 'major', 'enrollment_date']
-    list_filter = ['grade', 'major', 'enrollment_date']
+    list_select_related = ['user']
+    list_filter = ['grade', 'major', ('enrollment_date', CachedFacetsDateFieldListFilter)]
     search_fields = ['user__username', 'student_id', 'grade', 'major']
 
 
 @admin.register(TeacherProfile)
-class TeacherProfileAdmin(admin.ModelAdmin):
+class TeacherProfileAdmin(LargeTableAdminMixin, FullTextSearchMixin, admin.ModelAdmin):
     """
     Teacher profile admin interface
     """
+    search_user_field = 'user'
     list_display = ['user', 'employee_id', 'department', 'specialization', 'hire_date']
-    list_filter = ['department', 'hire_date']
-    search_fields = ['user__username', 'employee_id', 'department', 'specialization']
\ No newline at end of file
+    list_select_related = ['user']
+    list_filter = ['department', ('hire_date', CachedFacetsDateFieldListFilter)]
+    search_fields = ['user__username', 'employee_id', 'department', 'specialization']
+
+
+class AdminLoginForm(AdminAuthenticationForm):
+    """
+    Admin login that shows an overloaded password hashing pool as a form
+    error instead of a server error
+    """
+    error_messages = {
+        **AdminAuthenticationForm.error_messages,
+        'hashing_overloaded': HashingOverloaded.default_detail,
+    }
+
+    def clean(self):
+        try:
+            return super().clean()
+        except HashingOverloaded:
+            raise ValidationError(self.error_messages['hashing_overloaded'], code='hashing_overloaded')
+
+
+admin.site.login_form = AdminLoginForm
@@ -0,0 +1,214 @@
+import datetime
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from usermanagement.authentication import CachedTokenAuthentication
+from usermanagement.google import asign_in_google_user
+from usermanagement.profile_documents import get_document, render_with_document
+from . import views
+from .compiled import compile_serializer
+from .conditional import check_profile_preconditions, set_profile_validators
+from .serializers import GoogleAuthSerializer, UnknownFields, UserLoginSerializer, UserProfileSerializer
+
+
+_renderer = JSONRenderer()
+
+
+def _response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(_renderer.render(data), content_type='application/json', status=status_code)
+
+
+async def _document_response(data, user, status_code=status.HTTP_200_OK):
+    """
+    Like views._profile_document_response: `data` with its 'user' entry
+    filled from the user's pre-rendered profile document
+    """
+    document = await sync_to_async(get_document)(user)
+    return HttpResponse(render_with_document(data, document), content_type='application/json', status=status_code)
+
+
+def _allow(*methods):
+    """
+    Like @api_view(methods): CSRF-exempt, with DRF's 405 body for other methods
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = _response(
+                    {'detail': f'Method "{request.method}" not allowed.'},
+                    status.HTTP_405_METHOD_NOT_ALLOWED
+                )
+                response['Allow'] = ', '.join(methods)
+                return response
+            return await view(request, *args, **kwargs)
+        return csrf_exempt(wrapper)
+    return decorator
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as exc:
+            raise exceptions.ParseError(f'JSON parse error - {exc}')
+    return request.POST
+
+
+def _unauthorized(detail, authenticator):
+    response = _response({'detail': detail}, status.HTTP_401_UNAUTHORIZED)
+    response['WWW-Authenticate'] = authenticator.authenticate_header(None)
+    return response
+
+
+async def _authenticated_user(request):
+    """
+    Token authentication, then the session, as DRF would; returns
+    (user, None) or (None, 401 response)
+    """
+    authenticator = CachedTokenAuthentication()
+    try:
+        result = await authenticator.aauthenticate(request)
+    except exceptions.AuthenticationFailed as exc:
+        return None, _unauthorized(exc.detail, authenticator)
+
+    if result is not None:
+        return result[0], None
+
+    user = await request.auser()
+    if user.is_authenticated:
+        return user, None
+    return None, _unauthorized(exceptions.NotAuthenticated.default_detail, authenticator)
+
+
+@_allow('GET')
+async def health_check(request):
+    """
+    Simple health check endpoint - Test if project is running properly
+    """
+    return _response({
+        'status': 'success',
+        'message': '🎓 Student E-Learning Platform Backend System is running normally!',
+        'timestamp': datetime.datetime.now().isoformat(),
+        'version': '1.0.0',
+        'app': 'usermanagement'
+    })
+
+
+@_allow('POST')
+async def google_auth(request):
+    """
+    Google OAuth authentication endpoint
+    Expects: {"access_token": "google_access_token"} or {"id_token": "google_id_token"}
+    Returns: User data and authentication token
+    """
+    try:
+        data = _request_data(request)
+    except exceptions.ParseError as exc:
+        return _response({'detail': exc.detail}, status.HTTP_400_BAD_REQUEST)
+
+    serializer = GoogleAuthSerializer(data=data)
+
+    if await serializer.ais_valid():
+        try:
+            user, token, created = await asign_in_google_user(serializer.validated_data['google_user'])
+
+            if not user.is_active:
+                return _response({
+                    'success': False,
+                    'message': 'User account is disabled'
+                }, status.HTTP_403_FORBIDDEN)
+
+            return _response({
+                'success': True,
+                'message': 'Google authentication successful' if not created else 'User registered successfully via Google',
+                'user': compile_serializer(UserProfileSerializer).to_representation(user),
+                'token': token.key,
+                'is_new_user': created
+            })
+
+        except Exception as e:
+            return _response({
+                'success': False,
+                'message': 'Authentication failed',
+                'error': str(e)
+            }, status.HTTP_400_BAD_REQUEST)
+
+    return _response({
+        'success': False,
+        'message': 'Invalid data provided',
+        'errors': serializer.errors
+    }, status.HTTP_400_BAD_REQUEST)
+
+
+@_allow('POST')
+async def login_user(request):
+    """
+    User login endpoint
+    """
+    try:
+        data = _request_data(request)
+    except exceptions.ParseError as exc:
+        return _response({'detail': exc.detail}, status.HTTP_400_BAD_REQUEST)
+
+    serializer = UserLoginSerializer(data=data)
+
+    if await serializer.ais_valid():
+        user = serializer.validated_data['user']
+        token, created = await Token.objects.aget_or_create(user=user)
+
+        return await _document_response({
+            'success': True,
+            'message': 'Login successful',
+            'user': None,
+            'token': token.key
+        }, user)
+
+    return _response({
+        'success': False,
+        'message': 'Login failed',
+        'errors': serializer.errors
+    }, status.HTTP_400_BAD_REQUEST)
+
+
+@_allow('GET', 'PUT')
+async def user_profile(request):
+    """
+    Get or update user profile
+    GET is served on the event loop; PUT runs the sync view in a thread
+    """
+    if request.method == 'PUT':
+        return await sync_to_async(views.user_profile)(request)
+
+    user, error = await _authenticated_user(request)
+    if error is not None:
+        return error
+
+    try:
+        fields = UserProfileSerializer.fields_from_request(request)
+    except UnknownFields as exc:
+        return _response({
+            'success': False,
+            'message': 'Unknown fields requested',
+            'errors': {'fields': exc.names}
+        }, status.HTTP_400_BAD_REQUEST)
+
+    precondition_failed = check_profile_preconditions(request, user, fields)
+    if precondition_failed is not None:
+        return precondition_failed
+
+    if fields is None:
+        response = await _document_response({'success': True, 'user': None}, user)
+    else:
+        response = _response({
+            'success': True,
+            'user': compile_serializer(UserProfileSerializer, fields=fields).to_representation(user)
+        })
+    return set_profile_validators(response, user, fields)
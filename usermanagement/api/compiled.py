@@ -0,0 +1,118 @@
+from rest_framework import fields as drf_fields
+
+from core.cache import LRUCache
+
+
+class CompiledSerializer:
+    """
+    Read-only, context-free stand-in for `SerializerClass(obj).data`.
+
+    The serializer is instantiated once and its fields are turned into two
+    generated functions: one reading model instances, one reading `.values()`
+    rows (see `value_names`). Plain integer, string and choice fields are
+    converted inline, other fields reuse the bound field's
+    `to_representation`, so the rendered JSON is identical to the serializer's.
+
+    SerializerMethodFields are supported when the serializer describes them in
+    `compiled_nested` as {field name: (relation, (relation fields, ...))},
+    i.e. a method returning a flat dict of a one-to-one relation or None.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        kwargs = {'fields': fields} if fields is not None else {}
+        serializer = serializer_class(**kwargs)
+        nested = getattr(serializer_class, 'compiled_nested', {})
+
+        self.serializer_class = serializer_class
+        self.value_names = []
+        namespace = {}
+        instance_items = []
+        row_items = []
+
+        for index, field in enumerate(serializer._readable_fields):
+            name = field.field_name
+            if isinstance(field, drf_fields.SerializerMethodField):
+                if name not in nested:
+                    raise ValueError(f"{serializer_class.__name__}.{name} is not described in compiled_nested")
+                relation, relation_fields = nested[name]
+                instance_items.append(self._nested_instance(name, relation, relation_fields))
+                row_items.append(self._nested_row(name, relation, relation_fields))
+                self.value_names.append(f'{relation}__pk')
+                self.value_names.extend(f'{relation}__{attr}' for attr in relation_fields)
+                continue
+
+            if field.source == '*' or len(field.source_attrs) != 1:
+                raise ValueError(f"{serializer_class.__name__}.{name} has an unsupported source")
+            attr = field.source_attrs[0]
+            self.value_names.append(attr)
+
+            namespace[f'_f{index}'] = field.to_representation
+            convert = self._converter(field, index, namespace)
+            instance_items.append((name, f'obj.{attr}', convert))
+            row_items.append((name, f'row[{attr!r}]', convert))
+
+        self.to_representation = self._build('obj', instance_items, namespace)
+        self.from_row = self._build('row', row_items, namespace)
+
+    @staticmethod
+    def _converter(field, index, namespace):
+        # Must match field.to_representation for every non-None value
+        representation = type(field).to_representation
+        if representation is drf_fields.IntegerField.to_representation:
+            return lambda value: f'int({value})'
+        if representation is drf_fields.CharField.to_representation:
+            return lambda value: f'str({value})'
+        if representation is drf_fields.ChoiceField.to_representation:
+            namespace[f'_c{index}'] = field.choice_strings_to_values
+            return lambda value: f"({value} if {value} == '' else _c{index}.get(str({value}), {value}))"
+        return lambda value: f'_f{index}({value})'
+
+    @staticmethod
+    def _nested_instance(name, relation, relation_fields):
+        # getattr() with a default also covers RelatedObjectDoesNotExist
+        def convert(value):
+            return '{' + ', '.join(f'{attr!r}: {value}.{attr}' for attr in relation_fields) + '}'
+        return (name, f'getattr(obj, {relation!r}, None)', convert)
+
+    @staticmethod
+    def _nested_row(name, relation, relation_fields):
+        def convert(value):
+            return '{' + ', '.join(f"{attr!r}: row['{relation}__{attr}']" for attr in relation_fields) + '}'
+        return (name, f"row['{relation}__pk']", convert)
+
+    @staticmethod
+    def _build(argument, items, namespace):
+        lines = [f'def compiled({argument}):']
+        entries = []
+        for index, (name, getter, convert) in enumerate(items):
+            lines.append(f'    _v{index} = {getter}')
+            entries.append(f'{name!r}: None if _v{index} is None else {convert(f"_v{index}")}')
+        lines.append('    return {' + ', '.join(entries) + '}')
+
+        scope = dict(namespace)
+        exec('\n'.join(lines), scope)
+        return scope['compiled']
+
+    def many(self, objects):
+        to_representation = self.to_representation
+        return [to_representation(obj) for obj in objects]
+
+    def many_rows(self, rows):
+        from_row = self.from_row
+        return [from_row(row) for row in rows]
+
+
+_compiled = LRUCache(max_entries=256)
+
+
+def compile_serializer(serializer_class, fields=None):
+    """
+    Return the CompiledSerializer for a serializer class (and optional
+    sparse field set), building it on first use
+    """
+    key = (serializer_class, frozenset(fields) if fields is not None else None)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = CompiledSerializer(serializer_class, fields=fields)
+        _compiled.set(key, compiled)
+    return compiled
@@ -0,0 +1,64 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def _profile_stamps(user):
+    """
+    The timestamps that determine the profile payload. Profiles come from the
+    relation cache that token authentication fills, so this costs no query
+    for the request user.
+    """
+    student = getattr(user, 'student_profile', None)
+    teacher = getattr(user, 'teacher_profile', None)
+    return (
+        user.updated_at,
+        user.last_login,
+        student.updated_at if student is not None else None,
+        teacher.updated_at if teacher is not None else None,
+    )
+
+
+def profile_version(user):
+    stamps = _profile_stamps(user)
+    version = ':'.join([str(user.pk)] + [stamp.isoformat() if stamp else '-' for stamp in stamps])
+    return hashlib.sha1(version.encode()).hexdigest()
+
+
+def profile_etag(user, fields=None):
+    """
+    Strong ETag of the profile representation; sparse field sets (`fields`)
+    are distinct representations and get their own tags
+    """
+    if fields is None:
+        return '"%s"' % profile_version(user)
+    fieldset = hashlib.sha1(','.join(sorted(fields)).encode()).hexdigest()[:12]
+    return '"%s-%s"' % (profile_version(user), fieldset)
+
+
+def profile_last_modified(user):
+    return max(stamp for stamp in _profile_stamps(user) if stamp is not None)
+
+
+def set_profile_validators(response, user, fields=None):
+    response['ETag'] = profile_etag(user, fields)
+    response['Last-Modified'] = http_date(profile_last_modified(user).timestamp())
+    return response
+
+
+def check_profile_preconditions(request, user, fields=None):
+    """
+    Evaluate If-Match/If-None-Match/If-Modified-Since/If-Unmodified-Since
+    against the user's profile version (for the `fields` representation).
+    Returns a 304/412 response to send instead of the normal one, or None
+    to carry on.
+    """
+    response = get_conditional_response(
+        request,
+        etag=profile_etag(user, fields),
+        last_modified=int(profile_last_modified(user).timestamp()),
+    )
+    if response is not None:
+        set_profile_validators(response, user, fields)
+    return response
@@ -0,0 +1,16 @@
+import django_filters
+
+from usermanagement.models import User
+
+
+class UserDirectoryFilter(django_filters.FilterSet):
+    """
+    Filters for the user directory
+    """
+    grade = django_filters.CharFilter(field_name='student_profile__grade')
+    major = django_filters.CharFilter(field_name='student_profile__major')
+    department = django_filters.CharFilter(field_name='teacher_profile__department')
+
+    class Meta:
+        model = User
+        fields = ['user_type', 'is_verified', 'grade', 'major', 'department']
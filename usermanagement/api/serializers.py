@@ -1,67 +1,166 @@
+import copy
+
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.db import transaction
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
 from usermanagement.models import User, StudentProfile, TeacherProfile
-import requests
-from django.conf import settings
+from usermanagement.hashing import get_hashing_pool
+from usermanagement.google import (
+    get_userinfo_client,
+    get_id_token_verifier,
+    InvalidGoogleToken,
+    GoogleUnavailable,
+)
+from core.cache import LRUCache
 
 
 class GoogleAuthSerializer(serializers.Serializer):
     """
     Serializer for Google OAuth authentication
+    Accepts either an OAuth access token or a signed Google ID token
     """
-    access_token = serializers.CharField()
+    access_token = serializers.CharField(required=False)
+    id_token = serializers.CharField(required=False)
+    
+    # Set by ais_valid(), which does the Google lookups itself
+    _defer_lookup = False
     
     def validate_access_token(self, access_token):
         """
         Validate Google access token and get user info
         """
-        google_userinfo_url = 'https://www.googleapis.com/oauth2/v2/userinfo'
+        if self._defer_lookup:
+            return access_token
+        try:
+            return get_userinfo_client().get_userinfo(access_token)
+        except InvalidGoogleToken:
+            raise serializers.ValidationError('Invalid access token')
+        except GoogleUnavailable:
+            raise serializers.ValidationError('Unable to validate token with Google')
+    
+    def validate_id_token(self, id_token):
+        """
+        Verify Google ID token locally and get user info from its claims
+        """
+        verifier = get_id_token_verifier()
+        if not verifier.enabled:
+            raise serializers.ValidationError('ID token sign-in is not configured')
+        if self._defer_lookup:
+            return id_token
         
         try:
-            response = requests.get(
-                google_userinfo_url,
-                params={'access_token': access_token}
-            )
-            
-            if response.status_code != 200:
-                raise serializers.ValidationError('Invalid access token')
-            
-            user_data = response.json()
-            
-            if 'error' in user_data:
-                raise serializers.ValidationError('Invalid access token')
-            
-            return user_data
-            
-        except requests.RequestException:
+            return verifier.verify(id_token)
+        except InvalidGoogleToken:
+            raise serializers.ValidationError('Invalid ID token')
+        except GoogleUnavailable:
+            raise serializers.ValidationError('Unable to validate token with Google')
+    
+    def validate(self, attrs):
+        if ('access_token' in attrs) == ('id_token' in attrs):
+            raise serializers.ValidationError('Provide either access_token or id_token')
+        attrs['google_user'] = attrs.get('id_token') or attrs.get('access_token')
+        return attrs
+    
+    async def _alookup(self, field, token):
+        try:
+            if field == 'id_token':
+                return await get_id_token_verifier().averify(token)
+            return await get_userinfo_client().aget_userinfo(token)
+        except InvalidGoogleToken:
+            raise serializers.ValidationError('Invalid ID token' if field == 'id_token' else 'Invalid access token')
+        except GoogleUnavailable:
             raise serializers.ValidationError('Unable to validate token with Google')
+    
+    async def ais_valid(self):
+        """
+        is_valid() for async views: the same checks and errors, with the
+        Google lookup awaited instead of blocking the event loop
+        """
+        self._defer_lookup = True
+        if not self.is_valid():
+            return False
+        
+        field = 'id_token' if 'id_token' in self._validated_data else 'access_token'
+        try:
+            self._validated_data['google_user'] = await self._alookup(field, self._validated_data[field])
+        except serializers.ValidationError as exc:
+            self._validated_data = {}
+            self._errors = {field: exc.detail}
+            return False
+        return True
+
+
+class StudentProfileSerializer(serializers.ModelSerializer):
+    """
+    Serializer for student profile
+    """
+    class Meta:
+        model = StudentProfile
+        fields = ['student_id', 'grade', 'major', 'enrollment_date']
+
+
+class TeacherProfileSerializer(serializers.ModelSerializer):
+    """
+    Serializer for teacher profile
+    """
+    class Meta:
+        model = TeacherProfile
+        fields = ['employee_id', 'department', 'specialization', 'hire_date']
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """
     Serializer for user registration
+    Optionally creates the matching student or teacher profile in the same transaction
     """
     password = serializers.CharField(write_only=True, min_length=8)
     confirm_password = serializers.CharField(write_only=True)
     user_type = serializers.ChoiceField(choices=User.USER_TYPE_CHOICES, default='student')
+    student_profile = StudentProfileSerializer(write_only=True, required=False)
+    teacher_profile = TeacherProfileSerializer(write_only=True, required=False)
     
     class Meta:
         model = User
-        fields = ['username', 'email', 'first_name', 'last_name', 'password', 'confirm_password', 'user_type', 'phone']
+        fields = ['username', 'email', 'first_name', 'last_name', 'password', 'confirm_password', 'user_type', 'phone',
+                  'student_profile', 'teacher_profile']
     
     def validate(self, attrs):
         if attrs['password'] != attrs['confirm_password']:
             raise serializers.ValidationError("Password and confirm password don't match")
+        if 'student_profile' in attrs and attrs['user_type'] != 'student':
+            raise serializers.ValidationError('Only students can have a student profile')
+        if 'teacher_profile' in attrs and attrs['user_type'] != 'teacher':
+            raise serializers.ValidationError('Only teachers can have a teacher profile')
         return attrs
     
     def create(self, validated_data):
+        """
+        Hash once (outside the transaction), then insert the user, its token
+        and optional profile atomically
+        """
         validated_data.pop('confirm_password')
         password = validated_data.pop('password')
-        user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
+        student_data = validated_data.pop('student_profile', None)
+        teacher_data = validated_data.pop('teacher_profile', None)
+        
+        validated_data['username'] = User.normalize_username(validated_data['username'])
+        validated_data['email'] = User.objects.normalize_email(validated_data.get('email', ''))
+        password_hash = get_hashing_pool().hash_password(password)
+        
+        with transaction.atomic():
+            user = User(password=password_hash, **validated_data)
+            user.save(force_insert=True)
+            Token.objects.create(user=user)
+            
+            student_profile = teacher_profile = None
+            if student_data is not None:
+                student_profile = StudentProfile.objects.create(user=user, **student_data)
+            if teacher_data is not None:
+                teacher_profile = TeacherProfile.objects.create(user=user, **teacher_data)
+        
+        user.prime_profile_cache(student_profile, teacher_profile)
         return user
 
 
@@ -87,15 +186,103 @@ class UserLoginSerializer(serializers.Serializer):
             raise serializers.ValidationError('Must include username and password')
         
         return attrs
+    
+    async def ais_valid(self):
+        """
+        is_valid() for async views: credentials are checked with the auth
+        backend's async authenticate, so the hash is awaited, not waited on
+        """
+        from usermanagement.backends import ProfileModelBackend
+        
+        try:
+            attrs = self.to_internal_value(self.initial_data)
+            user = await ProfileModelBackend().aauthenticate(
+                None, username=attrs['username'], password=attrs['password']
+            )
+            if not user:
+                raise serializers.ValidationError('Invalid credentials')
+            if not user.is_active:
+                raise serializers.ValidationError('User account is disabled')
+        except serializers.ValidationError as exc:
+            self._validated_data = {}
+            self._errors = serializers.as_serializer_error(exc)
+            return False
+        
+        self._validated_data = {**attrs, 'user': user}
+        self._errors = {}
+        return True
+
+
+def _split_param(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+class UnknownFields(ValueError):
+    """
+    `?fields=`/`?include=` named fields the serializer does not have
+    """
+    def __init__(self, names):
+        self.names = sorted(names)
+        super().__init__(f"Unknown fields: {', '.join(self.names)}")
+
+
+class SparseFieldsetMixin:
+    """
+    Lets a serializer be narrowed with `fields=`, e.g.
+    `UserProfileSerializer(user, fields={'id', 'username'})`.
+
+    The field dict for each (serializer class, field set) pair is built once
+    and copied per instance, so narrow serializers skip the ModelSerializer
+    field construction as well as the fields that were left out.
+    """
+    _fieldsets = LRUCache(max_entries=512)
+    
+    def __init__(self, *args, fields=None, **kwargs):
+        self.requested_fields = frozenset(fields) if fields is not None else None
+        super().__init__(*args, **kwargs)
+    
+    @classmethod
+    def fields_from_request(cls, request):
+        """
+        Field set asked for by `?fields=` (plus any `?include=`); None when
+        the client did not narrow it. `?include=` alone leaves the full
+        field set, which already has every field it can name. Raises
+        UnknownFields for names this serializer does not have.
+        """
+        params = getattr(request, 'query_params', request.GET)
+        requested = _split_param(params.get('fields'))
+        included = _split_param(params.get('include'))
+        unknown = (requested | included) - set(cls.Meta.fields)
+        if unknown:
+            raise UnknownFields(unknown)
+        if not requested:
+            return None
+        return frozenset(requested | included)
+    
+    def get_fields(self):
+        key = (type(self), self.requested_fields)
+        fields = self._fieldsets.get(key)
+        if fields is None:
+            fields = super().get_fields()
+            if self.requested_fields is not None:
+                fields = {name: field for name, field in fields.items() if name in self.requested_fields}
+            self._fieldsets.set(key, fields)
+        return copy.deepcopy(fields)
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for user profile information
     """
     student_profile = serializers.SerializerMethodField()
     teacher_profile = serializers.SerializerMethodField()
     
+    # What get_student_profile/get_teacher_profile return, for compile_serializer()
+    compiled_nested = {
+        'student_profile': ('student_profile', ('student_id', 'grade', 'major', 'enrollment_date')),
+        'teacher_profile': ('teacher_profile', ('employee_id', 'department', 'specialization', 'hire_date')),
+    }
+    
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'user_type', 
@@ -103,6 +290,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
                  'date_joined', 'last_login']
         read_only_fields = ['id', 'date_joined', 'last_login']
     
+    @staticmethod
+    def profile_relations(fields):
+        """
+        Profile relations worth joining for a field set (None means all fields)
+        """
+        return [name for name in User.objects.profile_relations if fields is None or name in fields]
+    
     def get_student_profile(self, obj):
         if hasattr(obj, 'student_profile'):
             return {
@@ -124,19 +318,29 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return None
 
 
-class StudentProfileSerializer(serializers.ModelSerializer):
+class PublicProfileSerializer(UserProfileSerializer):
     """
-    Serializer for student profile
+    Serializer for the public view of a user, without contact details
     """
-    class Meta:
-        model = StudentProfile
-        fields = ['student_id', 'grade', 'major', 'enrollment_date']
+    class Meta(UserProfileSerializer.Meta):
+        fields = ['id', 'username', 'first_name', 'last_name', 'user_type', 'avatar',
+                  'is_verified', 'student_profile', 'teacher_profile', 'created_at']
+        read_only_fields = fields
 
 
-class TeacherProfileSerializer(serializers.ModelSerializer):
+class BatchProfileLookupSerializer(serializers.Serializer):
     """
-    Serializer for teacher profile
+    Serializer for a batch profile lookup by user IDs and/or usernames
     """
-    class Meta:
-        model = TeacherProfile
-        fields = ['employee_id', 'department', 'specialization', 'hire_date']
+    MAX_LOOKUPS = 500
+    
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    usernames = serializers.ListField(child=serializers.CharField(max_length=150), required=False, default=list)
+    
+    def validate(self, attrs):
+        total = len(attrs['ids']) + len(attrs['usernames'])
+        if not total:
+            raise serializers.ValidationError('Provide ids and/or usernames')
+        if total > self.MAX_LOOKUPS:
+            raise serializers.ValidationError(f'At most {self.MAX_LOOKUPS} users can be looked up per request')
+        return attrs
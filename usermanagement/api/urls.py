@@ -1,20 +1,34 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Async variants of the hot endpoints, used under ASGI
+endpoints = async_views if settings.ASYNC_API_VIEWS else views
 
 urlpatterns = [
     # Health check and info endpoints
-    path('health/', views.health_check, name='health_check'),
+    path('health/', endpoints.health_check, name='health_check'),
     path('info/', views.project_info, name='project_info'),
     path('test/', views.test_endpoint, name='test_endpoint'),
     
     # Authentication endpoints
-    path('auth/google/', views.google_auth, name='google_auth'),
+    path('auth/google/', endpoints.google_auth, name='google_auth'),
     path('auth/register/', views.register, name='register'),
-    path('auth/login/', views.login_user, name='login'),
+    path('auth/login/', endpoints.login_user, name='login'),
     path('auth/logout/', views.logout_user, name='logout'),
     
     # User profile endpoints
-    path('profile/', views.user_profile, name='user_profile'),
+    path('profile/', endpoints.user_profile, name='user_profile'),
     path('profile/student/', views.create_student_profile, name='create_student_profile'),
     path('profile/teacher/', views.create_teacher_profile, name='create_teacher_profile'),
+    
+    # Directory endpoints
+    path('users/', views.user_directory, name='user_directory'),
+    path('users/search/', views.search_user_directory, name='search_user_directory'),
+    path('users/batch/', views.batch_user_profiles, name='batch_user_profiles'),
+    
+    # Admin endpoints
+    path('users/import/', views.bulk_import_users, name='bulk_import_users'),
+    path('users/export/', views.export_users, name='export_users'),
+    path('changes/', views.change_feed, name='change_feed'),
 ]
@@ -1,19 +1,36 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate, login
-from django.http import JsonResponse
-from usermanagement.models import User, StudentProfile, TeacherProfile
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from usermanagement.models import User
+from usermanagement.bulk_import import UserImporter, iter_rows, open_upload
+from usermanagement.google import sign_in_google_user
+from usermanagement.search import search_users
+from usermanagement.export import EXPORT_FORMATS, iter_export
+from usermanagement.changefeed import InvalidCursor, read_changes
+from usermanagement.profile_documents import get_document, render_with_document
+from .compiled import compile_serializer
+from .conditional import check_profile_preconditions, set_profile_validators
 from .serializers import (
     GoogleAuthSerializer, 
     UserRegistrationSerializer, 
     UserLoginSerializer, 
     UserProfileSerializer,
+    PublicProfileSerializer,
+    BatchProfileLookupSerializer,
     StudentProfileSerializer,
-    TeacherProfileSerializer
+    TeacherProfileSerializer,
+    UnknownFields
 )
+from .filters import UserDirectoryFilter
+from .pagination import KeysetPagination
 import datetime
 import uuid
 
@@ -84,37 +101,27 @@ def test_endpoint(request):
 def google_auth(request):
     """
     Google OAuth authentication endpoint
-    Expects: {"access_token": "google_access_token"}
+    Expects: {"access_token": "google_access_token"} or {"id_token": "google_id_token"}
     Returns: User data and authentication token
     """
     serializer = GoogleAuthSerializer(data=request.data)
     
     if serializer.is_valid():
-        google_user_data = serializer.validated_data['access_token']
+        google_user_data = serializer.validated_data['google_user']
         
         try:
-            # Check if user already exists
-            user, created = User.objects.get_or_create(
-                email=google_user_data['email'],
-                defaults={
-                    'username': google_user_data['email'],
-                    'first_name': google_user_data.get('given_name', ''),
-                    'last_name': google_user_data.get('family_name', ''),
-                    'is_verified': google_user_data.get('verified_email', False),
-                    'avatar': google_user_data.get('picture', ''),
-                }
-            )
+            user, token, created = sign_in_google_user(google_user_data)
             
-            # Create or get authentication token
-            token, created = Token.objects.get_or_create(user=user)
-            
-            # Serialize user data
-            user_serializer = UserProfileSerializer(user)
+            if not user.is_active:
+                return Response({
+                    'success': False,
+                    'message': 'User account is disabled'
+                }, status=status.HTTP_403_FORBIDDEN)
             
             return Response({
                 'success': True,
                 'message': 'Google authentication successful' if not created else 'User registered successfully via Google',
-                'user': user_serializer.data,
+                'user': compile_serializer(UserProfileSerializer).to_representation(user),
                 'token': token.key,
                 'is_new_user': created
             }, status=status.HTTP_200_OK)
@@ -133,6 +140,22 @@ def google_auth(request):
     }, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _profile_document_response(request, data, user, status_code):
+    """
+    Respond with `data`, its 'user' entry filled from the user's pre-rendered
+    profile document; non-JSON renderers (browsable API) get a normal Response
+    """
+    if not isinstance(request.accepted_renderer, JSONRenderer):
+        data['user'] = compile_serializer(UserProfileSerializer).to_representation(user)
+        return Response(data, status=status_code)
+    
+    return HttpResponse(
+        render_with_document(data, get_document(user)),
+        content_type='application/json',
+        status=status_code
+    )
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register(request):
@@ -143,14 +166,13 @@ def register(request):
     
     if serializer.is_valid():
         user = serializer.save()
-        token, created = Token.objects.get_or_create(user=user)
         
-        return Response({
+        return _profile_document_response(request, {
             'success': True,
             'message': 'User registered successfully',
-            'user': UserProfileSerializer(user).data,
-            'token': token.key
-        }, status=status.HTTP_201_CREATED)
+            'user': None,
+            'token': user.auth_token.key
+        }, user, status.HTTP_201_CREATED)
     
     return Response({
         'success': False,
@@ -171,12 +193,12 @@ def login_user(request):
         user = serializer.validated_data['user']
         token, created = Token.objects.get_or_create(user=user)
         
-        return Response({
+        return _profile_document_response(request, {
             'success': True,
             'message': 'Login successful',
-            'user': UserProfileSerializer(user).data,
+            'user': None,
             'token': token.key
-        }, status=status.HTTP_200_OK)
+        }, user, status.HTTP_200_OK)
     
     return Response({
         'success': False,
@@ -204,28 +226,54 @@ def logout_user(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _unknown_fields_response(exc):
+    return Response({
+        'success': False,
+        'message': 'Unknown fields requested',
+        'errors': {'fields': exc.names}
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
 def user_profile(request):
     """
     Get or update user profile
+    GET honours If-None-Match/If-Modified-Since (304); PUT honours If-Match (412)
     """
+    fields = None
     if request.method == 'GET':
-        serializer = UserProfileSerializer(request.user)
-        return Response({
-            'success': True,
-            'user': serializer.data
-        }, status=status.HTTP_200_OK)
+        try:
+            fields = UserProfileSerializer.fields_from_request(request)
+        except UnknownFields as exc:
+            return _unknown_fields_response(exc)
+    
+    precondition_failed = check_profile_preconditions(request, request.user, fields)
+    if precondition_failed is not None:
+        return precondition_failed
+    
+    if request.method == 'GET':
+        if fields is None:
+            response = _profile_document_response(request, {
+                'success': True,
+                'user': None
+            }, request.user, status.HTTP_200_OK)
+        else:
+            response = Response({
+                'success': True,
+                'user': compile_serializer(UserProfileSerializer, fields=fields).to_representation(request.user)
+            }, status=status.HTTP_200_OK)
+        return set_profile_validators(response, request.user, fields)
     
     elif request.method == 'PUT':
         serializer = UserProfileSerializer(request.user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            return Response({
+            return set_profile_validators(Response({
                 'success': True,
                 'message': 'Profile updated successfully',
                 'user': serializer.data
-            }, status=status.HTTP_200_OK)
+            }, status=status.HTTP_200_OK), request.user)
         
         return Response({
             'success': False,
@@ -300,3 +348,202 @@ def create_teacher_profile(request):
         'message': 'Profile creation failed',
         'errors': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)
+
+
+# ==============================================================================
+# DIRECTORY VIEWS
+# ==============================================================================
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def user_directory(request):
+    """
+    Read-only directory of active users with their profiles
+    Filters: user_type, is_verified, grade, major, department
+    Paginated with an opaque `cursor`; `page_size` up to 200
+    Supports `?fields=`/`?include=` to return only some fields
+    """
+    try:
+        fields = PublicProfileSerializer.fields_from_request(request)
+    except UnknownFields as exc:
+        return _unknown_fields_response(exc)
+    queryset = User.objects.with_profiles(PublicProfileSerializer.profile_relations(fields)).filter(is_active=True)
+    filterset = UserDirectoryFilter(request.query_params, queryset=queryset)
+    
+    if not filterset.is_valid():
+        return Response({
+            'success': False,
+            'message': 'Invalid filters',
+            'errors': filterset.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(filterset.qs, request)
+    return paginator.get_paginated_response(PublicProfileSerializer(page, many=True, fields=fields).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_user_directory(request):
+    """
+    Ranked prefix search over users and their profiles
+    Expects: ?q=<terms>&limit=<1-50>, optional ?fields=/?include=
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({
+            'success': False,
+            'message': 'Query parameter "q" is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 20)), 50))
+    except ValueError:
+        limit = 20
+    
+    try:
+        fields = PublicProfileSerializer.fields_from_request(request)
+    except UnknownFields as exc:
+        return _unknown_fields_response(exc)
+    queryset = User.objects.with_profiles(PublicProfileSerializer.profile_relations(fields)).filter(is_active=True)
+    users = search_users(query, limit=limit, queryset=queryset, active_only=True)
+    return Response({
+        'success': True,
+        'results': PublicProfileSerializer(users, many=True, fields=fields).data
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_user_profiles(request):
+    """
+    Public profiles for many users in one call
+    Expects: {"ids": [...], "usernames": [...]} (up to 500 in total), optional ?fields=/?include=
+    Returns: profiles of the active users found, plus the lookups that matched nobody
+    """
+    serializer = BatchProfileLookupSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'message': 'Invalid lookup',
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    ids = serializer.validated_data['ids']
+    usernames = serializer.validated_data['usernames']
+    try:
+        fields = PublicProfileSerializer.fields_from_request(request)
+    except UnknownFields as exc:
+        return _unknown_fields_response(exc)
+    users = list(
+        User.objects.with_profiles(PublicProfileSerializer.profile_relations(fields))
+        .filter(is_active=True)
+        .filter(Q(pk__in=ids) | Q(username__in=usernames))
+    )
+    
+    found_ids = {user.pk for user in users}
+    found_usernames = {user.username for user in users}
+    return Response({
+        'success': True,
+        'results': PublicProfileSerializer(users, many=True, fields=fields).data,
+        'missing': {
+            'ids': [user_id for user_id in ids if user_id not in found_ids],
+            'usernames': [username for username in usernames if username not in found_usernames]
+        }
+    }, status=status.HTTP_200_OK)
+
+
+# ==============================================================================
+# ADMIN VIEWS
+# ==============================================================================
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+@parser_classes([MultiPartParser])
+def bulk_import_users(request):
+    """
+    Bulk import users from an uploaded CSV or JSONL file (admin only)
+    Expects: multipart "file", optional "format" ("csv" or "jsonl")
+    Returns: created/failed counts and per-row errors
+    """
+    uploaded_file = request.FILES.get('file')
+    if uploaded_file is None:
+        return Response({
+            'success': False,
+            'message': 'No file uploaded'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    fmt = request.data.get('format') or (
+        'jsonl' if uploaded_file.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+    )
+    if fmt not in ('csv', 'jsonl'):
+        return Response({
+            'success': False,
+            'message': 'Unsupported format, use csv or jsonl'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    report = UserImporter().run(iter_rows(open_upload(uploaded_file), fmt))
+    
+    return Response({
+        'success': report.failed == 0,
+        'message': f'Imported {report.created} users',
+        **report.as_dict()
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_users(request):
+    """
+    Stream all users with their profiles (admin only)
+    Expects: ?output=csv|jsonl and optional ?since=<ISO 8601 updated_at lower bound>
+    """
+    fmt = request.query_params.get('output', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return Response({
+            'success': False,
+            'message': 'Unsupported output, use csv or jsonl'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    since = None
+    if request.query_params.get('since'):
+        since = parse_datetime(request.query_params['since'])
+        if since is None:
+            return Response({
+                'success': False,
+                'message': 'Invalid since timestamp'
+            }, status=status.HTTP_400_BAD_REQUEST)
+    
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(iter_export(fmt, since=since), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="users.{fmt}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def change_feed(request):
+    """
+    User and profile changes since an opaque cursor (admin/service accounts)
+    Expects: ?cursor=<cursor from the previous call>&limit=<1-5000>
+    Returns: latest change per object, deletions as tombstones, and the next cursor
+    """
+    try:
+        limit = int(request.query_params.get('limit', 500))
+    except ValueError:
+        limit = 500
+    
+    try:
+        changes, cursor, has_more = read_changes(request.query_params.get('cursor'), limit=limit)
+    except InvalidCursor:
+        return Response({
+            'success': False,
+            'message': 'Invalid cursor'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'success': True,
+        'changes': changes,
+        'cursor': cursor,
+        'has_more': has_more
+    }, status=status.HTTP_200_OK)
@@ -1,6 +1,14 @@
-from django.apps import AppConfig
-
-
-class UsermanagementConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'usermanagement'
+from django.apps import AppConfig
+
+
+class UsermanagementConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'usermanagement'
+
+    def ready(self):
+        from core.metrics import get_metrics_registry
+
+        from . import signals  # noqa: F401
+        from .hashing import get_hashing_pool
+
+        get_metrics_registry().register_stats('password_hashing', lambda: get_hashing_pool().stats())
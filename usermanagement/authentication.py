@@ -0,0 +1,345 @@
+import copy
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from core.cache import LRUCache
+
+
+TOKEN_AUTH_CACHE_DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 300,
+    'SHARED_CACHE': 'default',
+    'KEY_PREFIX': 'authtoken',
+    'VERSION_TTL': 1,
+}
+
+# Rows read less than this long before their user's stamp was last bumped
+# are not cached (allows for clock differences between servers)
+_CLOCK_MARGIN = 1.0
+
+
+def get_token_auth_setting(name):
+    return getattr(settings, 'TOKEN_AUTH_CACHE', {}).get(name, TOKEN_AUTH_CACHE_DEFAULTS[name])
+
+
+_local_cache = None
+_local_versions = None
+_version_memo = None
+
+
+def _caches():
+    """
+    Return (token entries, version stamps when there is no shared cache,
+    recently read shared stamps or None) for this process
+    """
+    global _local_cache, _local_versions, _version_memo
+    if _local_cache is None:
+        max_entries = get_token_auth_setting('MAX_ENTRIES')
+        version_ttl = get_token_auth_setting('VERSION_TTL')
+        _local_versions = LRUCache(max_entries=max_entries)
+        _version_memo = LRUCache(max_entries=max_entries, ttl=version_ttl) if version_ttl else None
+        _local_cache = LRUCache(max_entries=max_entries, ttl=get_token_auth_setting('TTL'))
+    return _local_cache, _local_versions, _version_memo
+
+
+@receiver(setting_changed)
+def _reset_caches(setting, **kwargs):
+    global _local_cache, _local_versions, _version_memo
+    if setting == 'TOKEN_AUTH_CACHE':
+        _local_cache = _local_versions = _version_memo = None
+
+
+def _shared_cache():
+    alias = get_token_auth_setting('SHARED_CACHE')
+    return caches[alias] if alias else None
+
+
+def _cache_key(key):
+    return f"{get_token_auth_setting('KEY_PREFIX')}:{key}"
+
+
+def _version_key(user_id):
+    return f"{get_token_auth_setting('KEY_PREFIX')}:version:user:{user_id}"
+
+
+def _versions():
+    shared = _shared_cache()
+    return shared if shared is not None else _caches()[1]
+
+
+def _new_version(bumped_at):
+    return (bumped_at, uuid.uuid4().hex)
+
+
+def _remember_version(user_id, version):
+    memo = _caches()[2]
+    if memo is not None:
+        memo.set(user_id, version)
+    return version
+
+
+def get_token_version(user_id):
+    """
+    Current (bumped at, random) version stamp of a user's cached tokens. It
+    lives in the shared cache (in this process only when there is none), so
+    a bump made by any process invalidates the entries every other process
+    holds.
+    """
+    versions = _versions()
+    key = _version_key(user_id)
+    version = versions.get(key)
+    if version is None:
+        # add() so processes racing to initialise the stamp agree on it. An
+        # initial stamp records no change, so it does not hold back caching.
+        version = _new_version(0)
+        versions.add(key, version, None)
+        version = versions.get(key, version)
+    return _remember_version(user_id, version)
+
+
+async def aget_token_version(user_id):
+    """
+    `get_token_version` on the async cache API
+    """
+    shared = _shared_cache()
+    if shared is None:
+        return get_token_version(user_id)
+    key = _version_key(user_id)
+    version = await shared.aget(key)
+    if version is None:
+        version = _new_version(0)
+        await shared.aadd(key, version, None)
+        version = await shared.aget(key, version)
+    return _remember_version(user_id, version)
+
+
+def _memoized_version(user_id):
+    """
+    Stamp to check a local entry against, if read from the shared cache in
+    the last VERSION_TTL seconds (so a bump made by another process can go
+    unseen here for that long); None when it has to be re-read
+    """
+    memo = _caches()[2]
+    if memo is None or _shared_cache() is None:
+        return None
+    return memo.get(user_id)
+
+
+def _bump_token_version(user_id):
+    version = _new_version(time.time())
+    _versions().set(_version_key(user_id), version, None)
+    _remember_version(user_id, version)
+
+
+def _attach(token):
+    """
+    Return a private copy of a cached token with its user (and the user's
+    profiles) wired both ways, so `request.user.auth_token` is served
+    without a query
+    """
+    token = copy.copy(token)
+    user = copy.copy(token.user)
+    for name, related in list(user._state.fields_cache.items()):
+        if related is not None:
+            user._state.fields_cache[name] = copy.copy(related)
+    token.user = user
+    Token.user.field.remote_field.set_cached_value(user, token)
+    return token
+
+
+def get_cached_token(key):
+    """
+    Cached token for `key`, or None. Entries, local or shared, only count
+    while their user's version stamp is still current.
+    """
+    local = _caches()[0]
+    entry = local.get(key)
+    if entry is not None:
+        version, token = entry
+        if version == (_memoized_version(token.user_id) or get_token_version(token.user_id)):
+            return _attach(token)
+        local.delete(key)
+
+    shared = _shared_cache()
+    if shared is not None:
+        entry = shared.get(_cache_key(key))
+        if entry is not None:
+            version, token = entry
+            if version == get_token_version(token.user_id):
+                local.set(key, entry)
+                return _attach(token)
+
+    return None
+
+
+async def aget_cached_token(key):
+    """
+    `get_cached_token` on the async cache API
+    """
+    local = _caches()[0]
+    entry = local.get(key)
+    if entry is not None:
+        version, token = entry
+        if version == (_memoized_version(token.user_id) or await aget_token_version(token.user_id)):
+            return _attach(token)
+        local.delete(key)
+
+    shared = _shared_cache()
+    if shared is not None:
+        entry = await shared.aget(_cache_key(key))
+        if entry is not None:
+            version, token = entry
+            if version == await aget_token_version(token.user_id):
+                local.set(key, entry)
+                return _attach(token)
+
+    return None
+
+
+def _fillable(version, read_at):
+    return read_at is None or version[0] <= read_at - _CLOCK_MARGIN
+
+
+def cache_token(token, read_at=None):
+    """
+    Cache `token` (with its user) under the user's current version stamp.
+
+    `read_at` is the time.time() taken before the row was read. A row read
+    before a change committed is only caught by the bump that follows the
+    commit (post_save in autocommit, the on-commit bump inside atomic()), so
+    if the stamp was bumped after `read_at` the row may predate it and is
+    not cached. Returns whether it was cached.
+    """
+    version = get_token_version(token.user_id)
+    if not _fillable(version, read_at):
+        return False
+    entry = (version, token)
+    _caches()[0].set(token.key, entry)
+
+    shared = _shared_cache()
+    if shared is not None:
+        shared.set(_cache_key(token.key), entry, get_token_auth_setting('TTL'))
+    return True
+
+
+async def acache_token(token, read_at=None):
+    """
+    `cache_token` on the async cache API
+    """
+    version = await aget_token_version(token.user_id)
+    if not _fillable(version, read_at):
+        return False
+    entry = (version, token)
+    _caches()[0].set(token.key, entry)
+
+    shared = _shared_cache()
+    if shared is not None:
+        await shared.aset(_cache_key(token.key), entry, get_token_auth_setting('TTL'))
+    return True
+
+
+def invalidate_token(key, user_id=None):
+    _caches()[0].delete(key)
+
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(_cache_key(key))
+
+    if user_id is not None:
+        invalidate_user_tokens(user_id)
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Invalidate every cached token of a user, in all processes. Inside a
+    transaction the stamp is bumped again on commit, so an entry filled
+    from the old row meanwhile is dropped as well (see `cache_token`).
+    """
+    _bump_token_version(user_id)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_token_version(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that resolves token keys from an in-process LRU,
+    backed by an optional shared cache, before falling back to the database.
+
+    Entries carry their user's version stamp, which is bumped as soon as a
+    token is deleted or its user is saved (see `usermanagement.signals`).
+    Hits are checked against the stamp in the shared cache, re-read at most
+    every VERSION_TTL seconds, so logouts and deactivations made in another
+    process apply here within that time.
+    """
+
+    def _queryset(self):
+        return self.get_model().objects.select_related('user__student_profile', 'user__teacher_profile')
+
+    def _checked(self, token, read_at=None):
+        if read_at is not None and token.user.is_active:
+            cache_token(token, read_at)
+            token = _attach(token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
+
+    def authenticate_credentials(self, key):
+        token = get_cached_token(key)
+        if token is not None:
+            return self._checked(token)
+
+        read_at = time.time()
+        try:
+            token = self._queryset().get(key=key)
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return self._checked(token, read_at)
+
+    async def aauthenticate_credentials(self, key):
+        token = await aget_cached_token(key)
+        if token is None:
+            read_at = time.time()
+            try:
+                token = await self._queryset().aget(key=key)
+            except self.get_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if token.user.is_active:
+                await acache_token(token, read_at)
+                token = _attach(token)
+
+        return self._checked(token)
+
+    async def aauthenticate(self, request):
+        """
+        `authenticate` for async views, which have a plain Django request
+        """
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        elif len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.')
+            )
+
+        return await self.aauthenticate_credentials(key)
@@ -0,0 +1,57 @@
+from django.contrib.auth.backends import ModelBackend
+
+from usermanagement.hashing import get_hashing_pool
+from usermanagement.models import User
+
+
+class ProfileModelBackend(ModelBackend):
+    """
+    ModelBackend that loads session users together with their profiles and
+    verifies passwords on the bounded hashing pool
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        pool = get_hashing_pool()
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash anyway so unknown usernames take as long as wrong passwords
+            pool.hash_password(password)
+            return None
+
+        if pool.check_user_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        """
+        `authenticate` for async views: async ORM, and the hash is awaited
+        instead of blocking the event loop
+        """
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        pool = get_hashing_pool()
+        try:
+            user = await User.objects.with_profiles().aget(**{User.USERNAME_FIELD: username})
+        except User.DoesNotExist:
+            await pool.ahash_password(password)
+            return None
+
+        if await pool.acheck_user_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        try:
+            user = User.objects.with_profiles().get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
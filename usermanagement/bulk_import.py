@@ -0,0 +1,276 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+
+from usermanagement.models import User, StudentProfile, TeacherProfile
+from usermanagement.changefeed import record_upserts
+from usermanagement.hashing import get_hashing_pool
+from usermanagement.search import index_users
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+STUDENT_FIELDS = ('student_id', 'grade', 'major', 'enrollment_date')
+TEACHER_FIELDS = ('employee_id', 'department', 'specialization', 'hire_date')
+
+
+class BulkUserRowSerializer(serializers.Serializer):
+    """
+    Validates a single import row. Uniqueness is checked per chunk by
+    UserImporter, not here.
+
+    `password` is hashed during the import; `password_hash` takes an
+    already-hashed Django password (e.g. when migrating from another system)
+    and skips hashing. Rows with neither get an unusable password.
+    """
+    username = serializers.CharField(max_length=150)
+    email = serializers.EmailField(required=False, allow_blank=True, default='')
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    password = serializers.CharField(min_length=8, required=False, allow_blank=True)
+    password_hash = serializers.CharField(required=False, allow_blank=True)
+    user_type = serializers.ChoiceField(choices=User.USER_TYPE_CHOICES, default='student')
+    phone = serializers.CharField(max_length=15, required=False, allow_blank=True, allow_null=True)
+
+    student_id = serializers.CharField(max_length=20, required=False, allow_blank=True)
+    grade = serializers.CharField(max_length=50, required=False, allow_blank=True, default='')
+    major = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    enrollment_date = serializers.DateField(required=False, allow_null=True, default=None)
+
+    employee_id = serializers.CharField(max_length=20, required=False, allow_blank=True)
+    department = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    specialization = serializers.CharField(max_length=200, required=False, allow_blank=True, default='')
+    hire_date = serializers.DateField(required=False, allow_null=True, default=None)
+
+    def to_internal_value(self, data):
+        # CSV cells are always strings; treat empty optional cells as missing
+        data = {key: value for key, value in data.items() if value not in ('', None)}
+        return super().to_internal_value(data)
+
+    def validate_password_hash(self, value):
+        try:
+            identify_hasher(value)
+        except ValueError:
+            raise serializers.ValidationError('Unknown password hash format')
+        return value
+
+    def validate(self, attrs):
+        if attrs.get('password') and attrs.get('password_hash'):
+            raise serializers.ValidationError('Provide either password or password_hash, not both')
+        if attrs.get('student_id') and attrs['user_type'] != 'student':
+            raise serializers.ValidationError('student_id is only allowed for students')
+        if attrs.get('employee_id') and attrs['user_type'] != 'teacher':
+            raise serializers.ValidationError('employee_id is only allowed for teachers')
+        return attrs
+
+
+def iter_rows(stream, fmt):
+    """
+    Yield (row number, dict) pairs from a CSV or JSONL text stream
+    """
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            yield number, row
+    elif fmt == 'jsonl':
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else {'__invalid__': line}
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def open_upload(uploaded_file):
+    """
+    Text stream over an uploaded file, read incrementally
+    """
+    return io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+
+
+class ImportReport:
+    """
+    Outcome of a bulk import: counts plus one entry per rejected row
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+class UserImporter:
+    """
+    Streams rows into User, StudentProfile/TeacherProfile and Token tables.
+
+    Rows are validated in chunks of `batch_size`, passwords are hashed on
+    `hashing_pool` (the process-wide PasswordHashingPool by default), and each
+    chunk is written with bulk_create inside one transaction. A chunk that hits
+    a race (e.g. a username registered meanwhile) is retried row by row so the
+    offending rows are reported and the rest still land. Errors are reported
+    in row order.
+
+    Profile documents are not built here: like those of any changed user,
+    they are built on first read (profile_documents.get_document), so an
+    import of users who never log in writes none.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, hashing_pool=None, create_tokens=True):
+        self.batch_size = batch_size
+        self.hashing_pool = hashing_pool or get_hashing_pool()
+        self.create_tokens = create_tokens
+
+    def run(self, rows):
+        report = ImportReport()
+        rows = iter(rows)
+
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk, report)
+
+        report.errors.sort(key=lambda error: error['row'])
+        return report
+
+    def _validate_chunk(self, chunk, report):
+        valid = []
+        for row_number, row in chunk:
+            if '__invalid__' in row:
+                report.add_error(row_number, {'non_field_errors': ['Row is not a JSON object']})
+                continue
+            serializer = BulkUserRowSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((row_number, serializer.validated_data))
+            else:
+                report.add_error(row_number, serializer.errors)
+
+        # Uniqueness within the chunk and against the database, one query per key
+        unique_keys = (
+            ('username', User.objects, 'username'),
+            ('student_id', StudentProfile.objects, 'student_id'),
+            ('employee_id', TeacherProfile.objects, 'employee_id'),
+        )
+        for field, manager, lookup in unique_keys:
+            values = [data[field] for _, data in valid if data.get(field)]
+            if not values:
+                continue
+            taken = set(manager.filter(**{f'{lookup}__in': values}).values_list(lookup, flat=True))
+
+            seen = set()
+            kept = []
+            for row_number, data in valid:
+                value = data.get(field)
+                if value and (value in taken or value in seen):
+                    report.add_error(row_number, {field: [f'{field} "{value}" already exists']})
+                    continue
+                if value:
+                    seen.add(value)
+                kept.append((row_number, data))
+            valid = kept
+
+        return valid
+
+    def _hash_passwords(self, valid):
+        passwords = [data.get('password') or None for _, data in valid]
+        hashed = iter(self.hashing_pool.hash_passwords(password for password in passwords if password))
+
+        result = []
+        for (_, data), password in zip(valid, passwords):
+            if password:
+                result.append(next(hashed))
+            else:
+                result.append(data.get('password_hash') or make_password(None))
+        return result
+
+    def _build(self, data, password_hash):
+        user = User(
+            username=data['username'],
+            email=data.get('email', ''),
+            first_name=data.get('first_name', ''),
+            last_name=data.get('last_name', ''),
+            user_type=data['user_type'],
+            phone=data.get('phone'),
+            password=password_hash,
+        )
+
+        profile = None
+        if data.get('student_id'):
+            profile = StudentProfile(**{field: data.get(field) for field in STUDENT_FIELDS})
+        elif data.get('employee_id'):
+            profile = TeacherProfile(**{field: data.get(field) for field in TEACHER_FIELDS})
+
+        return user, profile
+
+    def _write(self, entries):
+        users = User.objects.bulk_create([user for _, user, _ in entries])
+
+        students, teachers = [], []
+        for (_, _, profile), user in zip(entries, users):
+            if profile is None:
+                continue
+            profile.user = user
+            (students if isinstance(profile, StudentProfile) else teachers).append(profile)
+
+        StudentProfile.objects.bulk_create(students)
+        TeacherProfile.objects.bulk_create(teachers)
+
+        if self.create_tokens:
+            Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+
+        # bulk_create sends no signals, so keep the search index and change log in step here
+        index_users([user.pk for user in users])
+        record_upserts([*users, *students, *teachers])
+
+        return len(users)
+
+    def _import_chunk(self, chunk, report):
+        valid = self._validate_chunk(chunk, report)
+        if not valid:
+            return
+
+        hashes = self._hash_passwords(valid)
+        entries = [
+            (row_number, *self._build(data, password_hash))
+            for (row_number, data), password_hash in zip(valid, hashes)
+        ]
+
+        try:
+            with transaction.atomic():
+                report.created += self._write(entries)
+            return
+        except IntegrityError:
+            pass
+
+        for entry in entries:
+            row_number, user, profile = entry
+            user.pk = None
+            if profile is not None:
+                profile.pk = None
+            try:
+                with transaction.atomic():
+                    report.created += self._write([entry])
+            except IntegrityError as exc:
+                report.add_error(row_number, {'non_field_errors': [str(exc)]})
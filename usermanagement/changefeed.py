@@ -0,0 +1,192 @@
+import base64
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from usermanagement.models import ChangeLogEntry, User, StudentProfile, TeacherProfile
+
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def object_type_for(instance):
+    if isinstance(instance, User):
+        return 'user'
+    if isinstance(instance, StudentProfile):
+        return 'student_profile'
+    if isinstance(instance, TeacherProfile):
+        return 'teacher_profile'
+    raise TypeError(f"No change feed type for {type(instance).__name__}")
+
+
+def _owner_id(instance):
+    return instance.pk if isinstance(instance, User) else instance.user_id
+
+
+def change_key(instance):
+    """
+    (object type, object id, owner user id) of a logged model instance
+    """
+    return object_type_for(instance), instance.pk, _owner_id(instance)
+
+
+def record_changes(changes):
+    """
+    Log (object type, object id, user id, action) tuples in one insert
+    """
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(object_type=object_type, object_id=object_id, user_id=user_id, action=action)
+        for object_type, object_id, user_id, action in changes
+    ])
+
+
+def record_upserts(instances):
+    """
+    Log many creations at once (for bulk_create, which sends no signals)
+    """
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(
+            object_type=object_type_for(instance),
+            object_id=instance.pk,
+            user_id=_owner_id(instance),
+            action='upsert',
+        )
+        for instance in instances
+    ])
+
+
+def encode_cursor(entry_id):
+    return base64.urlsafe_b64encode(f'c:{entry_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        prefix, entry_id = base64.urlsafe_b64decode(padded).decode().split(':')
+        if prefix != 'c':
+            raise ValueError
+        return int(entry_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+
+def _load_objects(entries):
+    """
+    Current state of every object referenced by upserts, one query per type
+    """
+    from usermanagement.api.serializers import (
+        StudentProfileSerializer,
+        TeacherProfileSerializer,
+        UserProfileSerializer,
+    )
+
+    wanted = {'user': set(), 'student_profile': set(), 'teacher_profile': set()}
+    for entry in entries:
+        if entry.action == 'upsert':
+            wanted[entry.object_type].add(entry.object_id)
+
+    loaders = {
+        'user': (User.objects.with_profiles(), UserProfileSerializer),
+        'student_profile': (StudentProfile.objects.all(), StudentProfileSerializer),
+        'teacher_profile': (TeacherProfile.objects.all(), TeacherProfileSerializer),
+    }
+
+    documents = {}
+    for object_type, ids in wanted.items():
+        if not ids:
+            continue
+        queryset, serializer_class = loaders[object_type]
+        for obj in queryset.filter(pk__in=ids):
+            documents[(object_type, obj.pk)] = serializer_class(obj).data
+    return documents
+
+
+def _commit_lag():
+    return getattr(settings, 'CHANGE_FEED_COMMIT_LAG', 5)
+
+
+def read_changes(cursor=None, limit=DEFAULT_LIMIT):
+    """
+    Changes after `cursor`, collapsed to the latest entry per object.
+
+    Returns (changes, next cursor, has more). The next cursor is always
+    set, so a consumer can poll with it even when nothing changed; has more
+    is true when the page was full and the consumer should read again
+    right away.
+
+    The cursor is an entry id. SQLite serializes writers, so entries become
+    visible in id order. Backends with concurrent writers (PostgreSQL,
+    MySQL) can commit a lower id after a higher one, so there entries
+    younger than CHANGE_FEED_COMMIT_LAG seconds are held back. A transaction
+    that stays open longer than that after logging a change can still be
+    skipped by consumers.
+    """
+    after_id = decode_cursor(cursor)
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    queryset = ChangeLogEntry.objects.filter(id__gt=after_id)
+    if connection.vendor != 'sqlite':
+        queryset = queryset.filter(changed_at__lte=timezone.now() - timedelta(seconds=_commit_lag()))
+    entries = list(queryset.order_by('id')[:limit])
+    if not entries:
+        return [], encode_cursor(after_id), False
+
+    latest = {}
+    for entry in entries:
+        latest[(entry.object_type, entry.object_id)] = entry
+    collapsed = sorted(latest.values(), key=lambda entry: entry.id)
+
+    documents = _load_objects(collapsed)
+    changes = []
+    for entry in collapsed:
+        changes.append({
+            'object_type': entry.object_type,
+            'object_id': entry.object_id,
+            'user_id': entry.user_id,
+            'action': entry.action,
+            'changed_at': entry.changed_at,
+            'data': documents.get((entry.object_type, entry.object_id)),
+        })
+
+    return changes, encode_cursor(entries[-1].id), len(entries) == limit
+
+
+def compact(older_than=timedelta(days=30), tombstones_older_than=timedelta(days=90)):
+    """
+    Drop entries older than `older_than` that a newer entry for the same
+    object supersedes, and tombstones older than `tombstones_older_than`.
+    Returns the number of entries removed.
+
+    Consumers must read the feed at least once per tombstone retention
+    window, or they can miss deletions.
+    """
+    now = timezone.now()
+    latest_ids = (
+        ChangeLogEntry.objects
+        .values('object_type', 'object_id')
+        .annotate(last_id=Max('id'))
+        .values('last_id')
+    )
+
+    superseded, _ = (
+        ChangeLogEntry.objects
+        .filter(changed_at__lt=now - older_than)
+        .exclude(id__in=latest_ids)
+        .delete()
+    )
+    tombstones, _ = (
+        ChangeLogEntry.objects
+        .filter(action='delete', changed_at__lt=now - tombstones_older_than)
+        .delete()
+    )
+    return superseded + tombstones
@@ -0,0 +1,94 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from usermanagement.models import User
+
+
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('username', 'username'),
+    ('email', 'email'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('user_type', 'user_type'),
+    ('phone', 'phone'),
+    ('avatar', 'avatar'),
+    ('is_verified', 'is_verified'),
+    ('is_active', 'is_active'),
+    ('date_joined', 'date_joined'),
+    ('last_login', 'last_login'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('student_id', 'student_profile__student_id'),
+    ('grade', 'student_profile__grade'),
+    ('major', 'student_profile__major'),
+    ('enrollment_date', 'student_profile__enrollment_date'),
+    ('employee_id', 'teacher_profile__employee_id'),
+    ('department', 'teacher_profile__department'),
+    ('specialization', 'teacher_profile__specialization'),
+    ('hire_date', 'teacher_profile__hire_date'),
+]
+EXPORT_FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def iter_export_rows(since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield one tuple per user, profiles joined in, in primary key order.
+
+    `since` keeps users whose own row or either profile was updated at or
+    after it. Rows are fetched with a server-side cursor (chunked fetches on
+    SQLite), so memory use does not grow with the table.
+    """
+    queryset = User.objects.order_by('pk')
+    if since is not None:
+        queryset = queryset.filter(
+            Q(updated_at__gte=since)
+            | Q(student_profile__updated_at__gte=since)
+            | Q(teacher_profile__updated_at__gte=since)
+        )
+    return queryset.values_list(*(lookup for _, lookup in EXPORT_COLUMNS)).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """
+    File-like object whose write() returns the line, for streaming csv.writer
+    """
+    def write(self, value):
+        return value
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([_format_value(value) for value in row])
+
+
+def iter_jsonl(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def iter_export(fmt, since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Encoded export lines in the given format
+    """
+    rows = iter_export_rows(since=since, chunk_size=chunk_size)
+    if fmt == 'csv':
+        return iter_csv(rows)
+    if fmt == 'jsonl':
+        return iter_jsonl(rows)
+    raise ValueError(f"Unsupported export format: {fmt}")
@@ -0,0 +1,590 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+import weakref
+
+import httpx
+import jwt
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from requests.adapters import HTTPAdapter
+from rest_framework.authtoken.models import Token
+
+from core.cache import LRUCache
+
+
+GOOGLE_AUTH_DEFAULTS = {
+    'USERINFO_URL': 'https://www.googleapis.com/oauth2/v2/userinfo',
+    'CONNECT_TIMEOUT': 2.0,
+    'READ_TIMEOUT': 5.0,
+    'POOL_SIZE': 20,
+    'CACHE_TTL': 60,
+    'CACHE_MAX_ENTRIES': 5000,
+    'BREAKER_FAILURE_THRESHOLD': 5,
+    'BREAKER_RESET_TIMEOUT': 30,
+    'CLIENT_ID': None,
+    'JWKS_URL': 'https://www.googleapis.com/oauth2/v3/certs',
+    'JWKS_FILE': None,
+    'JWKS_DEFAULT_TTL': 3600,
+    'JWKS_MIN_REFRESH_INTERVAL': 60,
+    'ID_TOKEN_ISSUERS': ['accounts.google.com', 'https://accounts.google.com'],
+    'ID_TOKEN_LEEWAY': 30,
+    'SUB_CACHE_ALIAS': 'default',
+    'SUB_CACHE_TTL': 86400,
+}
+
+
+def get_google_auth_setting(name):
+    return getattr(settings, 'GOOGLE_AUTH', {}).get(name, GOOGLE_AUTH_DEFAULTS[name])
+
+
+class GoogleAuthError(Exception):
+    """
+    Base error for Google token validation
+    """
+
+
+class InvalidGoogleToken(GoogleAuthError):
+    """
+    Google rejected the token
+    """
+
+
+class GoogleUnavailable(GoogleAuthError):
+    """
+    Google could not be reached, timed out, or the circuit breaker is open
+    """
+
+
+class UnverifiedGoogleEmail(GoogleAuthError):
+    """
+    An existing account has the email, but Google has not verified that
+    the Google user owns it
+    """
+
+
+class GoogleAccountConflict(GoogleAuthError):
+    """
+    A new account for the Google user would reuse the username or email of
+    an account linked to another Google user (or not linkable by email)
+    """
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row calls are refused for
+    `reset_timeout` seconds, then a single trial call is let through.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight:
+                return False
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class GoogleUserInfoClient:
+    """
+    Outbound client for the Google userinfo endpoint.
+
+    Keeps a pooled keep-alive session, applies connect/read timeouts, trips a
+    circuit breaker when Google misbehaves and caches successful lookups for
+    a short TTL so retried logins skip the round trip.
+    """
+
+    def __init__(self, userinfo_url=None, connect_timeout=None, read_timeout=None,
+                 pool_size=None, cache_ttl=None, cache_max_entries=None,
+                 failure_threshold=None, reset_timeout=None):
+        self.userinfo_url = userinfo_url or get_google_auth_setting('USERINFO_URL')
+        self.timeout = (
+            connect_timeout or get_google_auth_setting('CONNECT_TIMEOUT'),
+            read_timeout or get_google_auth_setting('READ_TIMEOUT'),
+        )
+
+        self.pool_size = pool_size = pool_size or get_google_auth_setting('POOL_SIZE')
+        self.session = requests.Session()
+        self._async_clients = weakref.WeakKeyDictionary()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.cache = LRUCache(
+            max_entries=cache_max_entries or get_google_auth_setting('CACHE_MAX_ENTRIES'),
+            ttl=cache_ttl if cache_ttl is not None else get_google_auth_setting('CACHE_TTL'),
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=failure_threshold or get_google_auth_setting('BREAKER_FAILURE_THRESHOLD'),
+            reset_timeout=reset_timeout or get_google_auth_setting('BREAKER_RESET_TIMEOUT'),
+        )
+
+    @staticmethod
+    def _cache_key(access_token):
+        # Only a digest of the token is kept in memory
+        return hashlib.sha256(access_token.encode()).hexdigest()
+
+    def _cached(self, cache_key):
+        user_data = self.cache.get(cache_key)
+        if user_data is not None:
+            return dict(user_data)
+
+        if not self.breaker.allow():
+            raise GoogleUnavailable('Google userinfo circuit is open')
+        return None
+
+    def _handle_response(self, cache_key, status_code, parse_json):
+        if status_code >= 500:
+            self.breaker.record_failure()
+            raise GoogleUnavailable(f'Google returned {status_code}')
+
+        # A 4xx answer is a healthy upstream rejecting a bad token
+        self.breaker.record_success()
+
+        if status_code != 200:
+            raise InvalidGoogleToken('Invalid access token')
+
+        try:
+            user_data = parse_json()
+        except ValueError as exc:
+            raise InvalidGoogleToken('Invalid access token') from exc
+
+        if 'error' in user_data or 'email' not in user_data or 'id' not in user_data:
+            raise InvalidGoogleToken('Invalid access token')
+
+        self.cache.set(cache_key, user_data)
+        return dict(user_data)
+
+    def get_userinfo(self, access_token):
+        cache_key = self._cache_key(access_token)
+        user_data = self._cached(cache_key)
+        if user_data is not None:
+            return user_data
+
+        try:
+            response = self.session.get(
+                self.userinfo_url,
+                headers={'Authorization': f'Bearer {access_token}'},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as exc:
+            self.breaker.record_failure()
+            raise GoogleUnavailable(str(exc)) from exc
+
+        return self._handle_response(cache_key, response.status_code, response.json)
+
+    def _async_client(self):
+        # httpx clients are bound to the event loop they were first used on
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aget_userinfo(self, access_token):
+        """
+        `get_userinfo` on a non-blocking HTTP client, for async views
+        """
+        cache_key = self._cache_key(access_token)
+        user_data = self._cached(cache_key)
+        if user_data is not None:
+            return user_data
+
+        try:
+            response = await self._async_client().get(
+                self.userinfo_url,
+                headers={'Authorization': f'Bearer {access_token}'},
+            )
+        except httpx.HTTPError as exc:
+            self.breaker.record_failure()
+            raise GoogleUnavailable(str(exc)) from exc
+
+        return self._handle_response(cache_key, response.status_code, response.json)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_userinfo_client():
+    """
+    Return the process-wide Google userinfo client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GoogleUserInfoClient()
+    return _client
+
+
+class GoogleKeySet:
+    """
+    Google's ID-token signing keys, cached by `kid`.
+
+    The key set is refetched when the `Cache-Control: max-age` of the last
+    response runs out, or early when a token names an unknown `kid` (Google
+    rotated its keys), at most once per `min_refresh_interval` seconds.
+    Keys can also be loaded from a local JWKS file.
+    """
+
+    def __init__(self, jwks_url=None, jwks_file=None, default_ttl=None,
+                 min_refresh_interval=None, session=None, timeout=None):
+        self.jwks_url = jwks_url or get_google_auth_setting('JWKS_URL')
+        self.jwks_file = jwks_file or get_google_auth_setting('JWKS_FILE')
+        self.default_ttl = default_ttl or get_google_auth_setting('JWKS_DEFAULT_TTL')
+        self.min_refresh_interval = (
+            min_refresh_interval if min_refresh_interval is not None
+            else get_google_auth_setting('JWKS_MIN_REFRESH_INTERVAL')
+        )
+        self.session = session or requests.Session()
+        self.timeout = timeout or (
+            get_google_auth_setting('CONNECT_TIMEOUT'),
+            get_google_auth_setting('READ_TIMEOUT'),
+        )
+        self._keys = {}
+        self._expires_at = 0
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self.jwks_file:
+            with open(self.jwks_file) as fh:
+                return json.load(fh), self.default_ttl
+
+        try:
+            response = self.session.get(self.jwks_url, timeout=self.timeout)
+            response.raise_for_status()
+            jwks = response.json()
+        except (requests.RequestException, ValueError) as exc:
+            raise GoogleUnavailable(f'Unable to fetch Google signing keys: {exc}') from exc
+
+        ttl = self.default_ttl
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+        if match:
+            ttl = int(match.group(1))
+        return jwks, ttl
+
+    def _refresh(self):
+        jwks, ttl = self._load()
+        keys = {}
+        for jwk in jwks.get('keys', []):
+            try:
+                keys[jwk['kid']] = jwt.PyJWK(jwk)
+            except (KeyError, jwt.PyJWKError):
+                continue
+        now = time.monotonic()
+        self._keys = keys
+        self._fetched_at = now
+        self._expires_at = now + ttl
+
+    def cached_key(self, kid):
+        """
+        The key for `kid` if it is cached and fresh, without refreshing
+        """
+        key = self._keys.get(kid)
+        return key if key is not None and time.monotonic() < self._expires_at else None
+
+    def get_key(self, kid):
+        key = self._keys.get(kid)
+        if key is not None and time.monotonic() < self._expires_at:
+            return key
+
+        with self._lock:
+            now = time.monotonic()
+            expired = now >= self._expires_at
+            may_refresh = (
+                self._fetched_at is None
+                or now - self._fetched_at >= self.min_refresh_interval
+            )
+            if expired or (kid not in self._keys and may_refresh):
+                self._refresh()
+
+        key = self._keys.get(kid)
+        if key is None:
+            raise InvalidGoogleToken('Unknown signing key')
+        return key
+
+
+class GoogleIdTokenVerifier:
+    """
+    Verifies Google ID tokens (JWTs) locally: signature, audience, issuer and
+    expiry. Only the signing keys are fetched, and those are cached.
+
+    Verified claims are returned in the same shape as the userinfo endpoint.
+    """
+
+    def __init__(self, client_id=None, issuers=None, leeway=None, key_set=None):
+        client_id = client_id or get_google_auth_setting('CLIENT_ID')
+        if isinstance(client_id, str):
+            client_id = [client_id]
+        self.audience = list(client_id or [])
+        self.issuers = issuers or get_google_auth_setting('ID_TOKEN_ISSUERS')
+        self.leeway = leeway if leeway is not None else get_google_auth_setting('ID_TOKEN_LEEWAY')
+        self.key_set = key_set or GoogleKeySet()
+
+    @property
+    def enabled(self):
+        return bool(self.audience)
+
+    def _header(self, id_token):
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.InvalidTokenError as exc:
+            raise InvalidGoogleToken('Invalid ID token') from exc
+
+        if header.get('alg') != 'RS256' or 'kid' not in header:
+            raise InvalidGoogleToken('Invalid ID token')
+        return header
+
+    def _decode(self, id_token, key):
+        try:
+            claims = jwt.decode(
+                id_token,
+                key=key.key,
+                algorithms=['RS256'],
+                audience=self.audience,
+                issuer=self.issuers,
+                leeway=self.leeway,
+                options={'require': ['exp', 'iat', 'iss', 'aud', 'sub']},
+            )
+        except jwt.InvalidTokenError as exc:
+            raise InvalidGoogleToken('Invalid ID token') from exc
+
+        if 'email' not in claims:
+            raise InvalidGoogleToken('Invalid ID token')
+
+        return {
+            'id': claims['sub'],
+            'email': claims['email'],
+            # Google has sent this claim as the string "true"
+            'verified_email': claims.get('email_verified') in (True, 'true'),
+            'given_name': claims.get('given_name', ''),
+            'family_name': claims.get('family_name', ''),
+            'picture': claims.get('picture', ''),
+        }
+
+    def verify(self, id_token):
+        header = self._header(id_token)
+        return self._decode(id_token, self.key_set.get_key(header['kid']))
+
+    async def averify(self, id_token):
+        """
+        `verify` for async views. Verification is local; only a key set
+        refresh (rare) runs in a thread.
+        """
+        header = self._header(id_token)
+        key = self.key_set.cached_key(header['kid'])
+        if key is None:
+            key = await sync_to_async(self.key_set.get_key, thread_sensitive=False)(header['kid'])
+        return self._decode(id_token, key)
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_id_token_verifier():
+    """
+    Return the process-wide Google ID-token verifier
+    """
+    global _verifier
+    if _verifier is None:
+        # Shares the userinfo client's pooled session; get it before taking
+        # our own lock, as it takes _client_lock itself
+        session = get_userinfo_client().session
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = GoogleIdTokenVerifier(key_set=GoogleKeySet(session=session))
+    return _verifier
+
+
+def _sub_cache_key(sub):
+    return f'google:sub:{sub}'
+
+
+def _sub_cache():
+    return caches[get_google_auth_setting('SUB_CACHE_ALIAS')]
+
+
+def _cached_sign_in(sub):
+    """
+    Resolve a returning Google user from the sub -> (user id, token) cache.
+    The user comes from the token auth cache when possible, so this usually
+    touches no table at all.
+    """
+    from usermanagement.authentication import cache_token, get_cached_token
+
+    cached = _sub_cache().get(_sub_cache_key(sub))
+    if cached is None:
+        return None
+
+    user_id, token_key = cached
+    token = get_cached_token(token_key)
+    if token is None:
+        read_at = time.time()
+        token = (
+            Token.objects
+            .select_related('user__student_profile', 'user__teacher_profile')
+            .filter(key=token_key, user_id=user_id)
+            .first()
+        )
+        if token is None:
+            # Logged out since; fall back to the slow path
+            return None
+        if token.user.is_active:
+            cache_token(token, read_at)
+
+    return token.user, token
+
+
+def _create_google_user(user_data):
+    from usermanagement.models import User
+
+    user = User(
+        username=user_data['email'],
+        email=user_data['email'],
+        first_name=user_data.get('given_name', ''),
+        last_name=user_data.get('family_name', ''),
+        is_verified=user_data.get('verified_email', False),
+        avatar=user_data.get('picture', ''),
+        google_sub=user_data['id'],
+    )
+    user.set_unusable_password()
+    user.save(force_insert=True)
+    user.prime_profile_cache()
+    return user
+
+
+def sign_in_google_user(user_data):
+    """
+    Find or create the account for verified Google user data.
+    Returns (user, token, created).
+
+    Returning users are served from the sub cache. Otherwise the account is
+    looked up by `google_sub`, then linked by email for accounts created
+    before subjects were stored (only when Google verified the email,
+    UnverifiedGoogleEmail otherwise), and finally created together with its token
+    in one transaction. A concurrent first login for the same subject loses
+    on the unique index and picks up the winner's account; a clash with
+    another account's username or email raises GoogleAccountConflict.
+    """
+    from usermanagement.models import User
+
+    sub = user_data['id']
+    resolved = _cached_sign_in(sub)
+    if resolved is not None:
+        user, token = resolved
+        return user, token, False
+
+    created = False
+    user = User.objects.with_profiles().filter(google_sub=sub).first()
+
+    if user is None:
+        user = User.objects.with_profiles().filter(email=user_data['email'], google_sub__isnull=True).first()
+        if user is not None:
+            # Linking hands the account to whoever controls the Google
+            # identity, so the email must be proven theirs
+            if user_data.get('verified_email') is not True:
+                raise UnverifiedGoogleEmail('Google has not verified this email address')
+            user.google_sub = sub
+            user.save(update_fields=['google_sub', 'updated_at'])
+
+    if user is None:
+        try:
+            with transaction.atomic():
+                user = _create_google_user(user_data)
+                token = Token.objects.create(user=user)
+            created = True
+        except IntegrityError:
+            user = User.objects.with_profiles().filter(google_sub=sub).first()
+            if user is None:
+                # The collision was on username or email, not the subject
+                raise GoogleAccountConflict('Another account already uses this email address')
+
+    if not created:
+        token, _ = Token.objects.get_or_create(user=user)
+
+    _sub_cache().set(_sub_cache_key(sub), (user.pk, token.key), get_google_auth_setting('SUB_CACHE_TTL'))
+    return user, token, created
+
+
+async def _acached_sign_in(sub):
+    """
+    `_cached_sign_in` on the async cache and ORM APIs
+    """
+    from usermanagement.authentication import acache_token, aget_cached_token
+
+    cached = await _sub_cache().aget(_sub_cache_key(sub))
+    if cached is None:
+        return None
+
+    user_id, token_key = cached
+    token = await aget_cached_token(token_key)
+    if token is None:
+        read_at = time.time()
+        token = await (
+            Token.objects
+            .select_related('user__student_profile', 'user__teacher_profile')
+            .filter(key=token_key, user_id=user_id)
+            .afirst()
+        )
+        if token is None:
+            return None
+        if token.user.is_active:
+            await acache_token(token, read_at)
+
+    return token.user, token
+
+
+async def asign_in_google_user(user_data):
+    """
+    `sign_in_google_user` for async views. Returning users are resolved
+    without leaving the event loop; first sign-ins and account linking
+    run the transactional sync path in a thread.
+    """
+    resolved = await _acached_sign_in(user_data['id'])
+    if resolved is not None:
+        user, token = resolved
+        return user, token, False
+    return await sync_to_async(sign_in_google_user)(user_data)
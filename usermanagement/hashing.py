@@ -0,0 +1,285 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+PASSWORD_HASHING_DEFAULTS = {
+    'WORKERS': None,
+    'MAX_PENDING': 64,
+    'TIMEOUT': 10,
+    'START_METHOD': 'spawn',
+}
+
+
+def get_password_hashing_setting(name):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, PASSWORD_HASHING_DEFAULTS[name])
+
+
+class HashingOverloaded(APIException):
+    """
+    Too many password hashes are queued; the client should retry shortly
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, please retry shortly.'
+    default_code = 'hashing_overloaded'
+    wait = 1
+
+
+def _init_worker():
+    django.setup()
+
+
+def _make_password(raw_password):
+    return make_password(raw_password)
+
+
+def _make_passwords(raw_passwords):
+    return [make_password(raw_password) for raw_password in raw_passwords]
+
+
+def _check_password(raw_password, encoded):
+    upgraded = []
+    valid = check_password(raw_password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return valid, (upgraded[0] if upgraded else None)
+
+
+class PasswordHashingPool:
+    """
+    Runs password hashing and verification in a bounded process pool so
+    CPU-bound PBKDF2 work does not pin request workers.
+
+    At most `max_pending` operations may be queued or running; beyond that
+    callers get HashingOverloaded (HTTP 503) immediately instead of waiting.
+    `workers=0` hashes inline on the calling thread, still under admission
+    control.
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=None, start_method=None):
+        workers = workers if workers is not None else get_password_hashing_setting('WORKERS')
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending or get_password_hashing_setting('MAX_PENDING')
+        self.timeout = timeout or get_password_hashing_setting('TIMEOUT')
+        self.start_method = start_method or get_password_hashing_setting('START_METHOD')
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._busy_seconds = 0.0
+
+    def start(self):
+        """
+        Start the worker processes now rather than on first use
+        """
+        with self._lock:
+            if self._executor is None and self.workers:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                )
+                # Spawn the workers up front; ProcessPoolExecutor starts them lazily
+                for _ in range(self.workers):
+                    self._executor.submit(int)
+        return self
+
+    def _get_executor(self):
+        executor = self._executor
+        return executor if executor is not None else self.start()._executor
+
+    def _reset_executor(self):
+        # A worker died; drop the pool so the next call starts a fresh one
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._reset_executor()
+
+    def stats(self):
+        """
+        Queue-depth and throughput counters
+        """
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'busy_seconds': round(self._busy_seconds, 3),
+            }
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HashingOverloaded()
+            self._pending += 1
+            self._submitted += 1
+
+    def _release(self, started):
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+            self._busy_seconds += time.monotonic() - started
+
+    def _submit(self, fn, *args):
+        """
+        Admit and submit `fn`; returns a concurrent.futures.Future
+        """
+        self._admit()
+        started = time.monotonic()
+
+        if not self.workers:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as exc:
+                future.set_exception(exc)
+            finally:
+                self._release(started)
+            return future
+
+        submitted = False
+        try:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                self._reset_executor()
+                future = self._get_executor().submit(fn, *args)
+            submitted = True
+        finally:
+            # Nothing will complete to release the slot if both submits failed
+            if not submitted:
+                self._release(started)
+        future.add_done_callback(lambda _: self._release(started))
+        return future
+
+    def _timed_out_error(self, future):
+        future.cancel()
+        with self._lock:
+            self._timed_out += 1
+        return HashingOverloaded()
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise self._timed_out_error(future)
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise HashingOverloaded()
+
+    async def _await(self, future):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out_error(future)
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise HashingOverloaded()
+
+    def hash_password(self, raw_password):
+        return self._wait(self._submit(_make_password, raw_password))
+
+    def hash_passwords(self, raw_passwords, chunk_size=10):
+        """
+        Hash many passwords (bulk imports), in order.
+
+        Chunks of `chunk_size` are admitted like single hashes, with at most
+        one chunk per worker in flight, so logins keep their share of the
+        pool. When the pool is full the batch waits instead of failing, and
+        no per-call timeout applies.
+        """
+        raw_passwords = list(raw_passwords)
+        chunks = [raw_passwords[i:i + chunk_size] for i in range(0, len(raw_passwords), chunk_size)]
+        hashed = [None] * len(chunks)
+        in_flight = {}
+        next_chunk = 0
+
+        while next_chunk < len(chunks) or in_flight:
+            while next_chunk < len(chunks) and len(in_flight) < max(self.workers, 1):
+                try:
+                    future = self._submit(_make_passwords, chunks[next_chunk])
+                except HashingOverloaded:
+                    break
+                in_flight[future] = next_chunk
+                next_chunk += 1
+
+            if not in_flight:
+                time.sleep(0.05)
+                continue
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = in_flight.pop(future)
+                try:
+                    hashed[index] = future.result()
+                except BrokenProcessPool:
+                    self._reset_executor()
+                    raise HashingOverloaded()
+
+        return [encoded for chunk in hashed for encoded in chunk]
+
+    def verify_password(self, raw_password, encoded):
+        """
+        Return (valid, upgraded hash or None). The upgraded hash is set when
+        the stored hash uses outdated parameters and should be saved.
+        """
+        return self._wait(self._submit(_check_password, raw_password, encoded))
+
+    def check_user_password(self, user, raw_password):
+        """
+        Verify a user's password, saving an upgraded hash if one was produced
+        """
+        valid, upgraded = self.verify_password(raw_password, user.password)
+        if valid and upgraded:
+            user.password = upgraded
+            user.save(update_fields=['password'])
+        return valid
+
+    async def acheck_user_password(self, user, raw_password):
+        valid, upgraded = await self.averify_password(raw_password, user.password)
+        if valid and upgraded:
+            user.password = upgraded
+            await user.asave(update_fields=['password'])
+        return valid
+
+    async def ahash_password(self, raw_password):
+        return await self._await(self._submit(_make_password, raw_password))
+
+    async def averify_password(self, raw_password, encoded):
+        return await self._await(self._submit(_check_password, raw_password, encoded))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    """
+    Return the process-wide password hashing pool
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordHashingPool()
+    return _pool
@@ -0,0 +1,42 @@
+import datetime
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from usermanagement.models import User, StudentProfile
+from usermanagement.api.compiled import compile_serializer
+from usermanagement.api.serializers import UserProfileSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare UserProfileSerializer with its compiled counterpart (no database needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000, help='Serializations per timing run')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        user = User(
+            id=1, username='john_doe', email='john.doe@example.com', first_name='John', last_name='Doe',
+            user_type='student', phone='+1234567890', is_verified=True, date_joined=now, last_login=now,
+        )
+        user.prime_profile_cache(student_profile=StudentProfile(
+            id=1, user=user, student_id='STU001', grade='10th Grade', major='Computer Science',
+            enrollment_date=datetime.date(2025, 1, 1),
+        ))
+        compiled = compile_serializer(UserProfileSerializer)
+
+        cases = [
+            ('UserProfileSerializer(user).data', lambda: UserProfileSerializer(user).data),
+            ('compiled.to_representation(user)', lambda: compiled.to_representation(user)),
+        ]
+        timings = {}
+        for label, fn in cases:
+            best = min(timeit.repeat(fn, number=options['number'], repeat=options['repeat']))
+            timings[label] = best / options['number'] * 1e6
+            self.stdout.write(f'{label:40} {timings[label]:8.1f} us/op')
+
+        drf, fast = (timings[label] for label, _ in cases)
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {drf / fast:.1f}x'))
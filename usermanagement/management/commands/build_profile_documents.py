@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from usermanagement.profile_documents import backfill_documents
+
+
+class Command(BaseCommand):
+    help = 'Build the pre-rendered profile document of every user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = backfill_documents(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Built {written} profile documents'))
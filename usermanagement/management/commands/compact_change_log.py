@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from usermanagement.changefeed import compact
+
+
+class Command(BaseCommand):
+    help = 'Compact the user/profile change log behind the change feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=30,
+                            help='Drop superseded entries older than this')
+        parser.add_argument('--tombstone-days', type=int, default=90,
+                            help='Drop deletion tombstones older than this')
+
+    def handle(self, *args, **options):
+        removed = compact(
+            older_than=timedelta(days=options['older_than_days']),
+            tombstones_older_than=timedelta(days=options['tombstone_days']),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} change log entries'))
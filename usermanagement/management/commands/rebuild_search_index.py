@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from usermanagement.search import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over users and profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            self.stdout.write('This database has no full-text index; search uses icontains lookups.')
+            return
+
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} users'))
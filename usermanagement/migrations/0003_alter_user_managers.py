@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-18 02:31
+
+import usermanagement.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usermanagement', '0002_alter_studentprofile_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', usermanagement.models.UserManager()),
+            ],
+        ),
+    ]
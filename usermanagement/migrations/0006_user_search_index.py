@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+COLUMNS = (
+    'username, email, first_name, last_name, student_id, grade, major, '
+    'employee_id, department, specialization'
+)
+
+
+def create_search_table(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends search with icontains instead
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE usermanagement_user_search USING fts5({COLUMNS}, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO usermanagement_user_search (rowid, {COLUMNS}) "
+        "SELECT u.id, u.username, u.email, u.first_name, u.last_name, "
+        "COALESCE(s.student_id, ''), COALESCE(s.grade, ''), COALESCE(s.major, ''), "
+        "COALESCE(t.employee_id, ''), COALESCE(t.department, ''), COALESCE(t.specialization, '') "
+        "FROM usermanagement_user u "
+        "LEFT JOIN usermanagement_studentprofile s ON s.user_id = u.id "
+        "LEFT JOIN usermanagement_teacherprofile t ON t.user_id = u.id"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS usermanagement_user_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usermanagement', '0005_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usermanagement', '0006_user_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='teacherprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Updated At'),
+        ),
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(choices=[('user', 'User'), ('student_profile', 'Student Profile'), ('teacher_profile', 'Teacher Profile')], max_length=20, verbose_name='Object Type')),
+                ('object_id', models.BigIntegerField(verbose_name='Object ID')),
+                ('user_id', models.BigIntegerField(verbose_name='User ID')),
+                ('action', models.CharField(choices=[('upsert', 'Created or Updated'), ('delete', 'Deleted')], max_length=10, verbose_name='Action')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, verbose_name='Changed At')),
+            ],
+            options={
+                'verbose_name': 'Change Log Entry',
+                'verbose_name_plural': 'Change Log Entries',
+                'indexes': [models.Index(fields=['object_type', 'object_id', 'id'], name='changelog_object_idx'), models.Index(fields=['changed_at'], name='changelog_changed_at_idx')],
+            },
+        ),
+    ]
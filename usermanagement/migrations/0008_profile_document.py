@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 02:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usermanagement', '0007_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileDocument',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile_document', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.CharField(max_length=40, verbose_name='Version')),
+                ('document', models.TextField(verbose_name='Document')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Profile Document',
+                'verbose_name_plural': 'Profile Documents',
+            },
+        ),
+    ]
@@ -1,5 +1,22 @@
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
+
+
+class UserManager(BaseUserManager):
+    """
+    User manager that can load users together with both profiles
+    """
+    profile_relations = ('student_profile', 'teacher_profile')
+
+    def with_profiles(self, relations=None):
+        relations = self.profile_relations if relations is None else relations
+        queryset = self.get_queryset()
+        # select_related() with no arguments would follow every relation
+        return queryset.select_related(*relations) if relations else queryset
+
+    def get_by_natural_key(self, username):
+        # Used by ModelBackend.authenticate, so logged-in users arrive with profiles
+        return self.with_profiles().get(**{self.model.USERNAME_FIELD: username})
 
 
 class User(AbstractUser):
@@ -33,6 +50,13 @@ class User(AbstractUser):
         default=False,
         verbose_name='Is Verified'
     )
+    google_sub = models.CharField(
+        max_length=255,
+        unique=True,
+        blank=True,
+        null=True,
+        verbose_name='Google Subject ID'
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Created At'
@@ -42,12 +66,29 @@ class User(AbstractUser):
         verbose_name='Updated At'
     )
     
+    objects = UserManager()
+    
     def __str__(self):
         return f"{self.username} ({self.get_user_type_display()})"
     
+    def prime_profile_cache(self, student_profile=None, teacher_profile=None):
+        """
+        Record the user's profiles (or their absence) so accessing them
+        does not query the database
+        """
+        User.student_profile.related.set_cached_value(self, student_profile)
+        User.teacher_profile.related.set_cached_value(self, teacher_profile)
+    
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            models.Index(fields=['email'], name='user_email_idx'),
+            # Keyset pagination for the directory, optionally narrowed by filter
+            models.Index(fields=['-created_at', '-id'], name='user_created_id_idx'),
+            models.Index(fields=['user_type', '-created_at', '-id'], name='user_type_created_id_idx'),
+            models.Index(fields=['is_verified', '-created_at', '-id'], name='user_verified_created_id_idx'),
+        ]
 
 
 class StudentProfile(models.Model):
@@ -79,6 +120,10 @@ class StudentProfile(models.Model):
         blank=True,
         verbose_name='Enrollment Date'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Updated At'
+    )
     
     def __str__(self):
         return f"{self.user.username} - {self.student_id}"
@@ -86,6 +131,10 @@ class StudentProfile(models.Model):
     class Meta:
         verbose_name = 'Student Profile'
         verbose_name_plural = 'Student Profiles'
+        indexes = [
+            models.Index(fields=['grade', 'user'], name='student_grade_user_idx'),
+            models.Index(fields=['major', 'user'], name='student_major_user_idx'),
+        ]
 
 
 class TeacherProfile(models.Model):
@@ -117,10 +166,96 @@ class TeacherProfile(models.Model):
         blank=True,
         verbose_name='Hire Date'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Updated At'
+    )
     
     def __str__(self):
         return f"{self.user.username} - {self.employee_id}"
     
     class Meta:
         verbose_name = 'Teacher Profile'
-        verbose_name_plural = 'Teacher Profiles'
\ No newline at end of file
+        verbose_name_plural = 'Teacher Profiles'
+        indexes = [
+            models.Index(fields=['department', 'user'], name='teacher_department_user_idx'),
+        ]
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Append-only record of user and profile changes, read by the change feed
+    """
+    OBJECT_TYPE_CHOICES = [
+        ('user', 'User'),
+        ('student_profile', 'Student Profile'),
+        ('teacher_profile', 'Teacher Profile'),
+    ]
+    ACTION_CHOICES = [
+        ('upsert', 'Created or Updated'),
+        ('delete', 'Deleted'),
+    ]
+    
+    object_type = models.CharField(
+        max_length=20,
+        choices=OBJECT_TYPE_CHOICES,
+        verbose_name='Object Type'
+    )
+    object_id = models.BigIntegerField(
+        verbose_name='Object ID'
+    )
+    # Plain column rather than a foreign key so tombstones outlive the user
+    user_id = models.BigIntegerField(
+        verbose_name='User ID'
+    )
+    action = models.CharField(
+        max_length=10,
+        choices=ACTION_CHOICES,
+        verbose_name='Action'
+    )
+    changed_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Changed At'
+    )
+    
+    def __str__(self):
+        return f"{self.action} {self.object_type} {self.object_id}"
+    
+    class Meta:
+        verbose_name = 'Change Log Entry'
+        verbose_name_plural = 'Change Log Entries'
+        indexes = [
+            models.Index(fields=['object_type', 'object_id', 'id'], name='changelog_object_idx'),
+            models.Index(fields=['changed_at'], name='changelog_changed_at_idx'),
+        ]
+
+
+class ProfileDocument(models.Model):
+    """
+    Pre-rendered UserProfileSerializer JSON for a user, rebuilt when read stale
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='profile_document'
+    )
+    # Profile ETag (without quotes) of the state the document was rendered from
+    version = models.CharField(
+        max_length=40,
+        verbose_name='Version'
+    )
+    document = models.TextField(
+        verbose_name='Document'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Updated At'
+    )
+    
+    def __str__(self):
+        return f"Profile document for user {self.user_id}"
+    
+    class Meta:
+        verbose_name = 'Profile Document'
+        verbose_name_plural = 'Profile Documents'
\ No newline at end of file
@@ -0,0 +1,136 @@
+from rest_framework.renderers import JSONRenderer
+
+from core.cache import get_tiered_cache
+from usermanagement.models import User, ProfileDocument
+
+
+_renderer = JSONRenderer()
+
+
+def _cache_key(user_id):
+    # Versioned by profile version, so stale documents are never read back
+    return f'profile_document:{user_id}'
+
+
+def render_document(user):
+    """
+    Return (version, JSON bytes) of the user's UserProfileSerializer output
+    """
+    from usermanagement.api.compiled import compile_serializer
+    from usermanagement.api.conditional import profile_version
+    from usermanagement.api.serializers import UserProfileSerializer
+
+    data = compile_serializer(UserProfileSerializer).to_representation(user)
+    return profile_version(user), _renderer.render(data)
+
+
+def save_document(user):
+    """
+    Render and store `user`'s document with a single upsert
+    """
+    version, document = render_document(user)
+    ProfileDocument.objects.bulk_create(
+        [ProfileDocument(user_id=user.pk, version=version, document=document.decode())],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['version', 'document', 'updated_at'],
+    )
+    get_tiered_cache().set(_cache_key(user.pk), document, version=version)
+    return document
+
+
+def rebuild_document(user_id):
+    """
+    Re-render one user's document from the database, or drop it if the
+    user no longer exists
+    """
+    user = User.objects.with_profiles().filter(pk=user_id).first()
+    if user is None:
+        ProfileDocument.objects.filter(user_id=user_id).delete()
+        return None
+    return save_document(user)
+
+
+def get_document(user):
+    """
+    Pre-rendered profile JSON for `user` (with its profiles loaded).
+
+    A stored document is only served while its version matches the user's
+    current profile version; otherwise it is re-rendered from `user` and saved.
+    This is the only place documents are written during requests: saves do
+    not rebuild them, the next read after a change does.
+    """
+    from usermanagement.api.conditional import profile_version
+
+    version = profile_version(user)
+
+    def load():
+        stored = ProfileDocument.objects.filter(user_id=user.pk).values_list('version', 'document').first()
+        if stored is not None and stored[0] == version:
+            return stored[1].encode()
+        return save_document(user)
+
+    return get_tiered_cache().get_or_set(_cache_key(user.pk), load, version=version)
+
+
+def render_with_document(data, document, key='user'):
+    """
+    Render `data` as JSONRenderer would, splicing the pre-rendered
+    `document` in as the value of `key`
+    """
+    parts = []
+    for name, value in data.items():
+        body = document if name == key else (b'null' if value is None else _renderer.render(value))
+        parts.append(_renderer.render(name) + b':' + body)
+    return b'{' + b','.join(parts) + b'}'
+
+
+def iter_stale_documents(batch_size=1000):
+    """
+    Yield (user id, problem) for every user whose stored document is
+    missing or does not match a fresh rendering
+    """
+    queryset = User.objects.with_profiles().select_related('profile_document').order_by('pk')
+    last_pk = 0
+    while True:
+        users = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not users:
+            return
+        for user in users:
+            try:
+                stored = user.profile_document
+            except ProfileDocument.DoesNotExist:
+                yield user.pk, 'missing'
+                continue
+            version, document = render_document(user)
+            if stored.version != version:
+                yield user.pk, 'outdated'
+            elif stored.document.encode() != document:
+                yield user.pk, 'mismatch'
+        last_pk = users[-1].pk
+
+
+def backfill_documents(batch_size=1000):
+    """
+    (Re)build documents for every user, one upsert per batch. Returns the
+    number of documents written.
+    """
+    queryset = User.objects.with_profiles().order_by('pk')
+    last_pk = 0
+    written = 0
+    while True:
+        users = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not users:
+            return written
+        documents = []
+        for user in users:
+            version, document = render_document(user)
+            documents.append(ProfileDocument(user=user, version=version, document=document.decode()))
+        ProfileDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['version', 'document', 'updated_at'],
+        )
+        written += len(documents)
+        last_pk = users[-1].pk
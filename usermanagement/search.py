@@ -0,0 +1,159 @@
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+
+from usermanagement.models import User
+
+
+SEARCH_TABLE = 'usermanagement_user_search'
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+STUDENT_FIELDS = ('student_id', 'grade', 'major')
+TEACHER_FIELDS = ('employee_id', 'department', 'specialization')
+SEARCH_COLUMNS = USER_FIELDS + STUDENT_FIELDS + TEACHER_FIELDS
+
+CREATE_SEARCH_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"{', '.join(SEARCH_COLUMNS)}, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+DROP_SEARCH_TABLE_SQL = f"DROP TABLE IF EXISTS {SEARCH_TABLE}"
+
+_INSERT_SQL = (
+    f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+    f"VALUES (%s, {', '.join(['%s'] * len(SEARCH_COLUMNS))})"
+)
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _documents(user_ids=None):
+    """
+    Yield (user id, column values) rows for the index, one joined query
+    """
+    queryset = User.objects.values_list(
+        'id',
+        *USER_FIELDS,
+        *(f'student_profile__{field}' for field in STUDENT_FIELDS),
+        *(f'teacher_profile__{field}' for field in TEACHER_FIELDS),
+    )
+    if user_ids is not None:
+        queryset = queryset.filter(pk__in=user_ids)
+
+    for row in queryset.iterator(chunk_size=2000):
+        yield [row[0], *(value or '' for value in row[1:])]
+
+
+def index_users(user_ids):
+    """
+    (Re)index the given users; ids that no longer exist are removed
+    """
+    if not fts_enabled():
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", user_ids)
+        cursor.executemany(_INSERT_SQL, list(_documents(user_ids)))
+
+
+def remove_users(user_ids):
+    if not fts_enabled():
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", user_ids)
+
+
+def rebuild_index(batch_size=2000):
+    """
+    Drop and repopulate the whole index; returns the number of users indexed
+    """
+    if not fts_enabled():
+        return 0
+
+    count = 0
+    batch = []
+    with connection.cursor() as cursor:
+        cursor.execute(DROP_SEARCH_TABLE_SQL)
+        cursor.execute(CREATE_SEARCH_TABLE_SQL)
+        for document in _documents():
+            batch.append(document)
+            if len(batch) >= batch_size:
+                cursor.executemany(_INSERT_SQL, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(_INSERT_SQL, batch)
+            count += len(batch)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def build_match_query(query):
+    """
+    Turn free text into an FTS5 query: every term must match as a prefix
+    """
+    terms = [term.replace('"', '') for term in query.split()]
+    return ' AND '.join(f'"{term}"*' for term in terms if term)
+
+
+def search_user_ids(query, limit=20, active_only=False):
+    """
+    Ids of users matching `query`, best match first. With `active_only`,
+    inactive users are filtered out before the limit is applied.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    if not fts_enabled():
+        condition = Q(is_active=True) if active_only else Q()
+        for term in query.split():
+            term_condition = Q()
+            for field in USER_FIELDS:
+                term_condition |= Q(**{f'{field}__icontains': term})
+            for field in STUDENT_FIELDS:
+                term_condition |= Q(**{f'student_profile__{field}__icontains': term})
+            for field in TEACHER_FIELDS:
+                term_condition |= Q(**{f'teacher_profile__{field}__icontains': term})
+            condition &= term_condition
+        return list(User.objects.filter(condition).values_list('pk', flat=True)[:limit])
+
+    if active_only:
+        sql = (
+            f"SELECT {SEARCH_TABLE}.rowid FROM {SEARCH_TABLE} "
+            f"JOIN {User._meta.db_table} ON {User._meta.db_table}.id = {SEARCH_TABLE}.rowid "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND {User._meta.db_table}.is_active "
+            f"ORDER BY bm25({SEARCH_TABLE}) LIMIT %s"
+        )
+    else:
+        sql = (
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}) LIMIT %s"
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_users(query, limit=20, queryset=None, active_only=False):
+    """
+    Matching users with profiles loaded, in rank order
+    """
+    ids = search_user_ids(query, limit, active_only=active_only)
+    if not ids:
+        return []
+
+    queryset = queryset if queryset is not None else User.objects.with_profiles()
+    ranking = Case(*(When(pk=pk, then=position) for position, pk in enumerate(ids)), output_field=IntegerField())
+    return list(queryset.filter(pk__in=ids).order_by(ranking))
@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from usermanagement.authentication import invalidate_token, invalidate_user_tokens
+from usermanagement.models import User, StudentProfile, TeacherProfile
+from usermanagement.changefeed import change_key, record_changes
+from usermanagement.search import USER_FIELDS, index_users
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """
+    Drop a deleted token (logout, user deletion) from the auth cache
+    """
+    invalidate_token(instance.key, instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    """
+    Drop cached tokens when a user changes, so deactivation applies immediately
+    """
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_save, sender=TeacherProfile)
+@receiver(post_delete, sender=StudentProfile)
+@receiver(post_delete, sender=TeacherProfile)
+def profile_changed(sender, instance, **kwargs):
+    """
+    Cached users carry their profiles, so drop them when a profile changes
+    """
+    invalidate_user_tokens(instance.user_id)
+
+
+class PendingUserChanges:
+    """
+    Change feed entries and search reindexing collected during one
+    transaction, written together once it commits: one changelog insert
+    and one reindex however many times a user and its profiles were saved.
+
+    Registered per savepoint level, so Django drops the changes of a rolled
+    back savepoint along with it. Entries are logged after the commit; a
+    crash in between loses them (the search index is rebuilt by
+    rebuild_search_index).
+    """
+
+    def __init__(self):
+        self.changes = {}
+        self.reindex = set()
+        self.done = False
+
+    def add(self, instance, action, reindex=True):
+        object_type, object_id, user_id = change_key(instance)
+        # Re-inserted so the entry sorts after older changes it supersedes
+        self.changes.pop((object_type, object_id), None)
+        self.changes[(object_type, object_id)] = (user_id, action)
+        if reindex:
+            self.reindex.add(user_id)
+
+    def __call__(self):
+        self.done = True
+        with transaction.atomic():
+            record_changes(
+                (object_type, object_id, user_id, action)
+                for (object_type, object_id), (user_id, action) in self.changes.items()
+            )
+            index_users(self.reindex)
+
+
+def _pending_changes():
+    """
+    The PendingUserChanges of the current transaction (and savepoint), or
+    None outside a transaction
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+    # atomic(savepoint=False) blocks record None, which never rolls back alone
+    savepoint_ids = set(connection.savepoint_ids) - {None}
+    for callback_savepoint_ids, callback, _ in connection.run_on_commit:
+        if (
+            isinstance(callback, PendingUserChanges)
+            and not callback.done
+            and callback_savepoint_ids - {None} == savepoint_ids
+        ):
+            return callback
+    pending = PendingUserChanges()
+    transaction.on_commit(pending)
+    return pending
+
+
+def _record(instance, action, reindex=True):
+    pending = _pending_changes()
+    if pending is not None:
+        pending.add(instance, action, reindex)
+        return
+    # Autocommit: the change is already committed
+    pending = PendingUserChanges()
+    pending.add(instance, action, reindex)
+    pending()
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Only the searchable columns need a reindex (not last_login, password, ...)
+    _record(instance, 'upsert', reindex=not update_fields or bool(set(update_fields) & set(USER_FIELDS)))
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_save, sender=TeacherProfile)
+def profile_saved(sender, instance, **kwargs):
+    _record(instance, 'upsert')
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=StudentProfile)
+@receiver(post_delete, sender=TeacherProfile)
+def logged_object_deleted(sender, instance, **kwargs):
+    # Reindexing a deleted user removes it from the index
+    _record(instance, 'delete')
@@ -1,3 +1,1607 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+import core.urls
+from core.cache import get_tiered_cache
+from usermanagement import authentication, changefeed, google
+from usermanagement.admin import CachedCountPaginator
+from usermanagement.authentication import CachedTokenAuthentication
+from usermanagement.bulk_import import UserImporter, iter_rows
+from usermanagement.export import EXPORT_COLUMNS, iter_export_rows
+from usermanagement.hashing import HashingOverloaded, PasswordHashingPool
+from usermanagement.google import (
+    GoogleIdTokenVerifier,
+    GoogleKeySet,
+    GoogleUnavailable,
+    GoogleAccountConflict,
+    GoogleUserInfoClient,
+    InvalidGoogleToken,
+    UnverifiedGoogleEmail,
+    sign_in_google_user,
+)
+from usermanagement.models import ChangeLogEntry, User, ProfileDocument, StudentProfile, TeacherProfile
+from usermanagement.profile_documents import backfill_documents, get_document, iter_stale_documents, render_with_document
+from usermanagement.api import async_views, urls as api_urls
+from usermanagement.api.compiled import compile_serializer
+from usermanagement.api.pagination import KeysetPagination
+from usermanagement.api.serializers import (
+    GoogleAuthSerializer,
+    PublicProfileSerializer,
+    UserProfileSerializer,
+    UserRegistrationSerializer,
+)
+from usermanagement import search
+from usermanagement.search import SEARCH_TABLE, build_match_query, search_user_ids
+from usermanagement.signals import PendingUserChanges
+
+
+class CompiledSerializerParityTests(TestCase):
+    """
+    The compiled engine must render exactly what the DRF serializers render
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plain = User.objects.create_user(username='plain')
+        cls.student = User.objects.create_user(
+            username='student', email='s@example.com', first_name='Ünïcödé', last_name='"Quoted"',
+            phone='+123', avatar='https://example.com/a.png', is_verified=True,
+        )
+        StudentProfile.objects.create(
+            user=cls.student, student_id='STU001', grade='10th', major='CS',
+            enrollment_date=datetime.date(2025, 1, 1),
+        )
+        cls.teacher = User.objects.create_user(username='teacher', user_type='teacher')
+        cls.teacher.last_login = timezone.now()
+        cls.teacher.save()
+        TeacherProfile.objects.create(user=cls.teacher, employee_id='EMP001', department='Math')
+        cls.admin = User.objects.create_user(username='admin', user_type='admin', phone='')
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def users(self):
+        return list(User.objects.with_profiles().order_by('pk'))
+
+    def assertParity(self, serializer_class, fields=None):
+        kwargs = {'fields': fields} if fields is not None else {}
+        compiled = compile_serializer(serializer_class, fields=fields)
+        users = self.users()
+
+        expected = [self.render(serializer_class(user, **kwargs).data) for user in users]
+        self.assertEqual([self.render(compiled.to_representation(user)) for user in users], expected)
+
+        rows = User.objects.order_by('pk').values(*compiled.value_names)
+        self.assertEqual([self.render(compiled.from_row(row)) for row in rows], expected)
+
+    def test_user_profile_serializer(self):
+        self.assertParity(UserProfileSerializer)
+
+    def test_public_profile_serializer(self):
+        self.assertParity(PublicProfileSerializer)
+
+    def test_sparse_fieldsets(self):
+        self.assertParity(UserProfileSerializer, fields={'id', 'username'})
+        self.assertParity(PublicProfileSerializer, fields={'user_type', 'teacher_profile', 'created_at'})
+
+    def test_many(self):
+        compiled = compile_serializer(UserProfileSerializer)
+        users = self.users()
+        self.assertEqual(
+            self.render(compiled.many(users)),
+            self.render(UserProfileSerializer(users, many=True).data),
+        )
+
+    def test_many_rows(self):
+        compiled = compile_serializer(PublicProfileSerializer)
+        rows = User.objects.order_by('pk').values(*compiled.value_names)
+        self.assertEqual(
+            self.render(compiled.many_rows(rows)),
+            self.render(PublicProfileSerializer(self.users(), many=True).data),
+        )
+
+    def test_compiled_once_per_field_set(self):
+        compiled = compile_serializer(UserProfileSerializer, fields={'id', 'username'})
+        self.assertIs(compile_serializer(UserProfileSerializer, fields=['username', 'id']), compiled)
+        self.assertIsNot(compile_serializer(UserProfileSerializer), compiled)
+        self.assertIsNot(compile_serializer(PublicProfileSerializer, fields={'id', 'username'}), compiled)
+
+    def test_sparse_profile_response(self):
+        self.client.force_login(self.student)
+        response = self.client.get('/api/usermanagement/profile/', {'fields': 'id,first_name,student_profile'})
+        user = User.objects.with_profiles().get(pk=self.student.pk)
+        expected = UserProfileSerializer(user, fields={'id', 'first_name', 'student_profile'}).data
+        self.assertEqual(response.content, self.render({'success': True, 'user': expected}))
+
+    def test_benchmark_command(self):
+        output = io.StringIO()
+        call_command('benchmark_serializers', number=10, repeat=1, stdout=output)
+        self.assertRegex(output.getvalue(), r'Speedup: \d+\.\dx')
+
+    def test_unsaved_profiles_are_not_queried(self):
+        compiled = compile_serializer(UserProfileSerializer)
+        user = User.objects.with_profiles().get(pk=self.plain.pk)
+        with self.assertNumQueries(0):
+            data = compiled.to_representation(user)
+        self.assertIsNone(data['student_profile'])
+        self.assertIsNone(data['teacher_profile'])
+
+
+@override_settings(TOKEN_AUTH_CACHE={'SHARED_CACHE': 'default'})
+class CachedTokenAuthenticationTests(TestCase):
+    """
+    Logouts and deactivations must reach entries other processes still
+    hold in their own LRU
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(username='worker')
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def held_by_other_process(self):
+        # Signals clear this process's LRU; another worker's keeps the entry
+        return authentication._caches()[0].get(self.token.key)
+
+    def test_cached_after_first_lookup(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_logout_invalidates_other_processes(self):
+        self.auth.authenticate_credentials(self.token.key)
+        entry = self.held_by_other_process()
+
+        self.token.delete()
+        authentication._caches()[0].set(self.token.key, entry)
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivation_invalidates_other_processes(self):
+        self.auth.authenticate_credentials(self.token.key)
+        entry = self.held_by_other_process()
+
+        self.user.is_active = False
+        self.user.save()
+        authentication._caches()[0].set(self.token.key, entry)
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivation_racing_a_cache_fill(self):
+        queryset = self.auth._queryset()
+        deactivate = self.user
+
+        class RacingQuerySet:
+            # The row is read, then the user is deactivated before the
+            # request gets to cache it
+            def get(self, **kwargs):
+                token = queryset.get(**kwargs)
+                deactivate.is_active = False
+                deactivate.save()
+                return token
+
+        with mock.patch.object(CachedTokenAuthentication, '_queryset', return_value=RacingQuerySet()):
+            user, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertTrue(user.is_active)
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_local_hits_skip_shared_stamps_within_version_ttl(self):
+        self.auth.authenticate_credentials(self.token.key)
+        shared = caches['default']
+        with mock.patch.object(shared, 'get', wraps=shared.get) as shared_get:
+            self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(shared_get.call_count, 0)
+
+    @override_settings(TOKEN_AUTH_CACHE={'SHARED_CACHE': 'default', 'VERSION_TTL': 0})
+    def test_zero_version_ttl_checks_every_hit(self):
+        self.auth.authenticate_credentials(self.token.key)
+        # Another process bumps the stamp
+        caches['default'].set(authentication._version_key(self.user.pk), authentication._new_version(time.time()), None)
+        with self.assertNumQueries(1):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_profile_change_refreshes_cached_user(self):
+        self.auth.authenticate_credentials(self.token.key)
+        StudentProfile.objects.create(user=self.user, student_id='STU100')
+
+        user, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.student_profile.student_id, 'STU100')
+
+
+class StandInServer:
+    """
+    Local HTTP server standing in for Google. `routes` maps a path to a
+    callable returning (status, headers, body, delay); `hits` counts
+    requests per path.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.hits = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits[self.path] = server.hits.get(self.path, 0) + 1
+                status, headers, body, delay = server.routes[self.path](self)
+                if delay:
+                    time.sleep(delay)
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except OSError:
+                    # The client gave up (timeout tests)
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.block_on_close = False
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}{path}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+GOOGLE_USER = {'id': '1234567890', 'email': 'google@example.com', 'verified_email': True}
+
+
+class GoogleUserInfoClientTests(SimpleTestCase):
+    """
+    Timeouts, circuit breaker and response cache of the userinfo client
+    """
+
+    def setUp(self):
+        self.status = 200
+        self.delay = 0
+        self.server = StandInServer({'/userinfo': self.userinfo})
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def userinfo(self, handler):
+        if handler.headers['Authorization'] != 'Bearer good-token':
+            return 401, {}, {'error': 'invalid_token'}, 0
+        return self.status, {}, GOOGLE_USER, self.delay
+
+    def userinfo_client(self, **kwargs):
+        options = {'read_timeout': 1, 'failure_threshold': 2, 'reset_timeout': 0.2, **kwargs}
+        return GoogleUserInfoClient(userinfo_url=self.server.url('/userinfo'), **options)
+
+    def test_userinfo_is_cached(self):
+        client = self.userinfo_client()
+        self.assertEqual(client.get_userinfo('good-token'), GOOGLE_USER)
+        self.assertEqual(client.get_userinfo('good-token'), GOOGLE_USER)
+        self.assertEqual(self.server.hits['/userinfo'], 1)
+
+    def test_invalid_token(self):
+        client = self.userinfo_client()
+        for _ in range(3):
+            with self.assertRaises(InvalidGoogleToken):
+                client.get_userinfo('bad-token')
+        # Rejections come from a healthy upstream and never open the breaker
+        self.assertFalse(client.breaker.is_open)
+        self.assertEqual(self.server.hits['/userinfo'], 3)
+
+    def test_read_timeout(self):
+        self.delay = 3
+        client = self.userinfo_client()
+        started = time.monotonic()
+        with self.assertRaises(GoogleUnavailable):
+            client.get_userinfo('good-token')
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_breaker_opens_on_timeouts(self):
+        self.delay = 0.5
+        client = self.userinfo_client(read_timeout=0.1)
+        for _ in range(2):
+            with self.assertRaises(GoogleUnavailable):
+                client.get_userinfo('good-token')
+        self.assertTrue(client.breaker.is_open)
+
+    def test_breaker_opens_on_server_errors_and_half_opens(self):
+        self.status = 503
+        client = self.userinfo_client()
+        for _ in range(2):
+            with self.assertRaises(GoogleUnavailable):
+                client.get_userinfo('good-token')
+        self.assertTrue(client.breaker.is_open)
+
+        # Open: refused without a request
+        with self.assertRaises(GoogleUnavailable):
+            client.get_userinfo('good-token')
+        self.assertEqual(self.server.hits['/userinfo'], 2)
+
+        # After the cooldown a single trial call goes through and closes it
+        time.sleep(0.25)
+        self.status = 200
+        self.assertEqual(client.get_userinfo('good-token'), GOOGLE_USER)
+        self.assertFalse(client.breaker.is_open)
+        self.assertEqual(self.server.hits['/userinfo'], 3)
+
+    def test_failed_trial_reopens_breaker(self):
+        self.status = 500
+        client = self.userinfo_client()
+        for _ in range(2):
+            with self.assertRaises(GoogleUnavailable):
+                client.get_userinfo('good-token')
+
+        time.sleep(0.25)
+        with self.assertRaises(GoogleUnavailable):
+            client.get_userinfo('good-token')
+        with self.assertRaises(GoogleUnavailable):
+            client.get_userinfo('good-token')
+        self.assertTrue(client.breaker.is_open)
+        self.assertEqual(self.server.hits['/userinfo'], 3)
+
+
+CLIENT_ID = 'client-id.apps.googleusercontent.com'
+
+
+class SigningKey:
+    """
+    Locally generated RSA key standing in for one of Google's signing keys
+    """
+
+    def __init__(self, kid):
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    @property
+    def jwk(self):
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key(), as_dict=True)
+        return {**jwk, 'kid': self.kid, 'alg': 'RS256', 'use': 'sig'}
+
+    def sign(self, **overrides):
+        now = int(time.time())
+        claims = {
+            'iss': 'https://accounts.google.com',
+            'aud': CLIENT_ID,
+            'sub': '1234567890',
+            'email': 'google@example.com',
+            'email_verified': True,
+            'iat': now,
+            'exp': now + 3600,
+            **overrides,
+        }
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+
+class GoogleIdTokenVerifierTests(SimpleTestCase):
+    """
+    ID tokens signed with local keys, served from a key-set file or server
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = SigningKey('key-1')
+        cls.rotated_key = SigningKey('key-2')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.jwks_file = os.path.join(directory.name, 'jwks.json')
+        with open(self.jwks_file, 'w') as fh:
+            json.dump({'keys': [self.key.jwk]}, fh)
+
+    def verifier(self, key_set=None):
+        return GoogleIdTokenVerifier(client_id=CLIENT_ID, key_set=key_set or GoogleKeySet(jwks_file=self.jwks_file))
+
+    def assertRejected(self, token, verifier=None):
+        with self.assertRaises(InvalidGoogleToken):
+            (verifier or self.verifier()).verify(token)
+
+    def test_valid_token(self):
+        user_data = self.verifier().verify(self.key.sign(given_name='Ada'))
+        self.assertEqual(user_data['id'], '1234567890')
+        self.assertEqual(user_data['email'], 'google@example.com')
+        self.assertIs(user_data['verified_email'], True)
+        self.assertEqual(user_data['given_name'], 'Ada')
+
+    def test_email_verified_claim_is_a_bool(self):
+        for claim, verified in ((True, True), ('true', True), (False, False), ('false', False), ('True ', False)):
+            user_data = self.verifier().verify(self.key.sign(email_verified=claim))
+            self.assertIs(user_data['verified_email'], verified)
+        user_data = self.verifier().verify(self.key.sign(email_verified=None))
+        self.assertIs(user_data['verified_email'], False)
+
+    def test_wrong_audience(self):
+        self.assertRejected(self.key.sign(aud='someone-else.apps.googleusercontent.com'))
+
+    def test_wrong_issuer(self):
+        self.assertRejected(self.key.sign(iss='https://evil.example.com'))
+
+    def test_expired(self):
+        self.assertRejected(self.key.sign(iat=int(time.time()) - 7200, exp=int(time.time()) - 3600))
+
+    def test_unsigned_and_symmetric_algorithms(self):
+        claims = jwt.decode(self.key.sign(), options={'verify_signature': False})
+        self.assertRejected(jwt.encode(claims, 'shared-secret', algorithm='HS256', headers={'kid': 'key-1'}))
+        self.assertRejected(jwt.encode(claims, None, algorithm='none', headers={'kid': 'key-1'}))
+
+    def test_tampered_signature(self):
+        self.assertRejected(SigningKey('key-1').sign())
+
+    def test_unknown_kid_refreshes_key_set(self):
+        keys = [self.key.jwk]
+        route = lambda handler: (200, {'Cache-Control': 'public, max-age=3600'}, {'keys': keys}, 0)
+
+        with StandInServer({'/certs': route}) as server:
+            key_set = GoogleKeySet(jwks_url=server.url('/certs'), min_refresh_interval=0)
+            verifier = self.verifier(key_set)
+
+            verifier.verify(self.key.sign())
+            verifier.verify(self.key.sign())
+            self.assertEqual(server.hits['/certs'], 1)
+
+            # Google rotated its keys: the new kid triggers one refetch
+            keys.append(self.rotated_key.jwk)
+            self.assertEqual(verifier.verify(self.rotated_key.sign())['id'], '1234567890')
+            self.assertEqual(server.hits['/certs'], 2)
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        route = lambda handler: (200, {}, {'keys': [self.key.jwk]}, 0)
+
+        with StandInServer({'/certs': route}) as server:
+            verifier = self.verifier(GoogleKeySet(jwks_url=server.url('/certs'), min_refresh_interval=60))
+            verifier.verify(self.key.sign())
+            for _ in range(3):
+                self.assertRejected(self.rotated_key.sign(), verifier)
+            self.assertEqual(server.hits['/certs'], 1)
+
+    def test_cold_process_id_token_sign_in(self):
+        # No userinfo client or verifier built yet, as in a fresh worker
+        for name in ('_client', '_verifier'):
+            self.addCleanup(setattr, google, name, getattr(google, name))
+            setattr(google, name, None)
+
+        results = []
+        google_auth = {'CLIENT_ID': CLIENT_ID, 'JWKS_FILE': self.jwks_file}
+        with override_settings(GOOGLE_AUTH=google_auth):
+            serializer = GoogleAuthSerializer(data={'id_token': self.key.sign()})
+            thread = threading.Thread(target=lambda: results.append(serializer.is_valid()), daemon=True)
+            thread.start()
+            thread.join(timeout=5)
+
+        self.assertFalse(thread.is_alive(), 'ID token validation deadlocked')
+        self.assertEqual(results, [True])
+        self.assertEqual(serializer.validated_data['google_user']['id'], '1234567890')
+
+
+class GoogleAccountLinkingTests(TestCase):
+    """
+    Existing accounts are linked by email only when Google verified it
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.existing = User.objects.create_user(username='victim', email='victim@example.com', password='s3cret-pass')
+
+    def google_user(self, verified):
+        return {'id': 'google-sub-1', 'email': 'victim@example.com', 'verified_email': verified}
+
+    def test_unverified_email_is_not_linked(self):
+        for verified in (False, None):
+            user_data = self.google_user(verified)
+            if verified is None:
+                del user_data['verified_email']
+            with self.assertRaises(UnverifiedGoogleEmail):
+                sign_in_google_user(user_data)
+
+        self.existing.refresh_from_db()
+        self.assertIsNone(self.existing.google_sub)
+        self.assertFalse(Token.objects.filter(user=self.existing).exists())
+
+    def test_verified_email_is_linked(self):
+        user, token, created = sign_in_google_user(self.google_user(True))
+        self.assertFalse(created)
+        self.assertEqual(user.pk, self.existing.pk)
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.google_sub, 'google-sub-1')
+
+    def test_new_user_is_verified_only_when_google_says_so(self):
+        user, _, created = sign_in_google_user({'id': 'google-sub-2', 'email': 'new@example.com', 'verified_email': True})
+        self.assertTrue(created)
+        self.assertIs(User.objects.get(pk=user.pk).is_verified, True)
+
+    def test_username_collision_is_a_conflict(self):
+        # Username taken by an account with another email; nothing to link
+        User.objects.create_user(username='taken@example.com', email='someone@example.com')
+        with self.assertRaises(GoogleAccountConflict):
+            sign_in_google_user({'id': 'google-sub-2', 'email': 'taken@example.com', 'verified_email': True})
+        self.assertFalse(User.objects.filter(google_sub='google-sub-2').exists())
+
+    def test_email_linked_to_another_subject_is_a_conflict(self):
+        sign_in_google_user({'id': 'google-sub-2', 'email': 'shared@example.com', 'verified_email': True})
+        with self.assertRaises(GoogleAccountConflict):
+            sign_in_google_user({'id': 'google-sub-3', 'email': 'shared@example.com', 'verified_email': True})
+
+    def test_returning_user_is_served_from_sub_cache(self):
+        user_data = {'id': 'google-sub-2', 'email': 'new@example.com', 'verified_email': True}
+        user, token, _ = sign_in_google_user(user_data)
+        sign_in_google_user(user_data)
+
+        with self.assertNumQueries(0):
+            cached_user, cached_token, created = sign_in_google_user(user_data)
+        self.assertFalse(created)
+        self.assertEqual((cached_user.pk, cached_token.key), (user.pk, token.key))
+
+        # After a logout the cached token is gone, and a new one is issued
+        token.delete()
+        _, new_token, created = sign_in_google_user(user_data)
+        self.assertFalse(created)
+        self.assertNotEqual(new_token.key, token.key)
+
+
+class ProfileDocumentTests(TestCase):
+    """
+    Stored documents render exactly what UserProfileSerializer renders and
+    are only written by the first read after a change
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        get_tiered_cache().l1.clear()
+        self.user = User.objects.create_user(username='doc', email='doc@example.com', first_name='Dö', password='s3cret-pass')
+        StudentProfile.objects.create(user=self.user, student_id='STU200', major='CS')
+
+    def fresh(self, user=None):
+        return User.objects.with_profiles().get(pk=(user or self.user).pk)
+
+    def test_document_matches_serializer(self):
+        user = self.fresh()
+        self.assertEqual(get_document(user), JSONRenderer().render(UserProfileSerializer(user).data))
+
+    def test_saves_do_not_write_documents(self):
+        get_document(self.fresh())
+        profile = self.user.student_profile
+        profile.major = 'Maths'
+        profile.save()
+        self.assertIn(b'"CS"', ProfileDocument.objects.get(pk=self.user.pk).document.encode())
+
+        user = self.fresh()
+        with self.assertNumQueries(2):
+            document = get_document(user)
+        self.assertIn(b'"Maths"', document)
+        with self.assertNumQueries(0):
+            get_document(user)
+        self.assertEqual(ProfileDocument.objects.get(pk=self.user.pk).document.encode(), document)
+
+    def test_iter_stale_documents_and_backfill(self):
+        other = User.objects.create_user(username='nodoc')
+        get_document(self.fresh())
+        self.assertEqual(list(iter_stale_documents()), [(other.pk, 'missing')])
+
+        ProfileDocument.objects.filter(pk=self.user.pk).update(document='{}')
+        self.assertEqual(list(iter_stale_documents(batch_size=1)), [(self.user.pk, 'mismatch'), (other.pk, 'missing')])
+
+        self.assertEqual(backfill_documents(batch_size=1), 2)
+        self.assertEqual(list(iter_stale_documents()), [])
+
+        other.first_name = 'Changed'
+        other.save()
+        self.assertEqual(list(iter_stale_documents()), [(other.pk, 'outdated')])
+
+    def test_render_with_document(self):
+        data = {'success': True, 'user': None, 'token': 'abc', 'errors': None}
+        self.assertEqual(
+            render_with_document(data, b'{"id":1}'),
+            JSONRenderer().render({**data, 'user': {'id': 1}}),
+        )
+
+    def test_login_response_splices_document(self):
+        response = self.client.post(
+            '/api/usermanagement/auth/login/',
+            {'username': 'doc', 'password': 's3cret-pass'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, JSONRenderer().render({
+            'success': True,
+            'message': 'Login successful',
+            'user': UserProfileSerializer(self.fresh()).data,
+            'token': Token.objects.get(user=self.user).key,
+        }))
+
+
+class RegistrationTests(TestCase):
+    """
+    A signup is one transaction, followed by one batch of change feed and
+    search index writes
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        get_tiered_cache().l1.clear()
+
+    def payload(self, **extra):
+        return {
+            'username': 'newbie',
+            'email': 'newbie@example.com',
+            'password': 's3cret-pass',
+            'confirm_password': 's3cret-pass',
+            **extra,
+        }
+
+    def register(self, payload, queries):
+        with self.assertNumQueries(queries), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/api/usermanagement/auth/register/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len([callback for callback in callbacks if isinstance(callback, PendingUserChanges)]), 1)
+        return User.objects.get(username='newbie')
+
+    def test_register_without_profile(self):
+        # Uniqueness check; user and token inserts in one savepoint; the
+        # profile document read and upsert; then one changelog insert and
+        # one reindex (delete, select, insert) in another savepoint
+        user = self.register(self.payload(), 13)
+        self.assertEqual(list(ChangeLogEntry.objects.values_list('object_type', flat=True)), ['user'])
+        self.assertEqual(search_user_ids('newbie'), [user.pk])
+        self.assertTrue(ProfileDocument.objects.filter(user=user).exists())
+
+    def test_register_with_profile(self):
+        user = self.register(self.payload(student_profile={'student_id': 'STU300'}), 15)
+        self.assertEqual(
+            sorted(ChangeLogEntry.objects.values_list('object_type', flat=True)),
+            ['student_profile', 'user'],
+        )
+        self.assertEqual(search_user_ids('STU300'), [user.pk])
+
+    def test_failed_profile_insert_rolls_back_signup(self):
+        serializer = UserRegistrationSerializer(data=self.payload(student_profile={'student_id': 'STU300'}))
+        self.assertTrue(serializer.is_valid())
+        # Taken after validation, as a concurrent signup would
+        StudentProfile.objects.create(user=User.objects.create_user(username='first'), student_id='STU300')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(IntegrityError):
+                serializer.save()
+        self.assertFalse(User.objects.filter(username='newbie').exists())
+        self.assertEqual(Token.objects.count(), 0)
+        self.assertEqual(StudentProfile.objects.count(), 1)
+        self.assertEqual(callbacks, [])
+
+
+class BulkImportTests(TestCase):
+    """
+    Rows are validated and written a chunk at a time; rejected rows are
+    reported by row number and the rest still land
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def run_import(self, rows, importer=None, **options):
+        importer = importer or UserImporter(**options)
+        return importer.run(enumerate(rows, start=1)).as_dict()
+
+    def test_chunks_are_validated(self):
+        report = self.run_import([
+            {'username': 'alice', 'student_id': 'STU700'},
+            {'username': 'bob', 'email': 'not-an-email'},
+            {'email': 'nameless@example.com'},
+            {'username': 'carol', 'user_type': 'teacher', 'employee_id': 'EMP700'},
+            {'username': 'dave', 'employee_id': 'EMP701'},
+        ], batch_size=2)
+
+        self.assertEqual((report['created'], report['failed']), (2, 3))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 5])
+        self.assertIn('email', report['errors'][0]['errors'])
+        self.assertIn('username', report['errors'][1]['errors'])
+        self.assertEqual(report['errors'][2]['errors']['non_field_errors'], ['employee_id is only allowed for teachers'])
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['alice', 'carol'])
+
+    def test_duplicates(self):
+        User.objects.create_user(username='taken')
+        report = self.run_import([
+            {'username': 'taken'},
+            {'username': 'twin'},
+            {'username': 'twin'},
+            {'username': 'first', 'student_id': 'STU700'},
+            {'username': 'second', 'student_id': 'STU700'},
+        ])
+        self.assertEqual([error['row'] for error in report['errors']], [1, 3, 5])
+        self.assertEqual(report['errors'][0]['errors'], {'username': ['username "taken" already exists']})
+        self.assertEqual(report['errors'][2]['errors'], {'student_id': ['student_id "STU700" already exists']})
+        self.assertEqual(report['created'], 2)
+
+        # Across chunks the database check catches them
+        report = self.run_import([{'username': 'solo'}, {'username': 'solo'}], batch_size=1)
+        self.assertEqual((report['created'], report['failed']), (1, 1))
+
+    def test_race_is_retried_row_by_row(self):
+        class RacingImporter(UserImporter):
+            def _hash_passwords(self, valid):
+                # Registered between validation and the write
+                User.objects.create_user(username='raced')
+                return super()._hash_passwords(valid)
+
+        report = self.run_import(
+            [{'username': 'before'}, {'username': 'raced'}, {'username': 'after', 'student_id': 'STU700'}],
+            importer=RacingImporter(),
+        )
+        self.assertEqual((report['created'], report['failed']), (2, 1))
+        self.assertEqual(report['errors'][0]['row'], 2)
+        self.assertIn('non_field_errors', report['errors'][0]['errors'])
+        self.assertEqual(User.objects.filter(username='raced').count(), 1)
+        self.assertEqual(StudentProfile.objects.get(student_id='STU700').user.username, 'after')
+        self.assertEqual(Token.objects.filter(user__username__in=['before', 'after']).count(), 2)
+
+    def test_rows_become_users_profiles_and_tokens(self):
+        report = self.run_import([
+            {'username': 'hashed', 'password': 'plain-password'},
+            {'username': 'migrated', 'password_hash': make_password('old-password'), 'student_id': 'STU700', 'grade': '10'},
+            {'username': 'nopass', 'user_type': 'teacher', 'employee_id': 'EMP700', 'department': 'Math'},
+        ])
+        self.assertEqual(report['created'], 3)
+
+        users = {user.username: user for user in User.objects.all()}
+        self.assertTrue(users['hashed'].check_password('plain-password'))
+        self.assertTrue(users['migrated'].check_password('old-password'))
+        self.assertFalse(users['nopass'].has_usable_password())
+        self.assertEqual(users['migrated'].student_profile.grade, '10')
+        self.assertEqual(users['nopass'].teacher_profile.department, 'Math')
+        self.assertEqual(Token.objects.count(), 3)
+
+        # Bulk writes send no signals; the change feed and index are kept by hand
+        self.assertEqual(
+            sorted(ChangeLogEntry.objects.values_list('object_type', flat=True)),
+            ['student_profile', 'teacher_profile', 'user', 'user', 'user'],
+        )
+        self.assertEqual(search_user_ids('EMP700'), [users['nopass'].pk])
+
+        # Documents are built on first read
+        self.assertFalse(ProfileDocument.objects.exists())
+        get_document(User.objects.with_profiles().get(username='migrated'))
+        self.assertTrue(ProfileDocument.objects.filter(user=users['migrated']).exists())
+
+        self.run_import([{'username': 'tokenless'}], create_tokens=False)
+        self.assertFalse(Token.objects.filter(user__username='tokenless').exists())
+
+    def test_upload(self):
+        url = '/api/usermanagement/users/import/'
+        self.client.force_login(User.objects.create_user(username='member'))
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_superuser(username='root', email='root@example.com'))
+        upload = SimpleUploadedFile('users.csv', b'username,email\r\ncsv-user,csv@example.com\r\n')
+        response = self.client.post(url, {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+
+        upload = SimpleUploadedFile('users.jsonl', b'{"username": "jsonl-user"}\nnot json\n')
+        body = self.client.post(url, {'file': upload}).json()
+        self.assertEqual((body['success'], body['created']), (False, 1))
+        self.assertEqual(body['errors'], [{'row': 2, 'errors': {'non_field_errors': ['Row is not a JSON object']}}])
+
+        self.assertEqual(self.client.post(url, {'file': upload, 'format': 'xml'}).status_code, 400)
+        self.assertEqual(list(iter_rows(io.StringIO('username\r\nx\r\n'), 'csv')), [(1, {'username': 'x'})])
+
+
+class PasswordHashingPoolTests(TestCase):
+    """
+    Admission control holds a slot per queued hash and gives it back
+    whatever happens; an overloaded pool answers 503
+    """
+
+    def test_full_pool_rejects(self):
+        pool = PasswordHashingPool(workers=0, max_pending=1)
+        pool._admit()
+        with self.assertRaises(HashingOverloaded) as raised:
+            pool.hash_password('password')
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(pool.stats()['rejected'], 1)
+
+        pool._release(time.monotonic())
+        self.assertTrue(pool.hash_password('password').startswith('pbkdf2_sha256$'))
+        self.assertEqual(pool.stats()['pending'], 0)
+
+    def test_slots_are_released(self):
+        pool = PasswordHashingPool(workers=0, max_pending=1)
+        with mock.patch('usermanagement.hashing.make_password', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                pool.hash_password('password')
+        self.assertEqual(pool.stats()['pending'], 0)
+
+        # Both the submit and its retry on a fresh executor failing used to
+        # leak the slot: nothing completes to release it
+        pool = PasswordHashingPool(workers=1, max_pending=1)
+        broken = mock.Mock(**{'submit.side_effect': BrokenProcessPool()})
+        with mock.patch.object(pool, '_get_executor', return_value=broken), mock.patch.object(pool, '_reset_executor'):
+            for _ in range(3):
+                with self.assertRaises(BrokenProcessPool):
+                    pool.hash_password('password')
+        self.assertEqual(pool.stats()['pending'], 0)
+        self.assertEqual(pool.stats()['rejected'], 0)
+
+    def test_outdated_hash_is_upgraded(self):
+        pool = PasswordHashingPool(workers=0)
+        hasher = PBKDF2PasswordHasher()
+        user = User.objects.create_user(username='old-hash')
+        user.password = hasher.encode('password', hasher.salt(), iterations=1000)
+        user.save()
+
+        self.assertFalse(pool.check_user_password(user, 'wrong-password'))
+        self.assertIn('$1000$', User.objects.get(pk=user.pk).password)
+
+        self.assertTrue(pool.check_user_password(user, 'password'))
+        stored = User.objects.get(pk=user.pk).password
+        self.assertEqual(stored, user.password)
+        self.assertIn(f'${hasher.iterations}$', stored)
+        self.assertTrue(pool.check_user_password(user, 'password'))
+
+    def test_overload_is_503_on_login_and_form_error_in_admin(self):
+        User.objects.create_superuser(username='root', email='root@example.com', password='password')
+        with mock.patch.object(PasswordHashingPool, '_admit', side_effect=HashingOverloaded()):
+            response = self.client.post(
+                '/api/usermanagement/auth/login/',
+                {'username': 'root', 'password': 'password'},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+
+            response = self.client.post('/admin/login/', {'username': 'root', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].errors['__all__'], [HashingOverloaded.default_detail])
+
+
+class UserSearchTests(TestCase):
+    """
+    The FTS5 index follows user and profile changes and ranks prefix
+    matches with bm25
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alpha = User.objects.create_user(username='alphonse', email='alphonse@example.com', first_name='Alphonse')
+            self.other = User.objects.create_user(username='zed', email='zed@example.com', last_name='Alphonse')
+            StudentProfile.objects.create(user=self.other, student_id='STU400', major='Chemistry')
+
+    def indexed(self, user):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT username, student_id FROM {SEARCH_TABLE} WHERE rowid = %s', [user.pk])
+            return cursor.fetchall()
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.indexed(self.other), [('zed', 'STU400')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.username = 'zora'
+            self.other.save()
+            self.other.student_profile.delete()
+        self.assertEqual(self.indexed(self.other), [('zora', '')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        self.assertEqual(self.indexed(self.other), [])
+
+    def test_saves_of_unsearched_fields_do_not_reindex(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.alpha.last_login = timezone.now()
+            self.alpha.save(update_fields=['last_login'])
+        pending, = [callback for callback in callbacks if isinstance(callback, PendingUserChanges)]
+        self.assertEqual(list(pending.changes), [('user', self.alpha.pk)])
+        self.assertEqual(pending.reindex, set())
+
+    def test_ranking_and_prefixes(self):
+        self.assertEqual(search_user_ids('alphonse'), [self.alpha.pk, self.other.pk])
+        self.assertEqual(search_user_ids('alph'), [self.alpha.pk, self.other.pk])
+        self.assertEqual(search_user_ids('alph chem'), [self.other.pk])
+        self.assertEqual(search_user_ids('stu4'), [self.other.pk])
+        self.assertEqual(search_user_ids('phonse'), [])
+        self.assertEqual(search_user_ids('alph', limit=1), [self.alpha.pk])
+
+    def test_match_query_quotes_terms(self):
+        self.assertEqual(build_match_query('a"b  c'), '"ab"* AND "c"*')
+        self.assertEqual(search_user_ids('"'), [])
+        self.assertEqual(search_user_ids('OR alph'), [])
+
+    def test_active_only(self):
+        User.objects.filter(pk=self.alpha.pk).update(is_active=False)
+        self.assertEqual(search_user_ids('alph', active_only=True), [self.other.pk])
+
+    def test_fallback_without_fts(self):
+        with mock.patch.object(search, 'fts_enabled', return_value=False):
+            self.assertEqual(sorted(search_user_ids('ALPH')), sorted([self.alpha.pk, self.other.pk]))
+            self.assertEqual(search_user_ids('alph chem'), [self.other.pk])
+            User.objects.filter(pk=self.other.pk).update(is_active=False)
+            self.assertEqual(search_user_ids('alph', active_only=True), [self.alpha.pk])
+            with self.assertNumQueries(0):
+                search.index_users([self.alpha.pk])
+
+    def test_admin_search(self):
+        admin_user = User.objects.create_superuser(username='root', email='root@example.com', password='s3cret-pass')
+        self.client.force_login(admin_user)
+
+        response = self.client.get('/admin/usermanagement/user/', {'q': 'alph'})
+        self.assertEqual([user.pk for user in response.context['cl'].result_list], [self.alpha.pk, self.other.pk])
+
+        response = self.client.get('/admin/usermanagement/studentprofile/', {'q': 'stu400'})
+        self.assertEqual([profile.user_id for profile in response.context['cl'].result_list], [self.other.pk])
+
+        with mock.patch('usermanagement.admin.FullTextSearchMixin.search_limit', 1):
+            response = self.client.get('/admin/usermanagement/user/', {'q': 'alph'})
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+        self.assertIn('Only the best 1 matches are shown', [str(message) for message in response.context['messages']][0])
+
+
+def route_api_views(async_views):
+    """
+    Rebuild the URLconf as ASYNC_API_VIEWS would at startup
+    """
+    with override_settings(ASYNC_API_VIEWS=async_views):
+        importlib.reload(api_urls)
+    importlib.reload(core.urls)
+    clear_url_caches()
+
+
+class AsyncApiViewsTests(TestCase):
+    """
+    With ASYNC_API_VIEWS the hot endpoints answer as the sync views do
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        route_api_views(True)
+        cls.addClassCleanup(route_api_views, settings.ASYNC_API_VIEWS)
+        cls.key = SigningKey('key-1')
+
+    def setUp(self):
+        caches['default'].clear()
+        get_tiered_cache().l1.clear()
+        self.user = User.objects.create_user(username='async', email='async@example.com', password='s3cret-pass')
+        self.token = Token.objects.create(user=self.user)
+
+    def auth(self):
+        return {'Authorization': f'Token {self.token.key}'}
+
+    async def test_health(self):
+        self.assertIs(resolve('/api/usermanagement/health/').func, async_views.health_check)
+        response = await self.async_client.get('/api/usermanagement/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'success')
+
+    async def test_login_serves_profile_document(self):
+        response = await self.async_client.post(
+            '/api/usermanagement/auth/login/',
+            {'username': 'async', 'password': 's3cret-pass'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        document = await ProfileDocument.objects.aget(user_id=self.user.pk)
+        self.assertEqual(
+            response.content,
+            render_with_document({
+                'success': True,
+                'message': 'Login successful',
+                'user': None,
+                'token': self.token.key,
+            }, document.document.encode()),
+        )
+
+    async def test_google_id_token(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        jwks_file = os.path.join(directory.name, 'jwks.json')
+        with open(jwks_file, 'w') as fh:
+            json.dump({'keys': [self.key.jwk]}, fh)
+        verifier = GoogleIdTokenVerifier(client_id=CLIENT_ID, key_set=GoogleKeySet(jwks_file=jwks_file))
+
+        with mock.patch.object(google, '_verifier', verifier):
+            for created in (True, False):
+                response = await self.async_client.post(
+                    '/api/usermanagement/auth/google/',
+                    {'id_token': self.key.sign(sub='async-sub', email='new@example.com')},
+                    content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['is_new_user'], created)
+                self.assertEqual(response.json()['user']['email'], 'new@example.com')
+
+            response = await self.async_client.post(
+                '/api/usermanagement/auth/google/',
+                {'id_token': self.key.sign(aud='someone-else')},
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'id_token': ['Invalid ID token']})
+
+    async def test_profile_get_serves_profile_document(self):
+        response = await self.async_client.get('/api/usermanagement/profile/', headers=self.auth())
+        self.assertEqual(response.status_code, 200)
+        document = await ProfileDocument.objects.aget(user_id=self.user.pk)
+        self.assertEqual(response.content, render_with_document({'success': True, 'user': None}, document.document.encode()))
+
+        response = await self.async_client.get(
+            '/api/usermanagement/profile/', headers={**self.auth(), 'If-None-Match': response['ETag']},
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get('/api/usermanagement/profile/', {'fields': 'id,username'}, headers=self.auth())
+        self.assertEqual(response.json()['user'], {'id': self.user.pk, 'username': 'async'})
+
+        response = await self.async_client.get('/api/usermanagement/profile/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_profile_put(self):
+        response = await self.async_client.get('/api/usermanagement/profile/', headers=self.auth())
+        etag = response['ETag']
+
+        response = await self.async_client.put(
+            '/api/usermanagement/profile/', {'first_name': 'Ada'},
+            content_type='application/json', headers={**self.auth(), 'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['first_name'], 'Ada')
+
+        response = await self.async_client.put(
+            '/api/usermanagement/profile/', {'first_name': 'Grace'},
+            content_type='application/json', headers={**self.auth(), 'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 412)
+
+
+class ChangeFeedTests(TestCase):
+    """
+    The feed returns the latest change per object after a cursor, holds
+    back young entries where commits can land out of order, and compacts
+    superseded entries
+    """
+
+    def setUp(self):
+        self.admin = self.change(lambda: User.objects.create_superuser(username='root', email='root@example.com'))
+        # Logging in saves last_login, which is logged too
+        self.change(lambda: self.client.force_login(self.admin))
+        self.cursor = changefeed.encode_cursor(ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0)
+
+    def change(self, function):
+        with self.captureOnCommitCallbacks(execute=True):
+            return function()
+
+    def read(self, cursor=None, limit=500):
+        return changefeed.read_changes(cursor or self.cursor, limit=limit)
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(changefeed.decode_cursor(changefeed.encode_cursor(42)), 42)
+        self.assertEqual(changefeed.decode_cursor(None), 0)
+        for cursor in ('not-a-cursor', changefeed.encode_cursor(1)[:-2] + '!!', 'eDox'):
+            with self.assertRaises(changefeed.InvalidCursor):
+                changefeed.decode_cursor(cursor)
+
+    def test_polling_with_cursor(self):
+        user = self.change(lambda: User.objects.create_user(username='feed'))
+        changes, cursor, has_more = self.read()
+        self.assertEqual([(change['object_type'], change['object_id'], change['action']) for change in changes],
+                         [('user', user.pk, 'upsert')])
+        self.assertEqual(changes[0]['data']['username'], 'feed')
+        self.assertFalse(has_more)
+
+        self.assertEqual(self.read(cursor), ([], cursor, False))
+
+        self.change(lambda: StudentProfile.objects.create(user=user, student_id='STU600'))
+        changes, _, _ = self.read(cursor)
+        self.assertEqual([change['object_type'] for change in changes], ['student_profile'])
+        self.assertEqual(changes[0]['user_id'], user.pk)
+
+    def test_changes_collapse_to_latest(self):
+        user = self.change(lambda: User.objects.create_user(username='feed'))
+        for name in ('a', 'b', 'c'):
+            user.first_name = name
+            self.change(user.save)
+        other = self.change(lambda: User.objects.create_user(username='gone'))
+        other_pk = other.pk
+        self.change(other.delete)
+
+        changes, cursor, _ = self.read()
+        self.assertEqual(
+            [(change['object_id'], change['action']) for change in changes],
+            [(user.pk, 'upsert'), (other_pk, 'delete')],
+        )
+        self.assertEqual(changes[0]['data']['first_name'], 'c')
+        self.assertIsNone(changes[1]['data'])
+
+        # A full page says so; the rest follows from its cursor
+        first, cursor, has_more = self.read(limit=3)
+        self.assertTrue(has_more)
+        self.assertEqual([change['object_id'] for change in first], [user.pk])
+        rest, _, has_more = self.read(cursor)
+        self.assertEqual([change['action'] for change in rest], ['upsert', 'delete'])
+        self.assertFalse(has_more)
+
+    def test_commit_lag_on_concurrent_backends(self):
+        self.change(lambda: User.objects.create_user(username='young'))
+        with mock.patch.object(changefeed.connection, 'vendor', 'postgresql'):
+            self.assertEqual(self.read()[0], [])
+            ChangeLogEntry.objects.update(changed_at=timezone.now() - datetime.timedelta(seconds=6))
+            self.assertEqual(len(self.read()[0]), 1)
+            with override_settings(CHANGE_FEED_COMMIT_LAG=60):
+                self.assertEqual(self.read()[0], [])
+
+    def test_compact(self):
+        ChangeLogEntry.objects.all().delete()
+        user = self.change(lambda: User.objects.create_user(username='feed'))
+        user.first_name = 'x'
+        self.change(user.save)
+        other = self.change(lambda: User.objects.create_user(username='gone'))
+        other_pk = other.pk
+        self.change(other.delete)
+        ChangeLogEntry.objects.update(changed_at=timezone.now() - datetime.timedelta(days=40))
+
+        # Superseded entries go; the latest per object stays until
+        # tombstones pass their own retention
+        self.assertEqual(changefeed.compact(), 2)
+        self.assertEqual(
+            list(ChangeLogEntry.objects.order_by('id').values_list('object_id', 'action')),
+            [(user.pk, 'upsert'), (other_pk, 'delete')],
+        )
+        self.assertEqual(changefeed.compact(tombstones_older_than=datetime.timedelta(days=30)), 1)
+        self.assertFalse(ChangeLogEntry.objects.filter(action='delete').exists())
+
+        # Recent history is kept whole, even when superseded
+        for name in ('y', 'z'):
+            user.first_name = name
+            self.change(user.save)
+        self.assertEqual(changefeed.compact(), 1)
+        self.assertEqual(ChangeLogEntry.objects.filter(object_id=user.pk).count(), 2)
+
+    def test_invalid_cursors_are_bad_requests(self):
+        response = self.client.get('/api/usermanagement/changes/', {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/usermanagement/users/', {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsetTests(TestCase):
+    """
+    `?fields=`/`?include=` narrow responses, reject unknown names and give
+    each narrowed representation its own ETag
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        get_tiered_cache().l1.clear()
+        self.user = User.objects.create_user(username='sparse', first_name='Ada')
+        StudentProfile.objects.create(user=self.user, student_id='STU800')
+        self.client.force_login(self.user)
+
+    def get_profile(self, **params):
+        return self.client.get('/api/usermanagement/profile/', params)
+
+    def test_fields_and_include(self):
+        response = self.get_profile(fields='id,username', include='student_profile')
+        self.assertEqual(set(response.json()['user']), {'id', 'username', 'student_profile'})
+
+        # include alone is checked, and the full profile already has its fields
+        response = self.get_profile(include='student_profile')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['user']), set(UserProfileSerializer.Meta.fields))
+
+    def test_unknown_fields_are_rejected(self):
+        for params in ({'fields': 'id,bogus'}, {'include': 'bogus'}, {'fields': 'id', 'include': 'password'}):
+            response = self.get_profile(**params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.json()['errors']['fields'], [params.get('include') or 'bogus'])
+
+        # Public profiles do not have contact details
+        responses = [
+            self.client.get('/api/usermanagement/users/', {'include': 'email'}),
+            self.client.get('/api/usermanagement/users/search/', {'q': 'sparse', 'fields': 'id,email'}),
+            self.client.post(
+                '/api/usermanagement/users/batch/?fields=id,email',
+                {'usernames': ['sparse']},
+                content_type='application/json',
+            ),
+        ]
+        for response in responses:
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['errors']['fields'], ['email'])
+
+    def test_each_field_set_has_its_own_etag(self):
+        full = self.get_profile()['ETag']
+        narrow = self.get_profile(fields='id,username')['ETag']
+        self.assertNotEqual(full, narrow)
+        # The same set in another order or spelling is the same representation
+        self.assertEqual(self.get_profile(fields='username, id,id')['ETag'], narrow)
+        self.assertNotEqual(self.get_profile(fields='id,username', include='student_profile')['ETag'], narrow)
+
+        response = self.client.get('/api/usermanagement/profile/', {'fields': 'username,id'}, HTTP_IF_NONE_MATCH=narrow)
+        self.assertEqual(response.status_code, 304)
+        # A narrowed ETag does not validate the full profile
+        response = self.client.get('/api/usermanagement/profile/', HTTP_IF_NONE_MATCH=narrow)
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    The directory pages through a strict (created_at, id) order: no row is
+    repeated or skipped, ties included, and rows added meanwhile do not
+    shift later pages
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        base = timezone.now() - datetime.timedelta(days=1)
+        self.users = []
+        for number in range(7):
+            user = User.objects.create_user(username=f'page{number}', user_type='teacher' if number % 2 else 'student')
+            # Three users share one timestamp; the id breaks the tie
+            User.objects.filter(pk=user.pk).update(created_at=base + datetime.timedelta(minutes=min(number, 4)))
+            self.users.append(user)
+        User.objects.create_user(username='inactive', is_active=False)
+        self.viewer = User.objects.create_user(username='viewer')
+        User.objects.filter(pk=self.viewer.pk).update(created_at=base - datetime.timedelta(days=1))
+        self.client.force_login(self.viewer)
+
+    def walk(self, **params):
+        pages = []
+        response = self.client.get('/api/usermanagement/users/', {'page_size': 2, **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            pages.append([user['username'] for user in body['results']])
+            if body['next'] is None:
+                return pages
+            response = self.client.get(body['next'])
+
+    def test_pages_cover_every_row_once(self):
+        pages = self.walk()
+        self.assertTrue(all(len(page) <= 2 for page in pages))
+        self.assertEqual(
+            [username for page in pages for username in page],
+            ['page6', 'page5', 'page4', 'page3', 'page2', 'page1', 'page0', 'viewer'],
+        )
+
+    def test_filters_apply_to_every_page(self):
+        pages = self.walk(user_type='teacher')
+        self.assertEqual(pages, [['page5', 'page3'], ['page1']])
+
+    def test_new_rows_do_not_shift_pages(self):
+        first = self.client.get('/api/usermanagement/users/', {'page_size': 3}).json()
+        User.objects.create_user(username='newest')
+        second = self.client.get(first['next']).json()
+        self.assertEqual([user['username'] for user in second['results']], ['page3', 'page2', 'page1'])
+
+    def test_deep_pages_cost_the_same(self):
+        response = self.client.get('/api/usermanagement/users/', {'page_size': 1})
+        for _ in range(5):
+            # Session, session user, then one range scan without OFFSET
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(response.json()['next'])
+            self.assertEqual(len(queries), 3)
+            self.assertNotIn('OFFSET', queries[-1]['sql'])
+
+    def test_cursor_and_page_size(self):
+        paginator = KeysetPagination()
+        user = User.objects.get(username='page4')
+        self.assertEqual(paginator.decode_cursor(paginator.encode_cursor(user)), (user.created_at, user.pk))
+        response = self.client.get('/api/usermanagement/users/', {'page_size': 1000})
+        self.assertEqual(len(response.json()['results']), 8)
+        self.assertEqual(KeysetPagination.max_page_size, 200)
+
+
+class AdminChangelistTests(TestCase):
+    """
+    Profile changelists load their users in the same query, and counts and
+    date facet counts are cached for ADMIN_COUNT_CACHE_TTL
+    """
+
+    url = '/admin/usermanagement/studentprofile/'
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client.force_login(User.objects.create_superuser(username='root', email='root@example.com'))
+        self.add_profiles(2)
+
+    def add_profiles(self, count):
+        start = StudentProfile.objects.count()
+        for number in range(start, start + count):
+            user = User.objects.create_user(username=f'student{number}')
+            StudentProfile.objects.create(user=user, student_id=f'STU9{number:02}', grade=str(number % 2))
+
+    def load(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_rows_cost_no_queries(self):
+        _, few = self.load()
+        self.add_profiles(8)
+        caches['default'].clear()
+        response, many = self.load()
+        self.assertEqual(len(many), len(few))
+        self.assertContains(response, 'student9 - STU909')
+
+    def test_count_is_cached(self):
+        _, first = self.load()
+        self.assertTrue(any('COUNT(' in sql for sql in first))
+        _, second = self.load()
+        self.assertFalse(any('COUNT(' in sql for sql in second))
+
+    def test_date_facets_are_cached(self):
+        _, first = self.load(_facets='1')
+        facet_queries = [sql for sql in first if 'enrollment_date' in sql and 'COUNT(' in sql]
+        self.assertEqual(len(facet_queries), 1)
+        _, second = self.load(_facets='1')
+        self.assertFalse([sql for sql in second if 'enrollment_date' in sql and 'COUNT(' in sql])
+
+    def test_paginator(self):
+        queryset = StudentProfile.objects.order_by('pk')
+        self.assertEqual(CachedCountPaginator(queryset, 10).count, 2)
+        self.add_profiles(1)
+        # Stale for up to the TTL; each filter is counted on its own
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedCountPaginator(queryset, 10).count, 2)
+        self.assertEqual(CachedCountPaginator(queryset.filter(grade='0'), 10).count, 2)
+
+        with override_settings(ADMIN_COUNT_CACHE_TTL=0):
+            self.assertEqual(CachedCountPaginator(queryset.filter(grade='1'), 10).count, 1)
+            self.add_profiles(1)
+            self.assertEqual(CachedCountPaginator(queryset.filter(grade='1'), 10).count, 2)
+
+        # A filter that can match nothing is not run at all
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedCountPaginator(queryset.filter(pk__in=[]), 10).count, 0)
+
+
+class ExportTests(TestCase):
+    """
+    Users stream out with their profiles joined in, optionally only those
+    changed since a timestamp
+    """
+
+    url = '/api/usermanagement/users/export/'
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='root', email='root@example.com')
+        self.student = User.objects.create_user(username='student', first_name='Sé, "quoted"')
+        StudentProfile.objects.create(user=self.student, student_id='STU950', grade='10')
+        self.teacher = User.objects.create_user(username='teacher', user_type='teacher')
+        TeacherProfile.objects.create(user=self.teacher, employee_id='EMP950', department='Math')
+        self.client.force_login(self.admin)
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="users.csv"')
+
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([row['username'] for row in rows], ['root', 'student', 'teacher'])
+        self.assertEqual(list(rows[0]), [name for name, _ in EXPORT_COLUMNS])
+        self.assertEqual((rows[1]['first_name'], rows[1]['student_id'], rows[1]['employee_id']), ('Sé, "quoted"', 'STU950', ''))
+        self.assertEqual((rows[2]['employee_id'], rows[2]['department']), ('EMP950', 'Math'))
+
+    def test_jsonl(self):
+        response, body = self.export(output='jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(rows[1]['grade'], '10')
+        self.assertIsNone(rows[1]['department'])
+        self.assertEqual(rows[2]['id'], self.teacher.pk)
+
+    def test_since_covers_user_and_profile_changes(self):
+        old = timezone.now() - datetime.timedelta(days=10)
+        User.objects.update(updated_at=old)
+        StudentProfile.objects.update(updated_at=old)
+        TeacherProfile.objects.update(updated_at=old)
+        since = timezone.now() - datetime.timedelta(days=1)
+
+        _, body = self.export(output='jsonl', since=since.isoformat())
+        self.assertEqual(body, '')
+
+        # A profile change counts as a change to its user
+        StudentProfile.objects.update(updated_at=timezone.now())
+        User.objects.filter(pk=self.admin.pk).update(updated_at=timezone.now())
+        _, body = self.export(output='jsonl', since=since.isoformat())
+        self.assertEqual([json.loads(line)['username'] for line in body.splitlines()], ['root', 'student'])
+
+    def test_rejected_requests(self):
+        self.assertEqual(self.client.get(self.url, {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_rows_are_fetched_lazily_in_chunks(self):
+        with self.assertNumQueries(0):
+            rows = iter_export_rows(chunk_size=1)
+        with self.assertNumQueries(1):
+            self.assertEqual(next(rows)[1], 'root')
+        self.assertEqual([row[1] for row in rows], ['student', 'teacher'])
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.jsonl')
+            call_command('export_users', format='jsonl', output=path, chunk_size=1)
+            with open(path, encoding='utf-8') as fh:
+                self.assertEqual([json.loads(line)['username'] for line in fh], ['root', 'student', 'teacher'])
+
+        with self.assertRaises(CommandError):
+            call_command('export_users', since='yesterday')
+
+
+class ProfilePreconditionTests(TestCase):
+    """
+    The profile carries an ETag and Last-Modified; GET answers 304 from the
+    cached user alone and PUT refuses a stale If-Match
+    """
+
+    url = '/api/usermanagement/profile/'
+
+    def setUp(self):
+        caches['default'].clear()
+        get_tiered_cache().l1.clear()
+        self.user = User.objects.create_user(username='etag', first_name='Ada')
+        StudentProfile.objects.create(user=self.user, student_id='STU960')
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def get_profile(self, **headers):
+        return self.client.get(self.url, **self.headers, **headers)
+
+    def put_profile(self, data, **headers):
+        return self.client.put(self.url, data, content_type='application/json', **self.headers, **headers)
+
+    def test_not_modified(self):
+        # Tokens are only cached once the user's last change is a moment old
+        caches['default'].set(authentication._version_key(self.user.pk), authentication._new_version(0), None)
+        response = self.get_profile()
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        # The cached token user answers without a query
+        with self.assertNumQueries(0):
+            response = self.get_profile(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get_profile(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_profile_changes_change_the_etag(self):
+        etag = self.get_profile()['ETag']
+        profile = StudentProfile.objects.get(user=self.user)
+        profile.major = 'Physics'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+
+        response = self.get_profile(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['user']['student_profile']['major'], 'Physics')
+
+    def test_if_match(self):
+        etag = self.get_profile()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.put_profile({'first_name': 'Grace'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        new_etag = response['ETag']
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(self.get_profile()['ETag'], new_etag)
+
+        # A client still holding the old representation loses the race
+        response = self.put_profile({'first_name': 'Lost'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_name, 'Grace')
+
+        self.assertEqual(self.put_profile({'first_name': 'Any'}, HTTP_IF_MATCH='*').status_code, 200)
+        self.assertEqual(self.put_profile({'first_name': 'Blind'}).status_code, 200)
+
+
+class BatchProfileLookupTests(TestCase):
+    """
+    Many public profiles in one request and one query, within a lookup limit
+    """
+
+    url = '/api/usermanagement/users/batch/'
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(username='viewer')
+        self.users = []
+        for number in range(4):
+            user = User.objects.create_user(username=f'member{number}', email=f'member{number}@example.com',
+                                            user_type='teacher' if number % 2 else 'student')
+            if number % 2:
+                TeacherProfile.objects.create(user=user, employee_id=f'EMP97{number}', department='Math')
+            else:
+                StudentProfile.objects.create(user=user, student_id=f'STU97{number}', grade='9')
+            self.users.append(user)
+        self.client.force_login(self.viewer)
+
+    def lookup(self, data, url=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url or self.url, data, content_type='application/json')
+        return response, [query['sql'] for query in queries]
+
+    def test_profiles_in_one_query(self):
+        response, queries = self.lookup({'ids': [self.users[0].pk, self.users[1].pk], 'usernames': ['member0']})
+        self.assertEqual(response.status_code, 200)
+        results = {user['username']: user for user in response.json()['results']}
+        self.assertEqual(set(results), {'member0', 'member1'})
+        self.assertEqual(results['member0']['student_profile']['student_id'], 'STU970')
+        self.assertEqual(results['member1']['teacher_profile']['department'], 'Math')
+        # Public profiles leave out contact details
+        self.assertNotIn('email', results['member0'])
+
+        # Session, session user, then the lookup, however many users
+        _, more_queries = self.lookup({'usernames': [user.username for user in self.users]})
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(len(more_queries), 3)
+        self.assertIn('usermanagement_teacherprofile', more_queries[-1])
+
+    def test_missing_and_inactive(self):
+        User.objects.filter(pk=self.users[2].pk).update(is_active=False)
+        response, _ = self.lookup({'ids': [self.users[0].pk, self.users[2].pk, 999999], 'usernames': ['nobody', 'member3']})
+        body = response.json()
+        self.assertEqual(sorted(user['username'] for user in body['results']), ['member0', 'member3'])
+        self.assertEqual(body['missing'], {'ids': [self.users[2].pk, 999999], 'usernames': ['nobody']})
+
+    def test_narrow_fields_skip_profile_joins(self):
+        response, queries = self.lookup({'usernames': ['member0']}, url=f'{self.url}?fields=id,username')
+        self.assertEqual(response.json()['results'], [{'id': self.users[0].pk, 'username': 'member0'}])
+        self.assertNotIn('usermanagement_studentprofile', queries[-1])
+        self.assertNotIn('usermanagement_teacherprofile', queries[-1])
+
+    def test_limits(self):
+        for data in ({}, {'ids': []}, {'ids': ['x']}, {'ids': list(range(1, 300)), 'usernames': [f'u{n}' for n in range(202)]}):
+            response, _ = self.lookup(data)
+            self.assertEqual(response.status_code, 400, data)
+        response, _ = self.lookup({'ids': list(range(1, 501))})
+        self.assertEqual(response.status_code, 200)
+
+        self.client.logout()
+        response, _ = self.lookup({'ids': [1]})
+        self.assertEqual(response.status_code, 401)